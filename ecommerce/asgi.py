@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+# Con ASGI el catálogo y el carrito usan las vistas async (TIENDA_VISTAS_ASYNC=0 para no usarlas)
+os.environ.setdefault('TIENDA_VISTAS_ASYNC', '1')
 
 application = get_asgi_application()
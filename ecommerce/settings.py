@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 
+from tienda.sqlite import configuracion as configuracion_sqlite
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,7 +47,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tienda.middleware.MedicionConsultasMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Sirve STATIC_ROOT (comprimido y con caché de un año) antes de cargar sesión y usuario
+    'tienda.estaticos.EstaticosMiddleware',
+    # Sin TIENDA_REPLICAS no se usa
+    'tienda.replicas.ReplicasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,7 +61,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'ecommerce.urls'
+# Con TIENDA_VISTAS_ASYNC=1 (lo fija ecommerce/asgi.py) el catálogo y el
+# carrito JSON usan las vistas async de tienda.views_async
+ROOT_URLCONF = 'ecommerce.urls_async' if os.environ.get('TIENDA_VISTAS_ASYNC') == '1' else 'ecommerce.urls'
 
 TEMPLATES = [
     {
@@ -78,13 +87,27 @@ WSGI_APPLICATION = 'ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Perfil 'afinado' (tienda/sqlite): WAL, PRAGMA de rendimiento, busy_timeout,
+# BEGIN IMMEDIATE y conexiones persistentes; 'basico' es el SQLite de Django sin cambios
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': configuracion_sqlite(BASE_DIR / 'db.sqlite3', os.environ.get('TIENDA_SQLITE_PERFIL', 'afinado')),
 }
 
+# Réplicas de lectura para el catálogo y el historial de pedidos (tienda.replicas):
+# TIENDA_REPLICAS=ruta1.sqlite3,ruta2.sqlite3 agrega los alias replica1, replica2...
+# que mantiene al día `manage.py sincronizar_replicas`
+TIENDA_REPLICAS = []
+for numero, ruta in enumerate(filter(None, os.environ.get('TIENDA_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{numero}'] = {
+        **configuracion_sqlite(ruta.strip(), os.environ.get('TIENDA_SQLITE_PERFIL', 'afinado')),
+        # En los tests, la misma base que 'default'
+        'TEST': {'MIRROR': 'default'},
+    }
+    TIENDA_REPLICAS.append(f'replica{numero}')
+DATABASE_ROUTERS = ['tienda.replicas.RouterReplicas']
+# Segundos que un visitante sigue leyendo de 'default' después de escribir: más que el intervalo de sincronización
+TIENDA_REPLICAS_RETRASO = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -126,10 +149,33 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# En producción collectstatic agrega el hash del contenido a cada nombre y
+# guarda versiones .gz y .br (tienda.estaticos); con DEBUG, runserver sirve
+# los archivos de las apps tal cual
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'tienda.estaticos.ManifestComprimido'
+        ),
+    },
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# tienda.medios sirve las imágenes subidas también sin DEBUG. Detrás de Nginx o
+# Apache conviene que las envíe el servidor web: TIENDA_MEDIOS_SENDFILE=X-Accel-Redirect
+# (con una location internal en TIENDA_MEDIOS_SENDFILE_PREFIJO) o X-Sendfile
+TIENDA_MEDIOS_SENDFILE = os.environ.get('TIENDA_MEDIOS_SENDFILE')
+TIENDA_MEDIOS_SENDFILE_PREFIJO = '/media-interno/'
+# Segundos que los navegadores y proxies guardan una imagen sin revalidarla
+TIENDA_MEDIOS_MAX_AGE = 60 * 60 * 24 * 30
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -142,3 +188,32 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Login URLs
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Medición de consultas SQL por vista (encabezados X-Consultas-SQL y Server-Timing)
+TIENDA_MEDIR_CONSULTAS = DEBUG
+
+# Hilos que generan las versiones reducidas de las imágenes (0 = en la misma petición)
+TIENDA_IMAGENES_HILOS = 2
+
+# Caché de páginas para anónimos y de objetos del catálogo, sin servicios
+# externos: en la memoria de cada proceso o, con TIENDA_CACHE_DIR, en archivos
+# compartidos por todos los procesos del servidor
+if os.environ.get('TIENDA_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['TIENDA_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tienda',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
+# Estado del cálculo de productos comprados juntos (calcular_relacionados)
+TIENDA_RELACIONADOS_ESTADO = BASE_DIR / 'relacionados.npz'
@@ -0,0 +1,16 @@
+"""
+Las rutas de ecommerce.urls con las vistas async del catálogo y del carrito
+(tienda.views_async). settings.ROOT_URLCONF apunta aquí con
+TIENDA_VISTAS_ASYNC=1, que fija ecommerce/asgi.py.
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+from tienda import medios, views_async
+from tienda.urls import patrones
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('', include(patrones(views_async))),
+    path('accounts/', include('django.contrib.auth.urls')),
+] + medios.patrones()
@@ -0,0 +1,52 @@
+// Funciones comunes a todas las páginas (antes en línea en base.html)
+
+// Función para formatear precios en CLP
+function formatearPrecio(precio) {
+    return new Intl.NumberFormat('es-CL', {
+        style: 'currency',
+        currency: 'CLP',
+        minimumFractionDigits: 0,
+        maximumFractionDigits: 0
+    }).format(precio).replace('CLP', '').trim() + ' CLP';
+}
+
+// Actualizar contador del carrito (la URL viene en data-url del contador).
+// La respuesta también trae el token CSRF y fija su cookie: las páginas del
+// catálogo salen de la caché y no la fijan
+function actualizarCarritoCount() {
+    return $.getJSON($('#carrito-count').data('url'), function(data) {
+        $('#carrito-count').text(data.carrito_cantidad);
+    });
+}
+
+function leerCookie(nombre) {
+    var prefijo = nombre + '=';
+    var cookies = document.cookie ? document.cookie.split(';') : [];
+    for (var i = 0; i < cookies.length; i++) {
+        var cookie = cookies[i].trim();
+        if (cookie.substring(0, prefijo.length) === prefijo) {
+            return decodeURIComponent(cookie.substring(prefijo.length));
+        }
+    }
+    return null;
+}
+
+// Promesa con el token CSRF para los POST por AJAX: el de la cookie o, si
+// todavía no la hay (primera visita), el que trae el resumen del carrito
+function obtenerTokenCsrf() {
+    var token = leerCookie('csrftoken');
+    if (token) {
+        return $.when(token);
+    }
+    return actualizarCarritoCount().then(function(data) {
+        return data.csrf_token;
+    });
+}
+
+// Actualizar cada 30 segundos
+setInterval(actualizarCarritoCount, 30000);
+
+// Actualizar al cargar la página
+$(document).ready(function() {
+    actualizarCarritoCount();
+});
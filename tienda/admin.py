@@ -1,6 +1,10 @@
 from django.contrib import admin
-from .models import Categoria, Producto, Carrito, ItemCarrito, Pedido, ItemPedido
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.template.response import TemplateResponse
+from .models import Categoria, Producto, Carrito, ItemCarrito, Pedido, ItemPedido, VentaCategoriaDia
 from django.utils.html import format_html
+from . import ventas
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -24,14 +28,20 @@ admin.site.register(Producto, ProductoAdmin)
 
 @admin.register(Carrito)
 class CarritoAdmin(admin.ModelAdmin):
-    list_display = ['usuario', 'fecha_creacion', 'fecha_actualizacion']
+    list_display = ['usuario', 'total_items', 'monto_total', 'fecha_creacion', 'fecha_actualizacion']
     search_fields = ['usuario__username']
+    readonly_fields = ['monto_total', 'total_items']
 
 @admin.register(ItemCarrito)
 class ItemCarritoAdmin(admin.ModelAdmin):
     list_display = ['carrito', 'producto', 'cantidad', 'fecha_agregado']
     search_fields = ['producto__nombre', 'carrito__usuario__username']
 
+    def delete_queryset(self, request, queryset):
+        # Eliminar uno a uno para mantener los totales del carrito
+        for item in queryset.select_related('producto'):
+            item.delete()
+
 @admin.register(Pedido)
 class PedidoAdmin(admin.ModelAdmin):
     list_display = ['id', 'usuario', 'fecha_pedido', 'estado', 'total']
@@ -40,5 +50,58 @@ class PedidoAdmin(admin.ModelAdmin):
 
 @admin.register(ItemPedido)
 class ItemPedidoAdmin(admin.ModelAdmin):
+    """
+    Líneas de pedido de solo lectura: las crea el checkout, y editarlas
+    desarmaría el total del pedido y las ventas acumuladas (tienda.ventas).
+    Se pueden borrar (también al borrar su pedido), descontándolas de las ventas.
+    """
     list_display = ['pedido', 'producto', 'cantidad', 'precio_unitario', 'subtotal']
     search_fields = ['producto__nombre', 'pedido__usuario__username']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            ventas.registrar_items([obj], signo=-1)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            ventas.registrar_items(queryset.select_related('pedido', 'producto'), signo=-1)
+            super().delete_queryset(request, queryset)
+
+@admin.register(VentaCategoriaDia)
+class VentasAdmin(admin.ModelAdmin):
+    """Tablero de ventas: gráficos de las ventas acumuladas (tienda.ventas) en vez del listado de filas"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            dias = int(request.GET.get('dias', 30))
+        except ValueError:
+            dias = 30
+        if dias not in ventas.PERIODOS:
+            dias = 30
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Ventas',
+            'opts': self.model._meta,
+            'periodos': ventas.PERIODOS,
+            **ventas.tablero(dias),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/tienda/ventas.html', context)
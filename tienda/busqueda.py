@@ -0,0 +1,178 @@
+"""
+Búsqueda de productos con índice de texto completo.
+
+El índice vive en una tabla auxiliar (`tienda_producto_busqueda`) con una fila
+por producto:
+
+- SQLite: tabla virtual FTS5, con el id del producto como rowid y ranking bm25.
+- PostgreSQL: columna tsvector con índice GIN y ranking ts_rank_cd.
+
+En cualquier otro motor se usa la búsqueda con icontains de siempre. El texto
+se indexa y se consulta normalizado (minúsculas y sin tildes, á→a, ñ→n), así
+"cafe" encuentra "Café" y "senal" encuentra "Señal". Las señales de
+`tienda.signals` mantienen el índice al día al guardar productos y categorías.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+TABLA = 'tienda_producto_busqueda'
+
+# Pesos de las columnas nombre, descripción y categoría en el ranking
+PESOS_BM25 = (10.0, 1.0, 4.0)
+
+_PALABRA = re.compile(r'\w+')
+
+
+def normalizar(texto):
+    """Pasa el texto a minúsculas y le quita las tildes (á→a, ñ→n)"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos(busqueda):
+    """Palabras normalizadas de una búsqueda"""
+    return _PALABRA.findall(normalizar(busqueda))
+
+
+def disponible():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def crear_indice(schema_editor):
+    """Crea la tabla del índice según el motor (usado por la migración)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+            "nombre, descripcion, categoria, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLA} ("
+            "producto_id bigint PRIMARY KEY REFERENCES tienda_producto (id) ON DELETE CASCADE, "
+            "documento tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABLA}_documento_idx ON {TABLA} USING GIN (documento)"
+        )
+
+
+def eliminar_indice(schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLA}")
+
+
+def _filas(productos):
+    for producto_id, nombre, descripcion, categoria in productos:
+        yield producto_id, normalizar(nombre), normalizar(descripcion), normalizar(categoria)
+
+
+def indexar(productos):
+    """
+    Indexa (o reindexa) productos.
+
+    `productos` es un queryset de Producto o un iterable de tuplas
+    (id, nombre, descripcion, nombre_categoria).
+    """
+    if not disponible():
+        return 0
+    if hasattr(productos, 'values_list'):
+        productos = productos.values_list('id', 'nombre', 'descripcion', 'categoria__nombre').iterator(chunk_size=2000)
+
+    total = 0
+    lote = []
+    for fila in _filas(productos):
+        lote.append(fila)
+        if len(lote) >= 2000:
+            total += _escribir(lote)
+            lote = []
+    if lote:
+        total += _escribir(lote)
+    return total
+
+
+def _escribir(filas):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # FTS5 no tiene UPSERT: se borra y se vuelve a insertar
+            cursor.executemany(f"DELETE FROM {TABLA} WHERE rowid = %s", [(fila[0],) for fila in filas])
+            cursor.executemany(
+                f"INSERT INTO {TABLA} (rowid, nombre, descripcion, categoria) VALUES (%s, %s, %s, %s)",
+                filas,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {TABLA} (producto_id, documento) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'B')) "
+                "ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento",
+                filas,
+            )
+    return len(filas)
+
+
+def desindexar(producto_ids):
+    if not disponible():
+        return
+    columna = 'rowid' if connection.vendor == 'sqlite' else 'producto_id'
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLA} WHERE {columna} = %s", [(i,) for i in producto_ids])
+
+
+def reconstruir():
+    """Vacía el índice y vuelve a indexar todos los productos"""
+    from .models import Producto
+
+    if not disponible():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA}")
+    return indexar(Producto.objects.all())
+
+
+def buscar(productos, busqueda):
+    """
+    Filtra el queryset de productos por la búsqueda y le agrega la anotación
+    `relevancia` (menor es mejor) para ordenar con order_by('relevancia').
+    """
+    palabras = terminos(busqueda)
+    if not palabras:
+        return productos.extra(select={'relevancia': '0'}).none()
+
+    if connection.vendor == 'sqlite':
+        # Cada palabra como prefijo: "smart" encuentra "smartphone"
+        consulta = ' '.join(f'"{palabra}"*' for palabra in palabras)
+        pesos = ', '.join(str(peso) for peso in PESOS_BM25)
+        return productos.extra(
+            select={'relevancia': f'bm25({TABLA}, {pesos})'},
+            tables=[TABLA],
+            where=[f'{TABLA}.rowid = tienda_producto.id', f'{TABLA} MATCH %s'],
+            params=[consulta],
+        )
+
+    if connection.vendor == 'postgresql':
+        consulta = ' & '.join(f'{palabra}:*' for palabra in palabras)
+        return productos.extra(
+            select={'relevancia': f"-ts_rank_cd({TABLA}.documento, to_tsquery('simple', %s))"},
+            select_params=[consulta],
+            tables=[TABLA],
+            where=[
+                f'{TABLA}.producto_id = tienda_producto.id',
+                f"{TABLA}.documento @@ to_tsquery('simple', %s)",
+            ],
+            params=[consulta],
+        )
+
+    filtro = Q()
+    for palabra in busqueda.split():
+        filtro &= (
+            Q(nombre__icontains=palabra) |
+            Q(descripcion__icontains=palabra) |
+            Q(categoria__nombre__icontains=palabra)
+        )
+    return productos.filter(filtro).extra(select={'relevancia': '0'})
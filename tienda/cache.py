@@ -0,0 +1,262 @@
+"""
+Caché de páginas para visitantes anónimos.
+
+Cada página cacheada depende de una o más etiquetas ('catalogo',
+'producto:<id>', 'categoria:<id>') y la clave incluye la versión actual de
+cada una. Para invalidar no se borran claves: `invalidar()` incrementa la
+versión de las etiquetas y las entradas viejas dejan de encontrarse (y
+expiran solas). Las señales de `tienda.signals` invalidan al guardar o
+eliminar productos y categorías, incluidas las ediciones desde el admin.
+Con réplicas de lectura (`tienda.replicas`) cada invalidación se anota
+para repetirla cuando las réplicas reciben el cambio.
+
+Con vistas async se usa la misma API síncrona de la caché: en Django 4.2 la
+async solo pasa cada operación a otro hilo (aget_many, una por clave), y con
+los backends de la tienda (memoria o archivos locales) el salto cuesta más
+que la operación.
+"""
+import asyncio
+import hashlib
+import inspect
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.http import HttpResponse
+
+# Parámetros GET que cambian el contenido de las páginas del catálogo
+PARAMETROS_PAGINA = ('categoria', 'q', 'orden', 'page', 'paginacion', 'cursor')
+
+PAGINA_TIMEOUT = 60 * 15
+
+CLAVE_ACIERTOS = 'tienda:pagina:aciertos'
+CLAVE_FALLOS = 'tienda:pagina:fallos'
+
+# Invalidaciones anotadas para repetirlas después de sincronizar las réplicas
+CLAVE_INVALIDACIONES = 'tienda:replicas:invalidaciones'
+CLAVE_REPETIDAS = 'tienda:replicas:repetidas'
+INVALIDACIONES_TIMEOUT = 60 * 60 * 24
+
+
+def _clave_version(etiqueta):
+    return f'tienda:version:{etiqueta}'
+
+
+def versiones(etiquetas):
+    """Versión actual de cada etiqueta, inicializando las que no existan"""
+    claves = {_clave_version(etiqueta): etiqueta for etiqueta in etiquetas}
+    encontradas = cache.get_many(claves)
+    faltantes = {clave: time.time_ns() for clave in claves if clave not in encontradas}
+    if faltantes:
+        for clave, version in faltantes.items():
+            # add() no pisa una versión que otro proceso haya creado entretanto
+            if not cache.add(clave, version, None):
+                faltantes[clave] = cache.get(clave, version)
+        encontradas.update(faltantes)
+    return [encontradas[_clave_version(etiqueta)] for etiqueta in etiquetas]
+
+
+def invalidar(*etiquetas):
+    """Incrementa la versión de las etiquetas; las páginas que dependen de ellas se regeneran"""
+    _incrementar(etiquetas)
+    if getattr(settings, 'TIENDA_REPLICAS', None):
+        # Hasta que las réplicas tengan el cambio, las páginas pueden volver a
+        # generarse con los datos viejos: se invalidan otra vez al sincronizarlas
+        _anotar(etiquetas)
+
+
+def _incrementar(etiquetas):
+    for etiqueta in etiquetas:
+        clave = _clave_version(etiqueta)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            # Sin versión previa: una nueva basada en el reloj no repite ninguna anterior
+            cache.set(clave, time.time_ns(), None)
+
+
+def _anotar(etiquetas):
+    if cache.add(CLAVE_INVALIDACIONES, 1, None):
+        numero = 1
+    else:
+        try:
+            numero = cache.incr(CLAVE_INVALIDACIONES)
+        except ValueError:
+            numero = 1
+            cache.set(CLAVE_INVALIDACIONES, numero, None)
+    cache.set(f'{CLAVE_INVALIDACIONES}:{numero}', list(etiquetas), INVALIDACIONES_TIMEOUT)
+
+
+def ultima_invalidacion():
+    """Número de la última invalidación anotada para las réplicas"""
+    return cache.get(CLAVE_INVALIDACIONES, 0)
+
+
+def repetir_invalidaciones(hasta):
+    """Vuelve a invalidar las etiquetas anotadas desde la última repetición hasta `hasta` (tienda.replicas)"""
+    desde = cache.get(CLAVE_REPETIDAS, 0)
+    if desde > hasta:
+        # El contador volvió a empezar (la caché se vació)
+        desde = 0
+    anotadas = cache.get_many([f'{CLAVE_INVALIDACIONES}:{numero}' for numero in range(desde + 1, hasta + 1)])
+    _incrementar({etiqueta for etiquetas in anotadas.values() for etiqueta in etiquetas})
+    cache.set(CLAVE_REPETIDAS, hasta, None)
+
+
+def invalidar_productos(producto_ids):
+    invalidar(*[f'producto:{producto_id}' for producto_id in producto_ids])
+
+
+def categoria_de_producto(producto_id):
+    """Id de la categoría del producto (para las etiquetas de su página de detalle)"""
+    from .models import Producto
+
+    clave = f'tienda:producto:{producto_id}:categoria'
+    categoria_id = cache.get(clave)
+    if categoria_id is None:
+        categoria_id = Producto.objects.filter(id=producto_id).values_list('categoria_id', flat=True).first()
+        if categoria_id is not None:
+            cache.set(clave, categoria_id, None)
+    return categoria_id
+
+
+async def acategoria_de_producto(producto_id):
+    from .models import Producto
+
+    clave = f'tienda:producto:{producto_id}:categoria'
+    categoria_id = cache.get(clave)
+    if categoria_id is None:
+        categoria_id = await Producto.objects.filter(id=producto_id).values_list('categoria_id', flat=True).afirst()
+        if categoria_id is not None:
+            cache.set(clave, categoria_id, None)
+    return categoria_id
+
+
+def olvidar_categoria_de_producto(producto_id):
+    cache.delete(f'tienda:producto:{producto_id}:categoria')
+
+
+def _registrar(clave):
+    if not cache.add(clave, 1, None):
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, 1, None)
+
+
+def estadisticas():
+    datos = cache.get_many([CLAVE_ACIERTOS, CLAVE_FALLOS])
+    aciertos = datos.get(CLAVE_ACIERTOS, 0)
+    fallos = datos.get(CLAVE_FALLOS, 0)
+    total = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'tasa_aciertos': aciertos / total if total else 0.0,
+    }
+
+
+def reiniciar_estadisticas():
+    cache.delete_many([CLAVE_ACIERTOS, CLAVE_FALLOS])
+
+
+def _firma(request):
+    parametros = sorted(
+        (nombre, request.GET.get(nombre, '').strip())
+        for nombre in PARAMETROS_PAGINA
+        if request.GET.get(nombre, '').strip()
+    )
+    return hashlib.md5(repr((request.path, parametros)).encode()).hexdigest()
+
+
+def version_estaticos():
+    """
+    Cambia con cada collectstatic (ver tienda.estaticos): las páginas enlazan
+    los estáticos por su nombre con hash
+    """
+    return getattr(staticfiles_storage, 'manifest_hash', '')
+
+
+def clave_pagina(request, etiquetas):
+    version = '.'.join(str(v) for v in versiones(etiquetas))
+    return f'tienda:pagina:{_firma(request)}:{version}:{version_estaticos()}'
+
+
+def _cacheable(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # Los mensajes pendientes son de un visitante en particular
+    return not len(messages.get_messages(request))
+
+
+def _guardable(request, respuesta):
+    return (
+        respuesta.status_code == 200
+        and not respuesta.streaming
+        and not respuesta.cookies
+        # La página incluye un token CSRF propio de este visitante
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def cache_pagina_anonima(etiquetas):
+    """
+    Cachea la respuesta de la vista para visitantes anónimos.
+
+    `etiquetas(request, *args, **kwargs)` retorna las etiquetas de las que
+    depende la página. Los usuarios autenticados, los mensajes pendientes y
+    las respuestas que no sean 200 o que fijen cookies no pasan por la caché.
+    Con vistas async, `etiquetas` también puede ser una corrutina.
+    """
+    def decorador(vista):
+        if asyncio.iscoroutinefunction(vista):
+            return _cache_pagina_async(vista, etiquetas)
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if not _cacheable(request):
+                return vista(request, *args, **kwargs)
+
+            clave = clave_pagina(request, etiquetas(request, *args, **kwargs))
+            guardada = cache.get(clave)
+            if guardada is not None:
+                _registrar(CLAVE_ACIERTOS)
+                contenido, tipo = guardada
+                return HttpResponse(contenido, content_type=tipo)
+
+            _registrar(CLAVE_FALLOS)
+            respuesta = vista(request, *args, **kwargs)
+            if _guardable(request, respuesta):
+                cache.set(clave, (respuesta.content, respuesta['Content-Type']), PAGINA_TIMEOUT)
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def _cache_pagina_async(vista, etiquetas):
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        # request.user y los mensajes se leen de la sesión, que en Django 4.2 es síncrona
+        if not await sync_to_async(_cacheable)(request):
+            return await vista(request, *args, **kwargs)
+
+        dependencias = etiquetas(request, *args, **kwargs)
+        if inspect.isawaitable(dependencias):
+            dependencias = await dependencias
+        clave = clave_pagina(request, dependencias)
+        guardada = cache.get(clave)
+        if guardada is not None:
+            _registrar(CLAVE_ACIERTOS)
+            contenido, tipo = guardada
+            return HttpResponse(contenido, content_type=tipo)
+
+        _registrar(CLAVE_FALLOS)
+        respuesta = await vista(request, *args, **kwargs)
+        if _guardable(request, respuesta):
+            cache.set(clave, (respuesta.content, respuesta['Content-Type']), PAGINA_TIMEOUT)
+        return respuesta
+    return envoltura
@@ -0,0 +1,164 @@
+"""
+Carrito de los visitantes anónimos, guardado en la sesión.
+
+Solo se guarda {id de producto: cantidad} y el total desnormalizado (como
+`Carrito.monto_total`), así el contador del navbar no consulta la base de
+datos y mirar el catálogo o agregar productos no escribe en las tablas de
+la tienda. Expone lo mismo que usan las vistas y plantillas de `Carrito`
+(`items`, `total`, `total_formateado`, `cantidad_items`); el id de cada item
+es el del producto. Al iniciar sesión, `fusionar()` pasa los items al
+`Carrito` del usuario (ver `tienda.signals`).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Carrito, ItemCarrito, Producto
+
+CLAVE_SESION = 'carrito'
+
+
+class ItemSesion:
+    def __init__(self, producto, cantidad):
+        self.id = producto.id
+        self.producto = producto
+        self.cantidad = cantidad
+
+    @property
+    def subtotal(self):
+        return self.producto.precio * self.cantidad
+
+    @property
+    def subtotal_formateado(self):
+        """Retorna el subtotal formateado con puntos de miles"""
+        return f"{int(self.subtotal):,}".replace(",", ".")
+
+
+class CarritoSesion:
+    def __init__(self, session):
+        self.session = session
+        datos = session.get(CLAVE_SESION) or {}
+        self.cantidades = {int(producto_id): cantidad for producto_id, cantidad in datos.get('items', {}).items()}
+        self.monto_total = Decimal(datos.get('total', '0'))
+        self._items = None
+
+    @property
+    def items(self):
+        """Items con sus productos, en el orden en que se agregaron (una consulta)"""
+        if self._items is None:
+            self._armar_items(self._productos())
+        return self._items
+
+    async def acargar(self):
+        """Lee los items con el ORM async; después `items` ya no consulta"""
+        if self._items is None:
+            self._armar_items([producto async for producto in self._productos()])
+        return self._items
+
+    def _productos(self):
+        return Producto.objects.filter(id__in=self.cantidades, activo=True).select_related('categoria')
+
+    def _armar_items(self, productos):
+        productos = {producto.id: producto for producto in productos}
+        self._items = [
+            ItemSesion(productos[producto_id], cantidad)
+            for producto_id, cantidad in self.cantidades.items() if producto_id in productos
+        ]
+        # Quitar productos eliminados o desactivados y corregir el total si cambiaron los precios
+        if len(self._items) != len(self.cantidades) or self.monto_total != self._sumar():
+            self.cantidades = {item.id: item.cantidad for item in self._items}
+            self._guardar()
+
+    @property
+    def total(self):
+        return self.monto_total
+
+    @property
+    def total_formateado(self):
+        """Retorna el total formateado con puntos de miles"""
+        return f"{int(self.total):,}".replace(",", ".")
+
+    @property
+    def cantidad_items(self):
+        return sum(self.cantidades.values())
+
+    def item(self, producto_id):
+        """El item del producto, o None si no está en el carrito"""
+        return next((item for item in self.items if item.id == producto_id), None)
+
+    def agregar(self, producto, cantidad):
+        self.cantidades[producto.id] = self.cantidades.get(producto.id, 0) + cantidad
+        self._items = None
+        self.monto_total += producto.precio * cantidad
+        self._guardar()
+
+    def actualizar(self, item, cantidad):
+        """Cambia la cantidad de un item (de `items`); con 0 o menos lo elimina"""
+        if cantidad <= 0:
+            del self.cantidades[item.id]
+            self._items = [otro for otro in self.items if otro.id != item.id]
+        else:
+            self.cantidades[item.id] = item.cantidad = cantidad
+        self.monto_total = self._sumar()
+        self._guardar()
+
+    def reemplazar(self, cantidades, precios):
+        """Fija todas las cantidades de una vez ({id de producto: cantidad}, con los precios ya leídos)"""
+        self.cantidades = dict(cantidades)
+        self._items = None
+        self.monto_total = sum(
+            (precios[producto_id] * cantidad for producto_id, cantidad in self.cantidades.items()), Decimal('0'),
+        )
+        self._guardar()
+
+    def vaciar(self):
+        self.cantidades = {}
+        self._items = []
+        self.monto_total = Decimal('0')
+        self.session.pop(CLAVE_SESION, None)
+
+    def _sumar(self):
+        return sum((item.subtotal for item in self.items), Decimal('0'))
+
+    def _guardar(self):
+        if not self.cantidades:
+            self.vaciar()
+            return
+        self.session[CLAVE_SESION] = {
+            'items': {str(producto_id): cantidad for producto_id, cantidad in self.cantidades.items()},
+            'total': str(self.monto_total),
+        }
+
+
+def fusionar(session, usuario):
+    """
+    Pasa el carrito de la sesión al `Carrito` del usuario, sumando las
+    cantidades de los productos que ya tenía (hasta el stock disponible),
+    con una inserción y una actualización en bloque. Retorna el carrito o
+    None si la sesión no tenía productos.
+    """
+    cantidades = CarritoSesion(session).cantidades
+    if not cantidades:
+        return None
+
+    with transaction.atomic():
+        carrito = Carrito.objects.get_or_create(usuario=usuario)[0]
+        stock = dict(Producto.objects.filter(id__in=cantidades, activo=True).values_list('id', 'stock'))
+        existentes = {item.producto_id: item for item in carrito.items.filter(producto_id__in=stock)}
+        nuevos = []
+        for producto_id, cantidad in cantidades.items():
+            if producto_id not in stock:
+                continue
+            if producto_id in existentes:
+                item = existentes[producto_id]
+                item.cantidad = min(item.cantidad + cantidad, max(stock[producto_id], item.cantidad))
+            elif stock[producto_id] > 0:
+                nuevos.append(ItemCarrito(carrito=carrito, producto_id=producto_id,
+                                          cantidad=min(cantidad, stock[producto_id])))
+        ItemCarrito.objects.bulk_create(nuevos)
+        ItemCarrito.objects.bulk_update(existentes.values(), ['cantidad'])
+        # bulk_create y bulk_update no pasan por ItemCarrito.save
+        Carrito.recalcular_totales(Carrito.objects.filter(pk=carrito.pk))
+
+    session.pop(CLAVE_SESION, None)
+    return carrito
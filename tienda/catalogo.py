@@ -0,0 +1,211 @@
+"""
+Caché de lectura de los objetos del catálogo.
+
+Guarda cada producto (con su categoría), la lista de categorías activas y
+los ids de los destacados, los de cada categoría y los relacionados de cada
+producto. Las claves incluyen la versión de las etiquetas de `tienda.cache`
+de las que dependen, así que las señales que ya invalidan las páginas al
+guardar o eliminar también dejan obsoletas estas copias, sin borrar nada.
+`productos()` lee muchos productos con un solo get_many (más el de las
+versiones) y consulta solo los que falten.
+
+Funciona con cualquier backend de caché de Django, incluidos locmem y el
+basado en archivos, porque solo usa get_many, set_many, get_or_set e incr.
+Las funciones con prefijo `a` son las variantes para las vistas async: las
+consultas van con el ORM async y la caché se usa igual (ver `tienda.cache`).
+"""
+import asyncio
+
+from django.core.cache import cache
+
+from .cache import versiones
+from .models import Categoria, Producto, ProductoRelacionado
+
+# Etiqueta de todas las copias de productos: cambia cuando cambia algo que
+# los productos llevan consigo sin ser de ellos (su categoría, sus imágenes)
+ETIQUETA_PRODUCTOS = 'objetos:productos'
+ETIQUETA_CATEGORIAS = 'categorias'
+
+OBJETO_TIMEOUT = 60 * 60
+
+_FALTA = object()
+
+# Ids por categoría que se guardan: los que usan los productos relacionados
+IDS_POR_CATEGORIA = 24
+
+
+def _version(*etiquetas):
+    return '.'.join(str(version) for version in versiones(etiquetas))
+
+
+async def _aget_or_set(clave, cargar):
+    """get_or_set donde `cargar` es una corrutina (consultas con el ORM async)"""
+    valor = cache.get(clave, _FALTA)
+    if valor is _FALTA:
+        valor = await cargar()
+        cache.add(clave, valor, OBJETO_TIMEOUT)
+    return valor
+
+
+def _en_cache(ids):
+    """(claves, encontrados): las claves de los productos y los que ya están en la caché"""
+    general, *propias = versiones([ETIQUETA_PRODUCTOS] + [f'producto:{producto_id}' for producto_id in ids])
+    claves = {
+        f'tienda:objeto:producto:{producto_id}:{general}.{version}': producto_id
+        for producto_id, version in zip(ids, propias)
+    }
+    return claves, {claves[clave]: producto for clave, producto in cache.get_many(claves).items()}
+
+
+def _consulta_productos(ids):
+    return Producto.objects.filter(id__in=ids).select_related('categoria').order_by()
+
+
+def _guardar(ids, claves, encontrados, nuevos):
+    """Guarda los productos leídos de la base de datos y retorna todos en el orden de `ids`"""
+    if nuevos:
+        cache.set_many(
+            {clave: nuevos[producto_id] for clave, producto_id in claves.items() if producto_id in nuevos},
+            OBJETO_TIMEOUT,
+        )
+        encontrados.update(nuevos)
+    return [encontrados[producto_id] for producto_id in ids if producto_id in encontrados]
+
+
+def productos(ids):
+    """Productos con su categoría, en el orden de `ids` (se omiten los que no existan)"""
+    ids = list(ids)
+    if not ids:
+        return []
+    claves, encontrados = _en_cache(ids)
+    faltantes = [producto_id for producto_id in ids if producto_id not in encontrados]
+    nuevos = {producto.id: producto for producto in _consulta_productos(faltantes)} if faltantes else {}
+    return _guardar(ids, claves, encontrados, nuevos)
+
+
+async def aproductos(ids):
+    ids = list(ids)
+    if not ids:
+        return []
+    claves, encontrados = _en_cache(ids)
+    faltantes = [producto_id for producto_id in ids if producto_id not in encontrados]
+    nuevos = {producto.id: producto async for producto in _consulta_productos(faltantes)} if faltantes else {}
+    return _guardar(ids, claves, encontrados, nuevos)
+
+
+def producto(producto_id):
+    """El producto con su categoría, o None si no existe"""
+    encontrados = productos([producto_id])
+    return encontrados[0] if encontrados else None
+
+
+async def aproducto(producto_id):
+    encontrados = await aproductos([producto_id])
+    return encontrados[0] if encontrados else None
+
+
+def _consulta_destacados(cantidad):
+    return Producto.objects.filter(destacado=True, activo=True).values_list('id', flat=True)[:cantidad]
+
+
+def _consulta_de_categoria(categoria_id):
+    return (
+        Producto.objects.filter(categoria_id=categoria_id, activo=True)
+        .values_list('id', flat=True)[:IDS_POR_CATEGORIA]
+    )
+
+
+def _consulta_relacionados(producto_id):
+    return ProductoRelacionado.objects.filter(producto_id=producto_id).values_list('relacionado_id', flat=True)
+
+
+def categorias_activas():
+    return cache.get_or_set(
+        f'tienda:objeto:categorias:{_version(ETIQUETA_CATEGORIAS)}',
+        lambda: list(Categoria.objects.filter(activo=True)),
+        OBJETO_TIMEOUT,
+    )
+
+
+async def acategorias_activas():
+    return await _aget_or_set(
+        f'tienda:objeto:categorias:{_version(ETIQUETA_CATEGORIAS)}',
+        lambda: _alistar(Categoria.objects.filter(activo=True)),
+    )
+
+
+def ids_destacados(cantidad=6):
+    """Ids de los productos destacados más nuevos"""
+    return cache.get_or_set(
+        f'tienda:objeto:destacados:{cantidad}:{_version("catalogo")}',
+        lambda: list(_consulta_destacados(cantidad)),
+        OBJETO_TIMEOUT,
+    )
+
+
+async def aids_destacados(cantidad=6):
+    return await _aget_or_set(
+        f'tienda:objeto:destacados:{cantidad}:{_version("catalogo")}',
+        lambda: _alistar(_consulta_destacados(cantidad)),
+    )
+
+
+def ids_de_categoria(categoria_id):
+    """Ids de los IDS_POR_CATEGORIA productos activos más nuevos de la categoría"""
+    return cache.get_or_set(
+        f'tienda:objeto:categoria:{categoria_id}:ids:{_version(f"categoria:{categoria_id}")}',
+        lambda: list(_consulta_de_categoria(categoria_id)),
+        OBJETO_TIMEOUT,
+    )
+
+
+async def aids_de_categoria(categoria_id):
+    return await _aget_or_set(
+        f'tienda:objeto:categoria:{categoria_id}:ids:{_version(f"categoria:{categoria_id}")}',
+        lambda: _alistar(_consulta_de_categoria(categoria_id)),
+    )
+
+
+def ids_relacionados(producto_id):
+    """Ids de los productos comprados junto con el producto, en orden (ver calcular_relacionados)"""
+    return cache.get_or_set(
+        f'tienda:objeto:producto:{producto_id}:relacionados:{_version("relacionados")}',
+        lambda: list(_consulta_relacionados(producto_id)),
+        OBJETO_TIMEOUT,
+    )
+
+
+async def aids_relacionados(producto_id):
+    return await _aget_or_set(
+        f'tienda:objeto:producto:{producto_id}:relacionados:{_version("relacionados")}',
+        lambda: _alistar(_consulta_relacionados(producto_id)),
+    )
+
+
+def relacionados(producto, cantidad=4):
+    """Los productos más comprados junto con este; si faltan, los más nuevos de su categoría"""
+    elegidos = [otro for otro in productos(ids_relacionados(producto.id)) if otro.activo][:cantidad]
+    if len(elegidos) < cantidad:
+        elegidos += productos(_completar(producto, elegidos, ids_de_categoria(producto.categoria_id), cantidad))
+    return elegidos
+
+
+async def arelacionados(producto, cantidad=4):
+    # Los ids de las dos fuentes no dependen uno del otro: se leen a la vez
+    comprados, de_categoria = await asyncio.gather(
+        aids_relacionados(producto.id), aids_de_categoria(producto.categoria_id),
+    )
+    elegidos = [otro for otro in await aproductos(comprados) if otro.activo][:cantidad]
+    if len(elegidos) < cantidad:
+        elegidos += await aproductos(_completar(producto, elegidos, de_categoria, cantidad))
+    return elegidos
+
+
+def _completar(producto, elegidos, de_categoria, cantidad):
+    """Ids de la categoría que faltan para llegar a `cantidad`, sin repetir"""
+    usados = {producto.id} | {otro.id for otro in elegidos}
+    return [otro_id for otro_id in de_categoria if otro_id not in usados][:cantidad - len(elegidos)]
+
+
+async def _alistar(queryset):
+    return [fila async for fila in queryset]
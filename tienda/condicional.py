@@ -0,0 +1,125 @@
+"""
+GET condicional (ETag / Last-Modified) para las páginas del catálogo.
+
+El ETag de cada página sale de la versión de sus etiquetas de `tienda.cache`
+(las mismas de la caché de páginas), de los estáticos desplegados, de la URL
+y de quién la pide: se calcula sin consultas y cambia con todo lo que
+invalida la página, incluidos los productos eliminados y los cambios de
+categorías. Last-Modified es el
+mayor `fecha_actualizacion` de los productos de la página y de sus
+categorías, con una consulta de agregación que se repite solo cuando cambia
+la versión de la página. Si la página cambió sin que cambiara ninguna fecha
+(un producto eliminado, por ejemplo) se usa el momento en que se notó el
+cambio, para que Last-Modified nunca retroceda.
+
+Si el navegador ya tiene la versión vigente se responde 304 sin ejecutar la
+vista. Las respuestas a los anónimos son públicas (los proxies pueden
+guardarlas) y las de los usuarios, privadas; las dos se revalidan en cada
+visita.
+"""
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import _firma, version_estaticos, versiones
+
+
+def ultima_fecha(productos):
+    """Mayor fecha_actualizacion de los productos y de sus categorías (una consulta), o None"""
+    fechas = productos.order_by().aggregate(
+        productos=Max('fecha_actualizacion'), categorias=Max('categoria__fecha_actualizacion'),
+    )
+    return max((fecha for fecha in fechas.values() if fecha), default=None)
+
+
+def _ultima_modificacion(firma, version, modificacion):
+    """Last-Modified de la página (timestamp), recalculado solo cuando cambia su versión"""
+    clave = f'tienda:modificado:{firma}'
+    guardada = cache.get(clave)
+    if guardada is not None and guardada[0] == version:
+        return guardada[1]
+    fecha = int((modificacion() or timezone.now()).timestamp())
+    if guardada is not None and fecha <= guardada[1]:
+        # La página cambió pero ninguna fecha lo refleja: no volver atrás
+        fecha = max(int(timezone.now().timestamp()), guardada[1] + 1)
+    cache.set(clave, (version, fecha), None)
+    return fecha
+
+
+def _preparar(request, etiquetas, modificacion, args, kwargs):
+    """
+    (etag, last_modified, respuesta): la respuesta es el 304 si el navegador
+    ya tiene la página, o None. Retorna None si la petición no se valida.
+    """
+    # Los mensajes pendientes son de un visitante en particular
+    if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+        return None
+    firma = _firma(request)
+    # Un despliegue con otros estáticos también cambia la página (enlaza sus nombres con hash)
+    dependencias = etiquetas(request, *args, **kwargs)
+    version = '.'.join(str(v) for v in versiones(dependencias)) + f':{version_estaticos()}'
+    usuario = request.user
+    # La plantilla base muestra el usuario: cada uno tiene su propio ETag
+    quien = f'{usuario.pk}:{usuario.get_username()}' if usuario.is_authenticated else 'anonimo'
+    etag = quote_etag(hashlib.md5(f'{firma}:{version}:{quien}'.encode()).hexdigest())
+    ultima = _ultima_modificacion(firma, version, lambda: modificacion(request, *args, **kwargs))
+    return etag, ultima, get_conditional_response(request, etag=etag, last_modified=ultima)
+
+
+def _completar(request, respuesta, etag, ultima):
+    if respuesta.status_code not in (200, 304):
+        return respuesta
+    respuesta.headers.setdefault('ETag', etag)
+    respuesta.headers.setdefault('Last-Modified', http_date(ultima))
+    publica = (
+        not request.user.is_authenticated
+        and not respuesta.cookies
+        # La página incluye un token CSRF propio de este visitante
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+    alcance = 'public' if publica else 'private'
+    patch_cache_control(respuesta, **{alcance: True}, max_age=0, must_revalidate=True)
+    return respuesta
+
+
+def get_condicional(etiquetas, modificacion):
+    """
+    Responde 304 a los GET de la vista cuando el navegador ya tiene la
+    página vigente. `etiquetas(request, *args, **kwargs)` son las de
+    `cache_pagina_anonima` (síncronas también con vistas async) y
+    `modificacion(request, *args, **kwargs)` retorna la fecha de la última
+    modificación (ver `ultima_fecha`).
+    """
+    def decorador(vista):
+        if asyncio.iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura_async(request, *args, **kwargs):
+                # La sesión, request.user y la agregación son síncronos: un solo salto de hilo
+                validacion = await sync_to_async(_preparar)(request, etiquetas, modificacion, args, kwargs)
+                if validacion is None:
+                    return await vista(request, *args, **kwargs)
+                etag, ultima, respuesta = validacion
+                if respuesta is None:
+                    respuesta = await vista(request, *args, **kwargs)
+                return _completar(request, respuesta, etag, ultima)
+            return envoltura_async
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            validacion = _preparar(request, etiquetas, modificacion, args, kwargs)
+            if validacion is None:
+                return vista(request, *args, **kwargs)
+            etag, ultima, respuesta = validacion
+            if respuesta is None:
+                respuesta = vista(request, *args, **kwargs)
+            return _completar(request, respuesta, etag, ultima)
+        return envoltura
+    return decorador
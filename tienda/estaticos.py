@@ -0,0 +1,186 @@
+"""
+Archivos estáticos de producción sin un servidor aparte.
+
+`ManifestComprimido` es el almacenamiento de `collectstatic`: además de
+copiar cada archivo con el hash de su contenido en el nombre (como
+ManifestStaticFilesStorage), guarda junto a los de texto una versión .gz y,
+si está instalado brotli (pip install brotli), una .br.
+
+`EstaticosMiddleware` los sirve desde STATIC_ROOT en el mismo proceso: elige
+la versión comprimida según Accept-Encoding, responde 304 a las peticiones
+condicionales y marca los nombres con hash como inmutables por un año (un
+cambio en el archivo cambia su nombre). La lista de archivos se lee una vez
+por proceso: después de `collectstatic` hay que reiniciar el servidor.
+"""
+import gzip
+import json
+import mimetypes
+import os
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: sin ella solo se genera gzip
+    brotli = None
+
+# Extensiones que vale la pena comprimir (las imágenes y fuentes woff ya lo están)
+COMPRIMIBLES = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+
+# Los archivos más chicos no ganan nada comprimidos
+MINIMO_BYTES = 256
+
+# Por preferencia: brotli comprime más que gzip
+CODIFICACIONES = [('br', '.br'), ('gzip', '.gz')]
+
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+# Los nombres sin hash pueden cambiar de contenido: se revalidan
+CACHE_SIN_HASH = 'public, max-age=60'
+
+
+def comprimir(ruta):
+    """Escribe ruta.gz y ruta.br (si hay brotli) cuando son más chicos; retorna las rutas escritas"""
+    datos = Path(ruta).read_bytes()
+    if len(datos) < MINIMO_BYTES:
+        return []
+    versiones = [('.gz', gzip.compress(datos, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        versiones.append(('.br', brotli.compress(datos, quality=11)))
+    escritas = []
+    for extension, comprimido in versiones:
+        if len(comprimido) < len(datos) * 0.95:
+            Path(f'{ruta}{extension}').write_bytes(comprimido)
+            escritas.append(f'{ruta}{extension}')
+    return escritas
+
+
+class ManifestComprimido(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Los originales y sus copias con hash
+        for nombre in {*paths, *self.hashed_files.values()}:
+            if os.path.splitext(nombre)[1].lower() in COMPRIMIBLES and self.exists(nombre):
+                comprimir(self.path(nombre))
+
+
+class Estatico:
+    """Un archivo de STATIC_ROOT con sus versiones comprimidas"""
+
+    def __init__(self, ruta, inmutable):
+        self.ruta = ruta
+        self.inmutable = inmutable
+        tipo, _ = mimetypes.guess_type(ruta)
+        tipo = tipo or 'application/octet-stream'
+        if tipo.startswith('text/') or tipo in ('application/javascript', 'application/json', 'image/svg+xml'):
+            tipo += '; charset=utf-8'
+        self.tipo = tipo
+        estado = os.stat(ruta)
+        self.modificado = int(estado.st_mtime)
+        self.variantes = {None: (ruta, estado.st_size)}
+        for codificacion, extension in CODIFICACIONES:
+            if os.path.exists(ruta + extension):
+                self.variantes[codificacion] = (ruta + extension, os.stat(ruta + extension).st_size)
+
+    def variante(self, aceptadas):
+        """(codificación, ruta, tamaño) de la mejor versión que acepta el navegador"""
+        for codificacion, _ in CODIFICACIONES:
+            if codificacion in self.variantes and codificacion in aceptadas:
+                return (codificacion, *self.variantes[codificacion])
+        return (None, *self.variantes[None])
+
+
+def codificaciones_aceptadas(encabezado):
+    """Codificaciones de Accept-Encoding, sin las rechazadas con q=0"""
+    aceptadas = set()
+    for parte in encabezado.split(','):
+        codificacion, _, parametros = parte.strip().partition(';')
+        parametros = parametros.replace(' ', '')
+        if codificacion and parametros not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            aceptadas.add(codificacion.lower())
+    return aceptadas
+
+
+def indexar(raiz, prefijo):
+    """{ruta de la URL: Estatico} de todos los archivos de `raiz` (salvo las versiones comprimidas)"""
+    raiz = Path(raiz)
+    if not raiz.is_dir():
+        return {}
+    con_hash = set()
+    manifiesto = raiz / ManifestStaticFilesStorage.manifest_name
+    if manifiesto.exists():
+        con_hash = set(json.loads(manifiesto.read_text()).get('paths', {}).values())
+    archivos = {}
+    for directorio, _, nombres in os.walk(raiz):
+        for nombre in nombres:
+            ruta = os.path.join(directorio, nombre)
+            relativa = Path(ruta).relative_to(raiz).as_posix()
+            if relativa.endswith(('.gz', '.br')) and os.path.exists(ruta[:-3]):
+                continue
+            archivos[prefijo + relativa] = Estatico(ruta, relativa in con_hash)
+    return archivos
+
+
+class EstaticosMiddleware:
+    """
+    Sirve STATIC_ROOT con las versiones comprimidas de ManifestComprimido.
+    Con DEBUG no se usa: los sirve runserver desde las apps.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.DEBUG:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.prefijo = urlsplit(settings.STATIC_URL).path
+        self.archivos = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.servir(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.servir(request) or await self.get_response(request)
+
+    def servir(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefijo):
+            return None
+        if self.archivos is None:
+            self.archivos = indexar(settings.STATIC_ROOT, self.prefijo)
+        archivo = self.archivos.get(request.path_info)
+        if archivo is None:
+            return None
+
+        aceptadas = codificaciones_aceptadas(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        codificacion, ruta, tamano = archivo.variante(aceptadas)
+        etag = f'"{archivo.modificado:x}-{tamano:x}{"-" + codificacion if codificacion else ""}"'
+        respuesta = get_conditional_response(request, etag=etag, last_modified=archivo.modificado)
+        if respuesta is None:
+            if request.method == 'HEAD':
+                respuesta = HttpResponse(content_type=archivo.tipo)
+            else:
+                # FileResponse usa wsgi.file_wrapper (sendfile) cuando el servidor lo ofrece
+                respuesta = FileResponse(open(ruta, 'rb'), content_type=archivo.tipo)
+                del respuesta['Content-Disposition']
+            respuesta['Content-Length'] = tamano
+            if codificacion:
+                respuesta['Content-Encoding'] = codificacion
+        respuesta['ETag'] = etag
+        respuesta['Last-Modified'] = http_date(archivo.modificado)
+        respuesta['Cache-Control'] = CACHE_INMUTABLE if archivo.inmutable else CACHE_SIN_HASH
+        if len(archivo.variantes) > 1:
+            patch_vary_headers(respuesta, ['Accept-Encoding'])
+        return respuesta
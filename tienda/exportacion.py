@@ -0,0 +1,154 @@
+"""
+Exportación de pedidos con sus líneas para contabilidad, en CSV o JSONL.
+
+Los pedidos se leen con iterator(chunk_size=...) en orden de fecha (índice
+pedido_fecha_idx) y las líneas de cada bloque con un prefetch, así que en
+memoria hay un bloque a la vez: exportar mil líneas o diez millones usa lo
+mismo, y las consultas crecen con la cantidad de bloques, no de pedidos.
+El CSV tiene una fila por línea de pedido (los pedidos sin líneas salen en
+una fila con las columnas de la línea vacías); el JSONL, un pedido por línea
+con sus líneas en "items".
+
+Lo usan el comando `exportar_pedidos` y la vista `views.exportar_pedidos`.
+"""
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import ItemPedido, Pedido
+
+FORMATOS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+ESTADOS = [estado for estado, _ in Pedido.ESTADO_CHOICES]
+
+LOTE = 2000
+
+# Líneas de texto que se juntan antes de entregarlas a la respuesta o al archivo
+LINEAS_POR_BLOQUE = 500
+
+COLUMNAS_PEDIDO = [
+    'pedido_id', 'fecha_pedido', 'estado', 'usuario', 'nombre_completo', 'email', 'telefono', 'direccion',
+    'ciudad', 'codigo_postal', 'metodo_pago', 'pagado', 'fecha_pago', 'total',
+]
+COLUMNAS_ITEM = ['item_id', 'producto_id', 'producto', 'cantidad', 'precio_unitario', 'subtotal']
+
+
+def filtros(desde=None, hasta=None, estados=()):
+    """
+    (desde, hasta, estados) a partir del texto que llega en la petición o en
+    el comando (fechas AAAA-MM-DD); ValueError si algo no es válido
+    """
+    desde = date.fromisoformat(desde) if desde else None
+    hasta = date.fromisoformat(hasta) if hasta else None
+    if desde and hasta and desde > hasta:
+        raise ValueError('La fecha desde es posterior a la fecha hasta')
+    desconocidos = sorted(set(estados) - set(ESTADOS))
+    if desconocidos:
+        raise ValueError(f"Estado desconocido: {', '.join(desconocidos)}")
+    return desde, hasta, list(estados)
+
+
+def pedidos(desde=None, hasta=None, estados=None, lote=LOTE, using=DEFAULT_DB_ALIAS):
+    """
+    Iterador de los pedidos con fecha entre `desde` y `hasta` (fechas, ambas
+    incluidas, en la zona horaria de la tienda) y en `estados`, con sus
+    líneas ya cargadas; lee de a `lote` pedidos desde la base `using`
+    """
+    consulta = Pedido.objects.using(using).select_related('usuario').order_by('fecha_pedido', 'id')
+    if desde is not None:
+        consulta = consulta.filter(fecha_pedido__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+    if hasta is not None:
+        consulta = consulta.filter(
+            fecha_pedido__lt=timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)),
+        )
+    if estados:
+        consulta = consulta.filter(estado__in=estados)
+    items = ItemPedido.objects.using(using).select_related('producto').only(
+        'id', 'pedido_id', 'cantidad', 'precio_unitario', 'subtotal', 'producto__id', 'producto__nombre',
+    ).order_by('pedido_id', 'id')
+    return consulta.prefetch_related(Prefetch('items', queryset=items)).iterator(chunk_size=lote)
+
+
+def _fecha(valor):
+    return timezone.localtime(valor).isoformat() if valor else ''
+
+
+def _datos_pedido(pedido):
+    return {
+        'pedido_id': pedido.id,
+        'fecha_pedido': _fecha(pedido.fecha_pedido),
+        'estado': pedido.estado,
+        'usuario': pedido.usuario.username,
+        'nombre_completo': pedido.nombre_completo,
+        'email': pedido.email,
+        'telefono': pedido.telefono,
+        'direccion': pedido.direccion,
+        'ciudad': pedido.ciudad,
+        'codigo_postal': pedido.codigo_postal,
+        'metodo_pago': pedido.metodo_pago,
+        'pagado': pedido.pagado,
+        'fecha_pago': _fecha(pedido.fecha_pago),
+        'total': str(pedido.total),
+    }
+
+
+def _datos_item(item):
+    return {
+        'item_id': item.id,
+        'producto_id': item.producto.id,
+        'producto': item.producto.nombre,
+        'cantidad': item.cantidad,
+        'precio_unitario': str(item.precio_unitario),
+        'subtotal': str(item.subtotal),
+    }
+
+
+class _Eco:
+    """Un "archivo" que retorna lo que se le escribe: csv.writer arma la línea y se la devuelve"""
+
+    def write(self, valor):
+        return valor
+
+
+def _con_items(pedidos):
+    """(pedido, líneas) de cada pedido"""
+    for pedido in pedidos:
+        yield pedido, list(pedido.items.all())
+        # Cada línea del prefetch apunta a su pedido: sin cortar ese ciclo, los
+        # bloques ya enviados esperan al recolector de ciclos y se acumulan
+        pedido._prefetched_objects_cache.clear()
+
+
+def _lineas_csv(pedidos):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS_PEDIDO + COLUMNAS_ITEM)
+    for pedido, items in _con_items(pedidos):
+        datos = list(_datos_pedido(pedido).values())
+        if not items:
+            yield escritor.writerow(datos + [''] * len(COLUMNAS_ITEM))
+        for item in items:
+            yield escritor.writerow(datos + list(_datos_item(item).values()))
+
+
+def _lineas_jsonl(pedidos):
+    for pedido, items in _con_items(pedidos):
+        datos = _datos_pedido(pedido)
+        datos['items'] = [_datos_item(item) for item in items]
+        yield json.dumps(datos, ensure_ascii=False) + '\n'
+
+
+def exportar(pedidos, formato):
+    """Texto de la exportación en bloques de LINEAS_POR_BLOQUE líneas"""
+    lineas = _lineas_csv(pedidos) if formato == 'csv' else _lineas_jsonl(pedidos)
+    bloque = []
+    for linea in lineas:
+        bloque.append(linea)
+        if len(bloque) >= LINEAS_POR_BLOQUE:
+            yield ''.join(bloque)
+            bloque = []
+    if bloque:
+        yield ''.join(bloque)
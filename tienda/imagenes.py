@@ -0,0 +1,144 @@
+"""
+Versiones reducidas (derivadas) de las imágenes de productos y categorías.
+
+Por cada imagen se generan varios anchos (TAMANOS) en JPEG y WebP, en
+`derivadas/<ruta original sin extensión>-<versión>-<ancho>.<formato>`, donde
+la versión sale del contenido de la original: `tienda.medios` las sirve con
+un mes de caché, así que si la imagen cambia sin cambiar de nombre las
+derivadas nuevas tienen que tener otra URL. El campo `imagen_derivadas` del
+modelo guarda de qué imagen salieron, su versión y qué anchos existen, así
+las plantillas arman el srcset sin tocar el almacenamiento (ver el tag
+`imagen_responsiva`). Mientras no estén listas se usa la original.
+
+Al subir una imagen, `tienda.signals` encola la generación en un pool de
+hilos (TIENDA_IMAGENES_HILOS; 0 la hace en el momento) para que guardar
+desde el admin no espere; `generar_derivadas` genera las que falten.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Anchos en píxeles: miniaturas del carrito, tarjetas y página de detalle
+TAMANOS = (120, 320, 640, 1024)
+
+# (extensión, formato de PIL, opciones de guardado)
+FORMATOS = (
+    ('jpg', 'JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+    ('webp', 'WEBP', {'quality': 75, 'method': 4}),
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def version(datos):
+    """Versión de una imagen: los primeros caracteres del hash de su contenido"""
+    return hashlib.sha256(datos).hexdigest()[:12]
+
+
+def ruta_derivada(nombre, version, ancho, extension):
+    return f'derivadas/{os.path.splitext(nombre)[0]}-{version}-{ancho}.{extension}'
+
+
+def al_dia(nombre, derivadas):
+    """Si `derivadas` (el valor de imagen_derivadas) corresponde a la imagen `nombre`"""
+    derivadas = derivadas or {}
+    # Las generadas sin versión usaban rutas fijas, que pueden estar en caché con otro contenido
+    return bool(nombre) and derivadas.get('origen') == nombre and bool(derivadas.get('version'))
+
+
+def vigentes(objeto):
+    """Anchos de las derivadas de la imagen actual del objeto ([] si no hay o son de otra imagen)"""
+    if not objeto.imagen or not al_dia(objeto.imagen.name, objeto.imagen_derivadas):
+        return []
+    return objeto.imagen_derivadas.get('anchos', [])
+
+
+def generar(nombre, storage=default_storage):
+    """
+    Genera las derivadas de la imagen `nombre` y retorna el valor para
+    `imagen_derivadas`. No amplía: si la original es más angosta que un
+    tamaño, ese tamaño se reemplaza por el ancho original.
+    """
+    with storage.open(nombre, 'rb') as archivo:
+        datos = archivo.read()
+    original = Image.open(io.BytesIO(datos))
+    original.load()
+    actual = version(datos)
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info or 'A' in original.getbands() else 'RGB')
+
+    anchos = sorted({min(ancho, original.width) for ancho in TAMANOS})
+    for ancho in anchos:
+        alto = max(1, round(original.height * ancho / original.width))
+        reducida = original if ancho == original.width else original.resize((ancho, alto), Image.LANCZOS)
+        for extension, formato, opciones in FORMATOS:
+            imagen = reducida.convert('RGB') if formato == 'JPEG' else reducida
+            buffer = io.BytesIO()
+            imagen.save(buffer, formato, **opciones)
+            ruta = ruta_derivada(nombre, actual, ancho, extension)
+            if storage.exists(ruta):
+                storage.delete(ruta)
+            storage.save(ruta, ContentFile(buffer.getvalue()))
+    return {'origen': nombre, 'version': actual, 'anchos': anchos}
+
+
+def guardar(modelo, derivadas):
+    """Asigna las derivadas a todas las filas que usan esa imagen e invalida sus páginas"""
+    from . import cache, catalogo
+    from .models import Producto
+
+    filas = modelo.objects.filter(imagen=derivadas['origen'])
+    # Las páginas de detalle también dependen de la categoría: una etiqueta por
+    # categoría alcanza aunque la imagen la compartan miles de productos
+    campo = 'categoria_id' if modelo is Producto else 'id'
+    categorias = set(filas.values_list(campo, flat=True))
+    # update() no toca auto_now: Last-Modified de las páginas (ver tienda.condicional) depende de la fecha
+    filas.update(imagen_derivadas=derivadas, fecha_actualizacion=timezone.now())
+    cache.invalidar(
+        'catalogo', catalogo.ETIQUETA_CATEGORIAS, catalogo.ETIQUETA_PRODUCTOS,
+        *[f'categoria:{categoria_id}' for categoria_id in categorias],
+    )
+
+
+def _procesar(modelo, nombre):
+    try:
+        if not default_storage.exists(nombre):
+            logger.info('No se generan derivadas de %s: el archivo no existe', nombre)
+            return
+        guardar(modelo, generar(nombre))
+    except Exception:
+        logger.exception('Error al generar las derivadas de %s', nombre)
+    finally:
+        if _hilos():
+            # Cada hilo del pool abre su propia conexión
+            connection.close()
+
+
+def _hilos():
+    return getattr(settings, 'TIENDA_IMAGENES_HILOS', 2)
+
+
+def encolar(modelo, nombre):
+    """Genera las derivadas de `nombre` en segundo plano (o ya mismo, si TIENDA_IMAGENES_HILOS es 0)"""
+    global _pool
+    if not _hilos():
+        _procesar(modelo, nombre)
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_hilos(), thread_name_prefix='imagenes')
+    _pool.submit(_procesar, modelo, nombre)
@@ -0,0 +1,72 @@
+"""
+Medición de consultas SQL por vista.
+
+`MedicionConsultas` se engancha a las conexiones con execute_wrapper y cuenta
+las consultas y su tiempo. El middleware `tienda.middleware.MedicionConsultasMiddleware`
+la usa en cada petición y acumula los totales por vista en `estadisticas()`;
+los tests y los benchmarks la usan directamente.
+"""
+import threading
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+class MedicionConsultas:
+    """Cuenta las consultas ejecutadas (en todas las conexiones) dentro del bloque"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo = 0.0
+        # (alias, sql, params, many) de cada consulta, en orden
+        self.ejecutadas = []
+        self._pila = None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo += time.perf_counter() - inicio
+            self.consultas += 1
+            self.ejecutadas.append((context['connection'].alias, sql, params, many))
+
+    def __enter__(self):
+        self._pila = ExitStack()
+        for conexion in connections.all():
+            self._pila.enter_context(conexion.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pila.close()
+
+    @property
+    def tiempo_ms(self):
+        return self.tiempo * 1000
+
+
+_lock = threading.Lock()
+_estadisticas = {}
+
+
+def registrar(vista, medicion):
+    with _lock:
+        datos = _estadisticas.setdefault(vista, {
+            'peticiones': 0, 'consultas': 0, 'max_consultas': 0, 'tiempo_ms': 0.0,
+        })
+        datos['peticiones'] += 1
+        datos['consultas'] += medicion.consultas
+        datos['max_consultas'] = max(datos['max_consultas'], medicion.consultas)
+        datos['tiempo_ms'] += medicion.tiempo_ms
+
+
+def estadisticas():
+    """Totales acumulados por vista en este proceso"""
+    with _lock:
+        return {vista: dict(datos) for vista, datos in _estadisticas.items()}
+
+
+def reiniciar():
+    with _lock:
+        _estadisticas.clear()
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from tienda import semillas
+from tienda.management.commands.benchmark_tienda import percentil
+from tienda.models import Categoria, Producto
+
+CLAVE_USUARIOS = 'benchmark-clave'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara las vistas síncronas servidas como WSGI (un hilo por petición en curso) con las '
+        'síncronas y las async servidas como ASGI (una tarea por petición) sobre una base de datos '
+        'temporal, agregando una latencia fija a cada consulta para simular una base de datos lenta.'
+    )
+
+    # (nombre, peso): proporción de cada escenario en la mezcla de peticiones
+    ESCENARIOS = [
+        ('home', 15),
+        ('lista_productos', 20),
+        ('detalle_producto', 35),
+        ('carrito_usuario', 15),
+        ('carrito_anonimo', 15),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=2000)
+        parser.add_argument('--peticiones', type=int, default=1000, help='Escenarios a ejecutar en cada modo')
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos del servidor WSGI')
+        parser.add_argument('--concurrencia', type=int, default=8, help='Peticiones en curso a la vez con ASGI')
+        parser.add_argument('--latencia-ms', type=float, default=5.0, help='Demora agregada a cada consulta')
+        parser.add_argument('--anonimos', type=float, default=0.5,
+                            help='Fracción de visitas al catálogo hechas sin sesión (pasan por la caché de páginas)')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        with semillas.entorno_aislado():
+            self.sembrar(options)
+            nombres, pesos = zip(*self.ESCENARIOS)
+            self.plan = random.choices(nombres, pesos, k=options['peticiones'])
+            resultados = {}
+            with self.latencia(options['latencia_ms'] / 1000):
+                resultados['WSGI síncronas'] = self.medir(self.ejecutar_wsgi, 'ecommerce.urls', options)
+                # Separa el costo de ASGI en sí del de las vistas async
+                resultados['ASGI síncronas'] = self.medir(self.ejecutar_asgi, 'ecommerce.urls', options)
+                resultados['ASGI async'] = self.medir(self.ejecutar_asgi, 'ecommerce.urls_async', options)
+        self.reportar(resultados, options)
+
+    def sembrar(self, options):
+        self.stdout.write(f"Creando {options['productos']} productos...")
+        categorias = semillas.sembrar_categorias(20)
+        semillas.sembrar_productos(categorias, options['productos'])
+        clientes = max(options['hilos'], options['concurrencia'])
+        semillas.sembrar_usuarios(clientes, CLAVE_USUARIOS, prefijo='benchmark')
+        self.usuarios = list(User.objects.filter(username__startswith='benchmark'))
+        self.producto_ids = list(Producto.objects.filter(activo=True, stock__gt=100).values_list('id', flat=True))
+        self.categoria_ids = list(Categoria.objects.values_list('id', flat=True))
+
+    @contextmanager
+    def latencia(self, segundos):
+        """Agrega `segundos` a cada consulta de las conexiones que se abran dentro del bloque"""
+        def demorar(execute, sql, params, many, context):
+            time.sleep(segundos)
+            return execute(sql, params, many, context)
+
+        def instalar(connection, **kwargs):
+            connection.execute_wrappers.append(demorar)
+
+        connections.close_all()
+        connection_created.connect(instalar)
+        try:
+            yield
+        finally:
+            connection_created.disconnect(instalar)
+            connections.close_all()
+
+    def medir(self, ejecutar, urlconf, options):
+        cache.clear()
+        # Los errores 500 se cuentan en el reporte; no llenar la salida con sus trazas
+        registro = logging.getLogger('django.request')
+        nivel = registro.level
+        registro.setLevel(logging.CRITICAL)
+        try:
+            # Sin la medición de consultas: es un middleware síncrono y obligaría a adaptar las vistas async
+            with override_settings(ROOT_URLCONF=urlconf, TIENDA_MEDIR_CONSULTAS=False):
+                inicio = time.perf_counter()
+                mediciones = ejecutar(options)
+                return {'duracion': time.perf_counter() - inicio, 'mediciones': mediciones}
+        finally:
+            registro.setLevel(nivel)
+
+    def peticiones(self, escenario, rng):
+        """(nombre, método, url, datos JSON o parámetros GET, con sesión) de cada petición del escenario"""
+        anonimo = rng.random() < self.anonimos
+        if escenario == 'home':
+            return [('home', 'get', reverse('home'), None, not anonimo)]
+        if escenario == 'lista_productos':
+            datos = {'categoria': rng.choice(self.categoria_ids), 'orden': rng.choice(['nombre', 'precio_asc'])}
+            return [('lista_productos', 'get', reverse('lista_productos'), datos, not anonimo)]
+        if escenario == 'detalle_producto':
+            url = reverse('detalle_producto', args=[rng.choice(self.producto_ids)])
+            return [('detalle_producto', 'get', url, None, not anonimo)]
+        if escenario == 'carrito_usuario':
+            datos = {'producto_id': rng.choice(self.producto_ids), 'cantidad': 1}
+            return [('agregar_al_carrito', 'post', reverse('agregar_al_carrito'), datos, True)]
+        # En el carrito de la sesión, el id del item es el del producto
+        producto_id = rng.choice(self.producto_ids)
+        return [
+            ('agregar_al_carrito', 'post', reverse('agregar_al_carrito'), {'producto_id': producto_id}, False),
+            ('actualizar_carrito', 'post', reverse('actualizar_carrito'),
+             {'item_id': producto_id, 'cantidad': rng.randint(1, 3)}, False),
+            ('eliminar_del_carrito', 'post', reverse('eliminar_del_carrito'), {'item_id': producto_id}, False),
+        ]
+
+    def argumentos(self, metodo, url, datos):
+        if metodo == 'get':
+            return (url, datos), {}
+        return (url, json.dumps(datos)), {'content_type': 'application/json'}
+
+    def ejecutar_wsgi(self, options):
+        self.anonimos = options['anonimos']
+        plan = queue.Queue()
+        for escenario in self.plan:
+            plan.put(escenario)
+        mediciones = []
+        lock = threading.Lock()
+
+        def trabajador(numero):
+            rng = random.Random(options['semilla'] + numero)
+            clientes = {True: Client(raise_request_exception=False), False: Client(raise_request_exception=False)}
+            clientes[True].force_login(self.usuarios[numero % len(self.usuarios)])
+            propias = []
+            try:
+                while True:
+                    try:
+                        escenario = plan.get_nowait()
+                    except queue.Empty:
+                        break
+                    for nombre, metodo, url, datos, con_sesion in self.peticiones(escenario, rng):
+                        args, kwargs = self.argumentos(metodo, url, datos)
+                        inicio = time.perf_counter()
+                        respuesta = getattr(clientes[con_sesion], metodo)(*args, **kwargs)
+                        propias.append((nombre, (time.perf_counter() - inicio) * 1000, respuesta.status_code))
+            finally:
+                connections.close_all()
+                with lock:
+                    mediciones.extend(propias)
+
+        hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(options['hilos'])]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return mediciones
+
+    def ejecutar_asgi(self, options):
+        self.anonimos = options['anonimos']
+        clientes = []
+        for numero in range(options['concurrencia']):
+            con_sesion = AsyncClient(raise_request_exception=False)
+            con_sesion.force_login(self.usuarios[numero % len(self.usuarios)])
+            clientes.append({True: con_sesion, False: AsyncClient(raise_request_exception=False)})
+        connections.close_all()
+        return asyncio.run(self._ejecutar_asgi(clientes, options))
+
+    async def _ejecutar_asgi(self, clientes, options):
+        plan = list(reversed(self.plan))
+        mediciones = []
+
+        async def tarea(numero):
+            rng = random.Random(options['semilla'] + numero)
+            while plan:
+                for nombre, metodo, url, datos, con_sesion in self.peticiones(plan.pop(), rng):
+                    args, kwargs = self.argumentos(metodo, url, datos)
+                    # Como ASGIHandler: el código síncrono de cada petición corre en su propio hilo
+                    async with ThreadSensitiveContext():
+                        inicio = time.perf_counter()
+                        respuesta = await getattr(clientes[numero][con_sesion], metodo)(*args, **kwargs)
+                        mediciones.append((nombre, (time.perf_counter() - inicio) * 1000, respuesta.status_code))
+                        await sync_to_async(connections.close_all)()
+
+        await asyncio.gather(*(tarea(numero) for numero in range(options['concurrencia'])))
+        return mediciones
+
+    def reportar(self, resultados, options):
+        self.stdout.write(
+            f"Latencia agregada por consulta: {options['latencia_ms']} ms; "
+            f"WSGI con {options['hilos']} hilos, ASGI con {options['concurrencia']} peticiones en curso"
+        )
+        self.stdout.write(
+            f"{'modo':<18}{'vista':<22}{'peticiones':>11}{'errores':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}"
+        )
+        for modo, resultado in resultados.items():
+            por_nombre = {}
+            for nombre, ms, estado in resultado['mediciones']:
+                por_nombre.setdefault(nombre, []).append((ms, estado))
+            filas = [*sorted(por_nombre.items()), ('TOTAL', [f for filas in por_nombre.values() for f in filas])]
+            for nombre, mediciones in filas:
+                tiempos = sorted(ms for ms, _ in mediciones)
+                errores = sum(1 for _, estado in mediciones if estado >= 500)
+                self.stdout.write(
+                    f"{modo:<18}{nombre:<22}{len(mediciones):>11}{errores:>9}{percentil(tiempos, 50):>10.1f}"
+                    f"{percentil(tiempos, 95):>10.1f}{percentil(tiempos, 99):>10.1f}"
+                )
+            total = len(resultado['mediciones'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{modo}: {total} peticiones en {resultado['duracion']:.1f} s, "
+                f"{total / resultado['duracion']:.1f} peticiones/s"
+            ))
@@ -0,0 +1,69 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from tienda import busqueda, semillas
+from tienda.models import Producto
+
+# Términos frecuentes (casi la mitad del catálogo) y selectivos (una marca)
+BUSQUEDAS = ['cafe', 'senal portatil', 'cámara', 'nantex', 'aravia reloj', 'lumax algodon nino']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la búsqueda con icontains contra el índice de texto completo. '
+        'Los datos se crean dentro de una transacción que se revierte al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100_000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not busqueda.disponible():
+            raise CommandError('El motor de base de datos actual no tiene índice de búsqueda')
+
+        random.seed(options['semilla'])
+        with transaction.atomic():
+            self.sembrar(options['productos'])
+            self.stdout.write(f"{'búsqueda':<22}{'icontains (ms)':>16}{'índice (ms)':>14}{'resultados':>12}")
+            for texto in BUSQUEDAS:
+                antes = self.medir(self.consulta_icontains, texto, options['repeticiones'])
+                despues = self.medir(self.consulta_indice, texto, options['repeticiones'])
+                resultados = self.consulta_indice(texto)
+                self.stdout.write(f'{texto:<22}{antes:>16.1f}{despues:>14.1f}{resultados:>12}')
+            transaction.set_rollback(True)
+
+    def sembrar(self, cantidad):
+        self.stdout.write(f'Creando {cantidad} productos...')
+        semillas.sembrar_productos(semillas.sembrar_categorias(20), cantidad)
+        # bulk_create no envía señales: indexar en bloque
+        busqueda.indexar(Producto.objects.all())
+
+    def medir(self, consulta, texto, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            consulta(texto)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos)
+
+    def consulta_icontains(self, texto):
+        """La consulta que hacía lista_productos antes del índice (página 1 y conteo)"""
+        productos = Producto.objects.filter(activo=True).filter(
+            Q(nombre__icontains=texto) |
+            Q(descripcion__icontains=texto) |
+            Q(categoria__nombre__icontains=texto)
+        )
+        list(productos.order_by('nombre')[:12])
+        return productos.count()
+
+    def consulta_indice(self, texto):
+        productos = busqueda.buscar(Producto.objects.filter(activo=True), texto)
+        list(productos.order_by('relevancia', 'id')[:12])
+        return productos.count()
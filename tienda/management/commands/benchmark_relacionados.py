@@ -0,0 +1,106 @@
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max
+
+from tienda import recomendaciones, semillas
+from tienda.models import Pedido, Producto, ProductoRelacionado
+
+# Líneas por pedido en promedio con semillas.sembrar_pedidos (1 a 4)
+LINEAS_POR_PEDIDO = 2.5
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el cálculo de productos comprados juntos sobre una base de datos temporal con pedidos '
+        'sintéticos (por defecto, un millón de líneas): cada etapa del cálculo completo y una '
+        'actualización incremental.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=1_000_000, help='Líneas de pedido del cálculo completo')
+        parser.add_argument('--productos', type=int, default=20_000)
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--incremental', type=float, default=0.01,
+                            help='Líneas nuevas para la actualización incremental, como fracción de --lineas')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not recomendaciones.disponible():
+            raise CommandError('Se necesitan NumPy y SciPy: pip install numpy scipy')
+
+        random.seed(options['semilla'])
+        with semillas.entorno_aislado(), tempfile.TemporaryDirectory() as directorio:
+            estado = str(Path(directorio) / 'relacionados.npz')
+            self.sembrar(options)
+            self.completo(estado)
+            self.incremental(estado, options)
+
+    def sembrar(self, options):
+        pedidos = round(options['lineas'] / LINEAS_POR_PEDIDO)
+        self.stdout.write(f"Creando {options['productos']} productos y {pedidos} pedidos...")
+        inicio = time.perf_counter()
+        semillas.sembrar_productos(semillas.sembrar_categorias(20), options['productos'])
+        self.usuarios = semillas.sembrar_usuarios(options['usuarios'], 'clave-benchmark', prefijo='benchmark')
+        semillas.sembrar_pedidos(self.usuarios, pedidos)
+        self.stdout.write(f'Datos creados en {time.perf_counter() - inicio:.1f} s')
+
+    def medir(self, etapa, funcion, *args):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        self.stdout.write(f'  {etapa:<34}{(time.perf_counter() - inicio) * 1000:>10.0f} ms')
+        return resultado
+
+    def completo(self, estado):
+        """Las etapas de recomendaciones.actualizar(completo=True), medidas por separado"""
+        self.stdout.write('Cálculo completo:')
+        inicio = time.perf_counter()
+        hasta = Pedido.objects.aggregate(maximo=Max('id'))['maximo']
+        pedidos, productos = self.medir('leer líneas', recomendaciones.leer_lineas, 0, hasta)
+        existentes = self.medir('leer ids de productos', recomendaciones.ids_de_productos)
+        dimension = int(existentes.max()) + 1
+        matriz = self.medir('matriz de coocurrencias (XᵀX)', recomendaciones.coocurrencias,
+                            pedidos, productos, dimension)
+        validos = recomendaciones.np.zeros(dimension, dtype=bool)
+        validos[existentes] = True
+        resultado = self.medir('mejores vecinos', recomendaciones.vecinos, matriz, existentes, validos)
+        guardados = self.medir('guardar ProductoRelacionado', recomendaciones.guardar_relacionados,
+                               resultado, existentes)
+        recomendaciones.guardar_estado(estado, recomendaciones.Estado(matriz, hasta))
+        duracion = time.perf_counter() - inicio
+
+        tamano = sum(arreglo.nbytes for arreglo in (matriz.data, matriz.indices, matriz.indptr))
+        con_relacionados = ProductoRelacionado.objects.values('producto').distinct().count()
+        self.stdout.write(
+            f'  {len(productos)} líneas, {matriz.nnz} pares ({tamano / 2**20:.1f} MiB), '
+            f'{guardados} relacionados para {con_relacionados} productos'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'  Total: {duracion:.1f} s ({len(productos) / duracion:,.0f} líneas/s)'
+        ))
+
+    def incremental(self, estado, options):
+        lineas = round(options['lineas'] * options['incremental'])
+        if not lineas:
+            return
+        semillas.sembrar_pedidos(self.usuarios, max(1, round(lineas / LINEAS_POR_PEDIDO)))
+        inicio = time.perf_counter()
+        resultado = recomendaciones.actualizar(estado)
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(
+            f"Incremental: {resultado['lineas']} líneas nuevas, {resultado['afectados']} productos "
+            f"recalculados en {duracion:.1f} s"
+        )
+
+        # La lectura de la página de detalle
+        producto_id = (
+            ProductoRelacionado.objects.values('producto').annotate(n=Count('id')).order_by('-n')
+            .values_list('producto', flat=True).first()
+        ) or Producto.objects.values_list('id', flat=True).first()
+        inicio = time.perf_counter()
+        for _ in range(100):
+            list(ProductoRelacionado.objects.filter(producto_id=producto_id).values_list('relacionado_id', flat=True))
+        self.stdout.write(f'Lectura de los relacionados de un producto: {(time.perf_counter() - inicio) * 10:.2f} ms')
@@ -0,0 +1,191 @@
+import json
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from tienda import semillas
+from tienda.management.commands.benchmark_tienda import DATOS_PEDIDO, percentil
+from tienda.models import Categoria, Pedido, Producto
+from tienda.sqlite import PERFILES
+
+CLAVE_USUARIOS = 'benchmark-clave'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara los perfiles de SQLite de tienda.sqlite (el de Django por defecto y el afinado) con '
+        'varios hilos que leen el catálogo y escriben carritos y pedidos a la vez sobre una base de '
+        'datos temporal en disco, sin caché. Reporta lecturas y escrituras por segundo, latencias y '
+        'errores ("database is locked").'
+    )
+
+    # (nombre, peso, escribe)
+    ESCENARIOS = [
+        ('detalle_producto', 45, False),
+        ('lista_productos', 25, False),
+        ('agregar_al_carrito', 20, True),
+        ('checkout', 10, True),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=2000)
+        parser.add_argument('--peticiones', type=int, default=2000, help='Escenarios a ejecutar con cada perfil')
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--perfiles', nargs='+', choices=list(PERFILES), default=['basico', 'afinado'])
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_sqlite compara perfiles de SQLite: la base de datos configurada es otra')
+        random.seed(options['semilla'])
+        with semillas.entorno_aislado():
+            self.sembrar(options)
+            nombres, pesos, _ = zip(*self.ESCENARIOS)
+            self.plan = random.choices(nombres, pesos, k=options['peticiones'])
+            resultados = {}
+            for perfil in options['perfiles']:
+                pedidos = Pedido.objects.count()
+                with self.perfil(perfil):
+                    resultados[perfil] = self.medir(options)
+                # Fuera del bloque: esta conexión es del motor original
+                resultados[perfil]['pedidos'] = Pedido.objects.count() - pedidos
+        self.reportar(resultados, options)
+
+    def sembrar(self, options):
+        self.stdout.write(f"Creando {options['productos']} productos y {options['hilos']} usuarios...")
+        categorias = semillas.sembrar_categorias(20)
+        semillas.sembrar_productos(categorias, options['productos'])
+        # Stock de sobra para que ningún checkout falle por falta de unidades
+        Producto.objects.update(stock=1_000_000, activo=True)
+        semillas.sembrar_usuarios(options['hilos'], CLAVE_USUARIOS, prefijo='benchmark')
+        self.usuarios = list(User.objects.filter(username__startswith='benchmark'))
+        self.producto_ids = list(Producto.objects.values_list('id', flat=True))
+        self.categoria_ids = list(Categoria.objects.values_list('id', flat=True))
+
+    @contextmanager
+    def perfil(self, nombre):
+        """Usa el motor, las opciones y CONN_MAX_AGE del perfil en las conexiones que se abran dentro del bloque"""
+        # Es el mismo diccionario que usan los hilos nuevos para crear su conexión
+        ajustes = connections.settings['default']
+        originales = {clave: ajustes.get(clave) for clave in ('ENGINE', 'OPTIONS', 'CONN_MAX_AGE')}
+        connections.close_all()
+        # journal_mode queda guardado en el archivo: se fija antes de medir, sin otras conexiones abiertas
+        journal_mode = PERFILES[nombre]['OPTIONS'].get('pragmas', {}).get('journal_mode', 'DELETE')
+        with sqlite3.connect(ajustes['NAME']) as base:
+            base.execute(f'PRAGMA journal_mode = {journal_mode}')
+        ajustes.update(PERFILES[nombre])
+        try:
+            yield
+        finally:
+            ajustes.update(originales)
+
+    def medir(self, options):
+        plan = queue.Queue()
+        for escenario in self.plan:
+            plan.put(escenario)
+        mediciones = []
+        conexiones = []
+        lock = threading.Lock()
+        listos = threading.Barrier(options['hilos'] + 1)
+
+        def contar(**kwargs):
+            conexiones.append(1)
+
+        def trabajador(numero):
+            rng = random.Random(options['semilla'] + numero)
+            cliente = Client(raise_request_exception=False)
+            cliente.force_login(self.usuarios[numero])
+            propias = []
+            try:
+                listos.wait()
+                while True:
+                    try:
+                        escenario = plan.get_nowait()
+                    except queue.Empty:
+                        break
+                    for nombre, metodo, args, kwargs in self.peticiones(escenario, rng):
+                        inicio = time.perf_counter()
+                        # Como el servidor al empezar y terminar cada petición (el Client de pruebas no lo hace):
+                        # cierra la conexión si CONN_MAX_AGE venció
+                        close_old_connections()
+                        respuesta = getattr(cliente, metodo)(*args, **kwargs)
+                        close_old_connections()
+                        propias.append((nombre, (time.perf_counter() - inicio) * 1000, respuesta.status_code))
+            finally:
+                connections.close_all()
+                with lock:
+                    mediciones.extend(propias)
+
+        # Los errores 500 se cuentan en el reporte; no llenar la salida con sus trazas
+        registro = logging.getLogger('django.request')
+        nivel = registro.level
+        registro.setLevel(logging.CRITICAL)
+        try:
+            # Sin caché: cada lectura llega a la base de datos
+            with override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                TIENDA_MEDIR_CONSULTAS=False,
+            ):
+                hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(options['hilos'])]
+                for hilo in hilos:
+                    hilo.start()
+                listos.wait()
+                connection_created.connect(contar)
+                inicio = time.perf_counter()
+                for hilo in hilos:
+                    hilo.join()
+                duracion = time.perf_counter() - inicio
+                connection_created.disconnect(contar)
+        finally:
+            registro.setLevel(nivel)
+        return {'duracion': duracion, 'mediciones': mediciones, 'conexiones': len(conexiones)}
+
+    def peticiones(self, escenario, rng):
+        """(nombre, método del cliente, args, kwargs) de cada petición del escenario"""
+        if escenario == 'detalle_producto':
+            return [('detalle_producto', 'get', (reverse('detalle_producto', args=[rng.choice(self.producto_ids)]),), {})]
+        if escenario == 'lista_productos':
+            datos = {'categoria': rng.choice(self.categoria_ids), 'orden': rng.choice(['nombre', 'precio_asc'])}
+            return [('lista_productos', 'get', (reverse('lista_productos'), datos), {})]
+        agregar = ('agregar_al_carrito', 'post', (
+            reverse('agregar_al_carrito'), json.dumps({'producto_id': rng.choice(self.producto_ids), 'cantidad': 1}),
+        ), {'content_type': 'application/json'})
+        if escenario == 'agregar_al_carrito':
+            return [agregar]
+        return [agregar, ('checkout', 'post', (reverse('checkout'), DATOS_PEDIDO), {})]
+
+    def reportar(self, resultados, options):
+        escribe = {nombre: escritura for nombre, _, escritura in self.ESCENARIOS}
+        self.stdout.write(f"{options['hilos']} hilos, {options['peticiones']} escenarios por perfil, sin caché")
+        self.stdout.write(
+            f"{'perfil':<10}{'tipo':<12}{'peticiones':>11}{'por s':>9}{'errores':>9}"
+            f"{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}"
+        )
+        for perfil, resultado in resultados.items():
+            por_tipo = {'lecturas': [], 'escrituras': []}
+            for nombre, ms, estado in resultado['mediciones']:
+                por_tipo['escrituras' if escribe[nombre] else 'lecturas'].append((ms, estado))
+            for tipo, filas in por_tipo.items():
+                tiempos = sorted(ms for ms, _ in filas)
+                errores = sum(1 for _, estado in filas if estado >= 500)
+                self.stdout.write(
+                    f"{perfil:<10}{tipo:<12}{len(filas):>11}{len(filas) / resultado['duracion']:>9.1f}{errores:>9}"
+                    f"{percentil(tiempos, 50):>10.1f}{percentil(tiempos, 95):>10.1f}{percentil(tiempos, 99):>10.1f}"
+                )
+            total = len(resultado['mediciones'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{perfil}: {total} peticiones en {resultado['duracion']:.1f} s ({total / resultado['duracion']:.1f}/s), "
+                f"{resultado['conexiones']} conexiones abiertas, {resultado['pedidos']} pedidos creados"
+            ))
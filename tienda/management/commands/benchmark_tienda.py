@@ -0,0 +1,262 @@
+import json
+import logging
+import math
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from tienda import busqueda, semillas
+from tienda.instrumentacion import MedicionConsultas
+from tienda.models import Categoria, ItemCarrito, Producto
+from tienda.paginacion import ORDENES_PRODUCTOS, paginar_por_cursor
+
+CLAVE_USUARIOS = 'benchmark-clave'
+
+DATOS_PEDIDO = {
+    'nombre_completo': 'Cliente Benchmark',
+    'email': 'benchmark@example.com',
+    'telefono': '123456789',
+    'direccion': 'Calle Falsa 123',
+    'ciudad': 'Santiago',
+    'codigo_postal': '8320000',
+    'metodo_pago': 'transferencia',
+}
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por rango más cercano; `valores` debe estar ordenado"""
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga de la tienda: crea una base de datos temporal con un catálogo, '
+        'usuarios y pedidos sintéticos y recorre las vistas reales con varios hilos. '
+        'Reporta p50/p95/p99, peticiones por segundo y consultas por petición.'
+    )
+
+    # (nombre, peso): proporción de cada escenario en la mezcla de peticiones
+    ESCENARIOS = [
+        ('home', 10),
+        ('lista_productos', 15),
+        ('busqueda', 10),
+        ('lista_cursor', 5),
+        ('detalle_producto', 20),
+        ('agregar_al_carrito', 15),
+        ('resumen_carrito', 8),
+        ('carrito', 6),
+        ('actualizar_carrito', 5),
+        ('checkout', 4),
+        ('mis_pedidos', 2),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=5000)
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--usuarios', type=int, default=100)
+        parser.add_argument('--pedidos', type=int, default=2000)
+        parser.add_argument('--peticiones', type=int, default=2000, help='Total de escenarios a ejecutar')
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--anonimos', type=float, default=0.5,
+                            help='Fracción de visitas al catálogo hechas sin sesión (pasan por la caché de páginas)')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--json', metavar='ARCHIVO', help="Guardar los resultados en JSON ('-' para stdout)")
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        # Con --json - la salida estándar queda solo para el JSON
+        self.progreso = self.stderr if options['json'] == '-' else self.stdout
+        with semillas.entorno_aislado():
+            self.sembrar(options)
+            resultados = self.ejecutar(options)
+
+        self.reportar(resultados, options)
+
+    def sembrar(self, options):
+        self.progreso.write(
+            f"Creando {options['productos']} productos, {options['usuarios']} usuarios "
+            f"y {options['pedidos']} pedidos..."
+        )
+        inicio = time.perf_counter()
+        categorias = semillas.sembrar_categorias(options['categorias'])
+        semillas.sembrar_productos(categorias, options['productos'])
+        busqueda.indexar(Producto.objects.all())
+        usuarios = semillas.sembrar_usuarios(options['usuarios'], CLAVE_USUARIOS, prefijo='benchmark')
+        semillas.sembrar_pedidos(usuarios, options['pedidos'])
+        self.progreso.write(f'Datos creados en {time.perf_counter() - inicio:.1f} s')
+
+        self.producto_ids = list(Producto.objects.filter(activo=True).values_list('id', flat=True))
+        self.con_stock = list(Producto.objects.filter(activo=True, stock__gt=100).values_list('id', flat=True))
+        self.categoria_ids = list(Categoria.objects.values_list('id', flat=True))
+        self.usuarios = list(User.objects.filter(username__startswith='benchmark'))
+
+        # Cursores de las primeras páginas del listado por precio
+        self.cursores = []
+        pagina = paginar_por_cursor(Producto.objects.filter(activo=True), ORDENES_PRODUCTOS['precio_asc'])
+        while pagina.cursor_siguiente and len(self.cursores) < 20:
+            self.cursores.append(pagina.cursor_siguiente)
+            pagina = paginar_por_cursor(
+                Producto.objects.filter(activo=True), ORDENES_PRODUCTOS['precio_asc'], pagina.cursor_siguiente,
+            )
+        self.cursores = self.cursores or ['']
+
+    def ejecutar(self, options):
+        nombres, pesos = zip(*self.ESCENARIOS)
+        plan = queue.Queue()
+        for nombre in random.choices(nombres, pesos, k=options['peticiones']):
+            plan.put(nombre)
+
+        mediciones = []
+        lock = threading.Lock()
+
+        def trabajador(numero):
+            rng = random.Random(options['semilla'] + numero)
+            usuario = self.usuarios[numero % len(self.usuarios)]
+            cliente = Client(raise_request_exception=False)
+            cliente.force_login(usuario)
+            anonimo = Client(raise_request_exception=False)
+            propias = []
+            try:
+                while True:
+                    try:
+                        escenario = plan.get_nowait()
+                    except queue.Empty:
+                        break
+                    visitante = anonimo if rng.random() < options['anonimos'] else cliente
+                    getattr(self, f'escenario_{escenario}')(
+                        lambda nombre, metodo, *a, **kw: propias.append(self.medir(nombre, metodo, *a, **kw)),
+                        visitante, cliente, usuario, rng,
+                    )
+            finally:
+                connections.close_all()
+                with lock:
+                    mediciones.extend(propias)
+
+        hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(options['hilos'])]
+        # Los errores 500 se cuentan en el reporte; no llenar la salida con sus trazas
+        registro = logging.getLogger('django.request')
+        nivel = registro.level
+        registro.setLevel(logging.CRITICAL)
+        inicio = time.perf_counter()
+        try:
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        finally:
+            registro.setLevel(nivel)
+        return {'duracion': time.perf_counter() - inicio, 'mediciones': mediciones}
+
+    def medir(self, nombre, metodo, *args, **kwargs):
+        with MedicionConsultas() as medicion:
+            inicio = time.perf_counter()
+            respuesta = metodo(*args, **kwargs)
+            duracion = time.perf_counter() - inicio
+        return nombre, duracion * 1000, medicion.consultas, respuesta.status_code
+
+    # Escenarios: `medir(nombre, cliente.get/post, url, ...)` registra cada petición.
+    # `visitante` puede ser anónimo; `cliente` siempre tiene sesión.
+
+    def escenario_home(self, medir, visitante, cliente, usuario, rng):
+        medir('home', visitante.get, reverse('home'))
+
+    def escenario_lista_productos(self, medir, visitante, cliente, usuario, rng):
+        datos = {'categoria': rng.choice(self.categoria_ids), 'orden': rng.choice(['nombre', 'precio_asc', 'nuevos'])}
+        if rng.random() < 0.3:
+            datos['page'] = rng.randint(2, 5)
+        medir('lista_productos', visitante.get, reverse('lista_productos'), datos)
+
+    def escenario_busqueda(self, medir, visitante, cliente, usuario, rng):
+        texto = ' '.join(rng.sample(semillas.PALABRAS, rng.randint(1, 2)))
+        medir('busqueda', visitante.get, reverse('lista_productos'), {'q': texto})
+
+    def escenario_lista_cursor(self, medir, visitante, cliente, usuario, rng):
+        datos = {'orden': 'precio_asc', 'cursor': rng.choice(self.cursores)}
+        medir('lista_cursor', visitante.get, reverse('lista_productos'), datos)
+
+    def escenario_detalle_producto(self, medir, visitante, cliente, usuario, rng):
+        medir('detalle_producto', visitante.get, reverse('detalle_producto', args=[rng.choice(self.producto_ids)]))
+
+    def escenario_agregar_al_carrito(self, medir, visitante, cliente, usuario, rng):
+        datos = {'producto_id': rng.choice(self.con_stock or self.producto_ids), 'cantidad': 1}
+        medir('agregar_al_carrito', cliente.post, reverse('agregar_al_carrito'), json.dumps(datos),
+              content_type='application/json')
+
+    def escenario_resumen_carrito(self, medir, visitante, cliente, usuario, rng):
+        medir('resumen_carrito', cliente.get, reverse('resumen_carrito'))
+
+    def escenario_carrito(self, medir, visitante, cliente, usuario, rng):
+        medir('carrito', cliente.get, reverse('carrito'))
+
+    def escenario_actualizar_carrito(self, medir, visitante, cliente, usuario, rng):
+        item_id = ItemCarrito.objects.filter(carrito__usuario=usuario).values_list('id', flat=True).first()
+        if item_id is None:
+            return self.escenario_agregar_al_carrito(medir, visitante, cliente, usuario, rng)
+        datos = {'item_id': item_id, 'cantidad': rng.randint(1, 3)}
+        medir('actualizar_carrito', cliente.post, reverse('actualizar_carrito'), json.dumps(datos),
+              content_type='application/json')
+
+    def escenario_checkout(self, medir, visitante, cliente, usuario, rng):
+        self.escenario_agregar_al_carrito(medir, visitante, cliente, usuario, rng)
+        medir('checkout', cliente.get, reverse('checkout'))
+        medir('confirmar_checkout', cliente.post, reverse('checkout'), DATOS_PEDIDO)
+
+    def escenario_mis_pedidos(self, medir, visitante, cliente, usuario, rng):
+        medir('mis_pedidos', cliente.get, reverse('mis_pedidos'))
+
+    def reportar(self, resultados, options):
+        por_nombre = {}
+        for nombre, ms, consultas, estado in resultados['mediciones']:
+            por_nombre.setdefault(nombre, []).append((ms, consultas, estado))
+
+        def resumir(filas):
+            tiempos = sorted(ms for ms, _, _ in filas)
+            return {
+                'peticiones': len(filas),
+                'errores': sum(1 for _, _, estado in filas if estado >= 500),
+                'p50_ms': round(percentil(tiempos, 50), 2),
+                'p95_ms': round(percentil(tiempos, 95), 2),
+                'p99_ms': round(percentil(tiempos, 99), 2),
+                'consultas_por_peticion': round(sum(c for _, c, _ in filas) / len(filas), 2) if filas else 0,
+            }
+
+        total = len(resultados['mediciones'])
+        reporte = {
+            'parametros': {clave: options[clave] for clave in (
+                'productos', 'categorias', 'usuarios', 'pedidos', 'peticiones', 'hilos', 'anonimos', 'semilla',
+            )},
+            'motor': connection.vendor,
+            'duracion_s': round(resultados['duracion'], 3),
+            'peticiones_por_segundo': round(total / resultados['duracion'], 1) if resultados['duracion'] else 0,
+            'total': resumir([fila for filas in por_nombre.values() for fila in filas]),
+            'vistas': {nombre: resumir(filas) for nombre, filas in sorted(por_nombre.items())},
+        }
+
+        if options['json'] == '-':
+            self.stdout.write(json.dumps(reporte, indent=2, ensure_ascii=False))
+            return
+        if options['json']:
+            Path(options['json']).write_text(json.dumps(reporte, indent=2, ensure_ascii=False), encoding='utf-8')
+
+        self.stdout.write(
+            f"{'vista':<22}{'peticiones':>11}{'errores':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+            f"{'p99 (ms)':>10}{'consultas':>11}"
+        )
+        for nombre, datos in [*reporte['vistas'].items(), ('TOTAL', reporte['total'])]:
+            self.stdout.write(
+                f"{nombre:<22}{datos['peticiones']:>11}{datos['errores']:>9}{datos['p50_ms']:>10.1f}"
+                f"{datos['p95_ms']:>10.1f}{datos['p99_ms']:>10.1f}{datos['consultas_por_peticion']:>11.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} peticiones en {reporte['duracion_s']:.1f} s: {reporte['peticiones_por_segundo']} peticiones/s"
+        ))
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda import recomendaciones
+
+
+class Command(BaseCommand):
+    help = (
+        'Calcula los productos frecuentemente comprados juntos a partir de los pedidos. Por defecto '
+        'solo procesa los pedidos nuevos desde la ejecución anterior; --completo recalcula todo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Descartar el estado guardado y procesar todos los pedidos')
+        parser.add_argument('--estado', default=str(settings.TIENDA_RELACIONADOS_ESTADO),
+                            help='Archivo .npz con la matriz acumulada y el último pedido procesado')
+        parser.add_argument('--cantidad', type=int, default=recomendaciones.RELACIONADOS_POR_PRODUCTO,
+                            help='Relacionados que se guardan por producto')
+        parser.add_argument('--minimo', type=int, default=recomendaciones.MINIMO_EN_COMUN,
+                            help='Pedidos en común necesarios para relacionar dos productos')
+
+    def handle(self, *args, **options):
+        if not recomendaciones.disponible():
+            raise CommandError('Se necesitan NumPy y SciPy: pip install numpy scipy')
+        if options['cantidad'] < 1 or options['minimo'] < 1:
+            raise CommandError('--cantidad y --minimo deben ser mayores que cero')
+
+        inicio = time.perf_counter()
+        resultado = recomendaciones.actualizar(
+            options['estado'], completo=options['completo'], k=options['cantidad'], minimo=options['minimo'],
+        )
+        self.stdout.write(
+            f"{resultado['lineas']} líneas de {resultado['pedidos']} pedidos procesadas "
+            f"(hasta el pedido #{resultado['ultimo_pedido']}); {resultado['pares']} pares en la matriz"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['relacionados']} relacionados guardados para {resultado['afectados']} productos "
+            f"en {time.perf_counter() - inicio:.1f} s"
+        ))
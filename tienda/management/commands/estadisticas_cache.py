@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tienda import cache
+
+
+class Command(BaseCommand):
+    help = 'Muestra los aciertos y fallos de la caché de páginas para visitantes anónimos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reiniciar', action='store_true', help='Pone los contadores en cero')
+
+    def handle(self, *args, **options):
+        datos = cache.estadisticas()
+        self.stdout.write(f"Aciertos: {datos['aciertos']}")
+        self.stdout.write(f"Fallos: {datos['fallos']}")
+        self.stdout.write(f"Tasa de aciertos: {datos['tasa_aciertos']:.1%}")
+        if options['reiniciar']:
+            cache.reiniciar_estadisticas()
+            self.stdout.write(self.style.SUCCESS('Contadores reiniciados'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from tienda import exportacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta los pedidos con sus líneas en CSV (una fila por línea) o JSONL (un pedido por línea), '
+        'leyendo de a bloques: la memoria no crece con la cantidad de pedidos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=list(exportacion.FORMATOS), default='csv')
+        parser.add_argument('--desde', metavar='AAAA-MM-DD', help='Primer día a exportar')
+        parser.add_argument('--hasta', metavar='AAAA-MM-DD', help='Último día a exportar (incluido)')
+        parser.add_argument('--estado', action='append', default=[], choices=exportacion.ESTADOS,
+                            help='Exportar solo los pedidos en este estado (se puede repetir)')
+        parser.add_argument('--salida', metavar='ARCHIVO', help='Archivo de destino; sin él o con -, la salida estándar')
+        parser.add_argument('--lote', type=int, default=exportacion.LOTE, help='Pedidos leídos por consulta')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Base de datos de la que leer (p. ej. una réplica)')
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+        try:
+            desde, hasta, estados = exportacion.filtros(options['desde'], options['hasta'], options['estado'])
+        except ValueError as error:
+            raise CommandError(error)
+        pedidos = exportacion.pedidos(desde, hasta, estados, lote=options['lote'], using=options['database'])
+        bloques = exportacion.exportar(pedidos, options['formato'])
+
+        if options['salida'] in (None, '-'):
+            for bloque in bloques:
+                self.stdout.write(bloque, ending='')
+            return
+        with open(options['salida'], 'w', encoding='utf-8', newline='') as archivo:
+            for bloque in bloques:
+                archivo.write(bloque)
+        # A stderr, como los errores: stdout queda solo para la exportación
+        self.stderr.write(self.style.SUCCESS(f"Pedidos exportados a {options['salida']}"))
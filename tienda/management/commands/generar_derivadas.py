@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tienda import imagenes
+from tienda.models import Categoria, Producto
+
+
+def _generar(nombre):
+    try:
+        return nombre, imagenes.generar(nombre), None
+    except Exception as error:
+        return nombre, None, error
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera las versiones reducidas (JPEG y WebP) de las imágenes de productos y '
+        'categorías que no las tengan, en un pool de procesos. Cada imagen se procesa '
+        'una vez aunque la compartan varias filas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regenerar', action='store_true', help='Generar también las que ya están al día')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        if options['procesos'] < 1:
+            raise CommandError('--procesos debe ser mayor que cero')
+        for modelo in (Categoria, Producto):
+            self.procesar(modelo, options)
+
+    def procesar(self, modelo, options):
+        pendientes = set()
+        for nombre, derivadas in modelo.objects.exclude(imagen='').exclude(imagen=None).values_list(
+            'imagen', 'imagen_derivadas',
+        ).iterator(chunk_size=5000):
+            if options['regenerar'] or not imagenes.al_dia(nombre, derivadas):
+                pendientes.add(nombre)
+
+        etiqueta = modelo._meta.verbose_name_plural
+        if not pendientes:
+            self.stdout.write(f'{etiqueta}: nada que generar')
+            return
+
+        # Los procesos hijos abren sus propias conexiones
+        connections.close_all()
+        hechas = errores = 0
+        with ProcessPoolExecutor(options['procesos']) as pool:
+            for nombre, derivadas, error in pool.map(_generar, sorted(pendientes), chunksize=4):
+                if error is not None:
+                    errores += 1
+                    self.stderr.write(f'{nombre}: {error}')
+                    continue
+                imagenes.guardar(modelo, derivadas)
+                hechas += 1
+                self.stdout.write(f'\r  {etiqueta}: {hechas + errores}/{len(pendientes)} imágenes', ending='')
+                self.stdout.flush()
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'{etiqueta}: {hechas} imágenes procesadas, {errores} con error'))
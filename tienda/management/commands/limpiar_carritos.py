@@ -0,0 +1,82 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+
+from tienda.models import Carrito, ItemCarrito, clave_resumen_carrito
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina los carritos anónimos abandonados y sus items, por lotes: cada lote es una '
+        'transacción corta, para no bloquear a los visitantes que están comprando.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30,
+                            help='Días sin cambios tras los que se elimina un carrito con productos')
+        parser.add_argument('--dias-vacios', type=int, default=1,
+                            help='Días sin cambios tras los que se elimina un carrito vacío')
+        parser.add_argument('--lote', type=int, default=1000, help='Carritos por transacción')
+        parser.add_argument('--pausa', type=float, default=0.1, help='Segundos de espera entre lotes')
+        parser.add_argument('--dry-run', action='store_true', help='Solo mostrar lo que se eliminaría')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['dias_vacios'] < 1:
+            raise CommandError('--dias y --dias-vacios deben ser mayores que cero')
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+
+        ahora = timezone.now()
+        limite = ahora - timedelta(days=options['dias'])
+        limite_vacios = ahora - timedelta(days=options['dias_vacios'])
+        # El rango sobre fecha_actualizacion lo resuelve carrito_anonimos_idx
+        abandonados = Carrito.objects.filter(
+            Q(total_items=0) | Q(fecha_actualizacion__lt=limite),
+            usuario__isnull=True,
+            fecha_actualizacion__lt=max(limite, limite_vacios),
+        )
+
+        if options['dry_run']:
+            self.mostrar_estadisticas(abandonados)
+            return
+
+        carritos = items = 0
+        while True:
+            with transaction.atomic():
+                ids = list(abandonados.order_by('fecha_actualizacion', 'id').values_list('id', flat=True)[:options['lote']])
+                if not ids:
+                    break
+                # Se repite el filtro: un carrito pudo recibir productos desde que se leyó su id
+                _, eliminados = abandonados.filter(id__in=ids).delete()
+            cache.delete_many([clave_resumen_carrito(carrito_id) for carrito_id in ids])
+            carritos += eliminados.get(Carrito._meta.label, 0)
+            items += eliminados.get(ItemCarrito._meta.label, 0)
+            self.stdout.write(f'\r  {carritos} carritos y {items} items eliminados', ending='')
+            self.stdout.flush()
+            if len(ids) < options['lote']:
+                break
+            time.sleep(options['pausa'])
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'{carritos} carritos anónimos eliminados, con {items} items'))
+
+    def mostrar_estadisticas(self, abandonados):
+        datos = abandonados.aggregate(
+            carritos=Count('id'),
+            vacios=Count('id', filter=Q(total_items=0)),
+            unidades=Sum('total_items'),
+            monto=Sum('monto_total'),
+            mas_antiguo=Min('fecha_actualizacion'),
+        )
+        items = ItemCarrito.objects.filter(carrito__in=abandonados).count()
+        self.stdout.write(f"Carritos a eliminar:  {datos['carritos']} ({datos['vacios']} vacíos)")
+        self.stdout.write(f"Items a eliminar:     {items} ({datos['unidades'] or 0} unidades)")
+        self.stdout.write(f"Monto en carritos:    {int(datos['monto'] or 0):,} CLP".replace(',', '.'))
+        if datos['mas_antiguo']:
+            self.stdout.write(f"Sin cambios desde:    {timezone.localtime(datos['mas_antiguo']):%Y-%m-%d %H:%M}")
+        self.stdout.write(self.style.WARNING('Dry run: no se eliminó nada'))
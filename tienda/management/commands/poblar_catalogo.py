@@ -0,0 +1,176 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.utils.text import slugify
+
+from tienda import busqueda, catalogo, semillas
+from tienda.cache import invalidar
+from tienda.models import (
+    Carrito, Categoria, ItemCarrito, ItemPedido, Producto, ProductoRelacionado, VentaCategoriaDia, VentaProductoDia,
+)
+
+
+def _renderizar(tarea):
+    ruta, texto = tarea
+    return ruta, semillas.crear_imagen_dummy(texto)
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea el catálogo de ejemplo y, opcionalmente, productos sintéticos hasta la escala pedida '
+        '(p. ej. --productos 1000000). Las filas se insertan en lotes con bulk_create y las '
+        'imágenes se generan en paralelo en un pool de procesos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=len(semillas.PRODUCTOS_EJEMPLO),
+                            help='Total de productos, contando los de ejemplo')
+        parser.add_argument('--categorias', type=int, default=len(semillas.CATEGORIAS_EJEMPLO),
+                            help='Total de categorías, contando las de ejemplo')
+        parser.add_argument('--imagenes', type=int, default=100,
+                            help='Imágenes distintas para los productos sintéticos (se reparten entre ellos)')
+        parser.add_argument('--lote', type=int, default=5000, help='Productos por transacción')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count(), help='Procesos para generar imágenes')
+        parser.add_argument('--limpiar', action='store_true', help='Eliminar antes los productos y categorías existentes')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1 or options['procesos'] < 1:
+            raise CommandError('--lote y --procesos deben ser mayores que cero')
+        random.seed(options['semilla'])
+        self.lote = options['lote']
+
+        if options['limpiar']:
+            self.limpiar()
+
+        total_productos = max(options['productos'], 0)
+        ejemplos = semillas.PRODUCTOS_EJEMPLO[:total_productos]
+        sinteticos = total_productos - len(ejemplos)
+        imagenes = [f'productos/catalogo/{i:05d}.jpg' for i in range(min(options['imagenes'], sinteticos) or 1)]
+
+        tareas = [
+            (f'categorias/{slugify(nombre)}.jpg', nombre) for nombre, _ in semillas.CATEGORIAS_EJEMPLO
+        ] + [
+            (f'productos/{slugify(nombre)}.jpg', texto) for nombre, *_, texto in ejemplos
+        ]
+        if sinteticos:
+            tareas += [(ruta, f'Producto {i + 1}') for i, ruta in enumerate(imagenes)]
+
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(options['procesos']) as pool:
+            # Las imágenes se generan y guardan mientras se insertan las filas
+            guardado = threading.Thread(target=self.guardar_imagenes, args=(pool.map(_renderizar, tareas, chunksize=8),))
+            guardado.start()
+            try:
+                categorias = self.crear_categorias(options['categorias'])
+                self.crear_ejemplos(ejemplos, categorias)
+                self.crear_sinteticos(sinteticos, categorias, imagenes)
+            finally:
+                guardado.join()
+        # bulk_create no envía señales: las listas de categorías y destacados en caché quedan viejas
+        invalidar('catalogo', catalogo.ETIQUETA_CATEGORIAS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Catálogo creado en {time.perf_counter() - inicio:.1f} s: {len(categorias)} categorías, '
+            f'{total_productos} productos y {len(tareas)} imágenes'
+        ))
+
+    def limpiar(self):
+        self.stdout.write('Eliminando productos y categorías existentes...')
+        # Borrado masivo, sin las señales de cada producto: el índice de búsqueda,
+        # los totales de los carritos y la caché de páginas se rehacen una sola vez
+        with transaction.atomic():
+            ItemCarrito.objects.all().delete()
+            ItemPedido.objects.all().delete()
+            ProductoRelacionado.objects.all().delete()
+            # Sin pedidos no hay ventas; apuntan a los productos y las categorías
+            VentaProductoDia.objects.all().delete()
+            VentaCategoriaDia.objects.all().delete()
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(Producto._meta.db_table)}')
+            Categoria.objects.all().delete()
+            Carrito.recalcular_totales()
+            busqueda.reconstruir()
+        invalidar('catalogo', catalogo.ETIQUETA_CATEGORIAS, catalogo.ETIQUETA_PRODUCTOS, 'relacionados')
+        # La matriz de calcular_relacionados cuenta pedidos que ya no existen
+        if os.path.exists(settings.TIENDA_RELACIONADOS_ESTADO):
+            os.remove(settings.TIENDA_RELACIONADOS_ESTADO)
+
+    def guardar_imagenes(self, renderizadas):
+        for ruta, contenido in renderizadas:
+            if default_storage.exists(ruta):
+                default_storage.delete(ruta)
+            default_storage.save(ruta, ContentFile(contenido))
+
+    def crear_categorias(self, cantidad):
+        ejemplos = semillas.CATEGORIAS_EJEMPLO[:cantidad]
+        categorias = Categoria.objects.bulk_create([
+            Categoria(nombre=nombre, descripcion=descripcion, imagen=f'categorias/{slugify(nombre)}.jpg')
+            for nombre, descripcion in ejemplos
+        ])
+        if cantidad > len(ejemplos):
+            categorias += semillas.sembrar_categorias(cantidad - len(ejemplos))
+        if not categorias:
+            raise CommandError('Se necesita al menos una categoría')
+        return categorias
+
+    def crear_ejemplos(self, ejemplos, categorias):
+        productos = Producto.objects.bulk_create([
+            Producto(
+                nombre=nombre,
+                descripcion=descripcion,
+                precio=Decimal(precio),
+                precio_anterior=Decimal(precio_anterior),
+                categoria=categorias[indice % len(categorias)],
+                imagen=f'productos/{slugify(nombre)}.jpg',
+                stock=stock,
+                destacado=destacado,
+            )
+            for nombre, descripcion, precio, precio_anterior, indice, stock, destacado, _ in ejemplos
+        ])
+        self.indexar(productos, categorias)
+
+    def crear_sinteticos(self, cantidad, categorias, imagenes):
+        if not cantidad:
+            return
+        categoria_ids = [categoria.id for categoria in categorias]
+        inicio = time.perf_counter()
+        creados = 0
+        while creados < cantidad:
+            tamano = min(self.lote, cantidad - creados)
+            with transaction.atomic():
+                productos = Producto.objects.bulk_create([
+                    semillas.nuevo_producto(random.choice(categoria_ids), imagen=imagenes[(creados + i) % len(imagenes)])
+                    for i in range(tamano)
+                ])
+                self.indexar(productos, categorias)
+            creados += tamano
+            # Con DEBUG=True Django guarda cada consulta: vaciar para mantener la memoria plana
+            reset_queries()
+
+            transcurrido = time.perf_counter() - inicio
+            velocidad = creados / transcurrido if transcurrido else 0
+            restante = (cantidad - creados) / velocidad if velocidad else 0
+            self.stdout.write(
+                f'\r  {creados:,}/{cantidad:,} productos sintéticos ({velocidad:,.0f}/s, faltan {restante:.0f} s)',
+                ending='',
+            )
+            self.stdout.flush()
+        self.stdout.write('')
+
+    def indexar(self, productos, categorias):
+        # bulk_create no envía señales: indexar aquí, sin volver a leer las filas
+        nombres = {categoria.id: categoria.nombre for categoria in categorias}
+        busqueda.indexar(
+            (producto.id, producto.nombre, producto.descripcion, nombres[producto.categoria_id])
+            for producto in productos
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tienda.models import Carrito
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los totales desnormalizados (monto_total, total_items) de los carritos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'carritos', nargs='*', type=int,
+            help='IDs de los carritos a recalcular (por defecto, todos)',
+        )
+
+    def handle(self, *args, **options):
+        carritos = Carrito.objects.all()
+        if options['carritos']:
+            carritos = carritos.filter(id__in=options['carritos'])
+
+        actualizados = Carrito.recalcular_totales(carritos)
+        self.stdout.write(self.style.SUCCESS(f'{actualizados} carritos recalculados'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda import busqueda
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo de los productos'
+
+    def handle(self, *args, **options):
+        if not busqueda.disponible():
+            raise CommandError('El motor de base de datos actual no tiene índice de búsqueda')
+
+        total = busqueda.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'{total} productos indexados'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from tienda import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia la base de datos SQLite principal sobre cada réplica de TIENDA_REPLICAS y vuelve a '
+        'invalidar las páginas que pudieron generarse con datos atrasados. Programar con cron o '
+        'dejar corriendo con --cada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, metavar='SEGUNDOS',
+                            help='Repetir la copia cada tantos segundos en vez de copiar una sola vez')
+
+    def handle(self, *args, **options):
+        if not replicas.replicas():
+            raise CommandError('No hay réplicas configuradas (TIENDA_REPLICAS)')
+        for alias in [DEFAULT_DB_ALIAS, *replicas.replicas()]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias} no es SQLite: las réplicas de otros motores se mantienen con su propia replicación')
+        if options['cada'] is not None and options['cada'] <= 0:
+            raise CommandError('--cada debe ser mayor que cero')
+
+        while True:
+            inicio = time.perf_counter()
+            copiadas = replicas.sincronizar()
+            self.stdout.write(self.style.SUCCESS(
+                f"{', '.join(copiadas)} sincronizada(s) en {time.perf_counter() - inicio:.2f} s"
+            ))
+            if options['cada'] is None:
+                return
+            time.sleep(options['cada'])
@@ -0,0 +1,50 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from tienda import busqueda, planes, semillas
+from tienda.models import Producto
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta cada vista sobre una base de datos temporal, corre EXPLAIN QUERY PLAN sobre '
+        'sus consultas y falla si alguna recorre una tabla completa u ordena en un B-tree temporal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=2000,
+                            help='Productos sintéticos además de los de la verificación')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Correr ANALYZE antes. Sin estadísticas SQLite planifica como si las tablas '
+                                 'fueran grandes, que es lo que interesa vigilar; con ellas puede preferir '
+                                 'recorrer tablas que en la base temporal son chicas')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('verificar_planes usa EXPLAIN QUERY PLAN de SQLite')
+
+        random.seed(options['semilla'])
+        with semillas.entorno_aislado():
+            usuario = planes.preparar_datos()
+            if options['productos']:
+                semillas.sembrar_productos(semillas.sembrar_categorias(20), options['productos'])
+                busqueda.indexar(Producto.objects.all())
+            if options['analyze']:
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            cliente = Client(raise_request_exception=False)
+            cliente.force_login(usuario)
+            analizadas, problemas = planes.verificar(cliente, planes.peticiones(usuario))
+
+        for problema in problemas:
+            self.stdout.write(self.style.WARNING(f'{problema.peticion}: {problema.detalle}'))
+            if problema.sql:
+                self.stdout.write(f'    {problema.sql}')
+        if problemas:
+            raise CommandError(f'{len(problemas)} problemas en {analizadas} consultas analizadas')
+        self.stdout.write(self.style.SUCCESS(f'{analizadas} consultas analizadas, ningún recorrido completo'))
@@ -0,0 +1,164 @@
+"""
+Archivos subidos (MEDIA_ROOT) servidos por la aplicación, también con DEBUG=False.
+
+Solo se sirven las imágenes de productos y categorías y sus derivadas (ver
+`tienda.imagenes`). Cada respuesta lleva ETag y Last-Modified, con 304 para
+las peticiones condicionales, y caché pública por TIENDA_MEDIOS_MAX_AGE
+segundos. Se acepta un rango de bytes (Range, If-Range) con 206 y 416; con
+varios rangos se envía el archivo entero, como permite el estándar.
+
+El archivo se envía por partes con FileResponse, que usa sendfile cuando el
+servidor WSGI lo ofrece. Con TIENDA_MEDIOS_SENDFILE ('X-Accel-Redirect' para
+Nginx o 'X-Sendfile' para Apache/lighttpd) la aplicación solo valida y el
+servidor web envía el archivo (y resuelve los rangos).
+"""
+import mimetypes
+import os
+import posixpath
+import stat
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.urls import path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+# Carpetas de MEDIA_ROOT que se sirven
+CARPETAS = ('productos/', 'categorias/', 'derivadas/')
+
+# Las imágenes subidas no cambian de contenido sin cambiar de nombre (el
+# almacenamiento evita repetir nombres): un mes sin revalidar
+MAX_AGE = 60 * 60 * 24 * 30
+
+
+class _Tramo:
+    """Lee a lo más `largo` bytes de un archivo ya posicionado (para las respuestas 206)"""
+
+    def __init__(self, archivo, largo):
+        self.archivo = archivo
+        self.restante = largo
+
+    def read(self, tamano=-1):
+        if tamano < 0 or tamano > self.restante:
+            tamano = self.restante
+        datos = self.archivo.read(tamano) if tamano else b''
+        self.restante -= len(datos)
+        return datos
+
+    def close(self):
+        self.archivo.close()
+
+
+def rango(request, tamano, etag, modificado):
+    """
+    (inicio, fin) del rango pedido, con los dos extremos incluidos; None si
+    se debe enviar el archivo entero y False si el rango es insatisfacible
+    """
+    encabezado = request.META.get('HTTP_RANGE')
+    if not encabezado:
+        return None
+    si_rango = request.META.get('HTTP_IF_RANGE')
+    # If-Range: el rango vale solo si el archivo sigue siendo el que tiene el cliente
+    if si_rango and si_rango != etag and parse_http_date_safe(si_rango) != modificado:
+        return None
+    unidad, _, rangos = encabezado.partition('=')
+    if unidad.strip().lower() != 'bytes' or ',' in rangos:
+        return None
+    inicio, guion, fin = rangos.strip().partition('-')
+    if not guion:
+        return None
+    try:
+        if not inicio:
+            # Sufijo: los últimos `fin` bytes
+            largo = int(fin)
+            if largo <= 0 or not tamano:
+                return False
+            return max(0, tamano - largo), tamano - 1
+        inicio = int(inicio)
+        fin = int(fin) if fin else tamano - 1
+    except ValueError:
+        return None
+    if inicio >= tamano:
+        return False
+    if fin < inicio:
+        return None
+    return inicio, min(fin, tamano - 1)
+
+
+def _contenido(request, completa, ruta, tamano, etag, modificado):
+    tipo = mimetypes.guess_type(completa)[0] or 'application/octet-stream'
+    encabezado = getattr(settings, 'TIENDA_MEDIOS_SENDFILE', None)
+    if encabezado:
+        respuesta = HttpResponse(content_type=tipo)
+        if encabezado == 'X-Accel-Redirect':
+            prefijo = getattr(settings, 'TIENDA_MEDIOS_SENDFILE_PREFIJO', '/media-interno/')
+            respuesta[encabezado] = prefijo + quote(ruta)
+        else:
+            respuesta[encabezado] = completa
+        return respuesta
+
+    tramo = rango(request, tamano, etag, modificado)
+    if tramo is False:
+        respuesta = HttpResponse(status=416)
+        respuesta['Content-Range'] = f'bytes */{tamano}'
+        return respuesta
+    inicio, fin = tramo or (0, tamano - 1)
+    largo = fin - inicio + 1 if tamano else 0
+
+    if request.method == 'HEAD':
+        respuesta = HttpResponse(content_type=tipo)
+    else:
+        archivo = open(completa, 'rb')
+        if tramo:
+            archivo.seek(inicio)
+            # Sin fileno(): el servidor no usa sendfile, que enviaría hasta el final
+            respuesta = FileResponse(_Tramo(archivo, largo), content_type=tipo)
+        else:
+            respuesta = FileResponse(archivo, content_type=tipo)
+            del respuesta['Content-Disposition']
+    if tramo:
+        respuesta.status_code = 206
+        respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    respuesta['Content-Length'] = largo
+    return respuesta
+
+
+def servir(request, ruta):
+    """Un archivo de CARPETAS dentro de MEDIA_ROOT"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    # Sin '..': la carpeta se comprueba sobre la ruta ya resuelta
+    ruta = posixpath.normpath(ruta).lstrip('/')
+    if not ruta.startswith(CARPETAS):
+        raise Http404('Archivo no encontrado')
+    try:
+        completa = safe_join(settings.MEDIA_ROOT, ruta)
+        estado = os.stat(completa)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Archivo no encontrado')
+    if not stat.S_ISREG(estado.st_mode):
+        raise Http404('Archivo no encontrado')
+
+    modificado = int(estado.st_mtime)
+    etag = f'"{modificado:x}-{estado.st_size:x}"'
+    respuesta = get_conditional_response(request, etag=etag, last_modified=modificado)
+    if respuesta is None:
+        respuesta = _contenido(request, completa, ruta, estado.st_size, etag, modificado)
+    if respuesta.status_code != 416:
+        respuesta['ETag'] = etag
+        respuesta['Last-Modified'] = http_date(modificado)
+        respuesta['Cache-Control'] = f"public, max-age={getattr(settings, 'TIENDA_MEDIOS_MAX_AGE', MAX_AGE)}"
+    respuesta['Accept-Ranges'] = 'bytes'
+    return respuesta
+
+
+def patrones():
+    """La ruta de MEDIA_URL, como django.conf.urls.static.static() pero también sin DEBUG"""
+    url = urlsplit(settings.MEDIA_URL)
+    if url.netloc:
+        # Los archivos están en otro servidor (p. ej. una CDN)
+        return []
+    return [path(f"{url.path.strip('/')}/<path:ruta>", servir, name='medios')]
@@ -0,0 +1,57 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import instrumentacion
+
+logger = logging.getLogger(__name__)
+
+
+class MedicionConsultasMiddleware:
+    """
+    Cuenta las consultas SQL y su tiempo en cada petición.
+
+    Agrega los encabezados X-Consultas-SQL y Server-Timing a la respuesta y
+    acumula los totales por vista (ver tienda.instrumentacion.estadisticas).
+    Se activa con TIENDA_MEDIR_CONSULTAS.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TIENDA_MEDIR_CONSULTAS', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with instrumentacion.MedicionConsultas() as medicion:
+            response = self.get_response(request)
+        return self.anotar(request, response, medicion)
+
+    async def __acall__(self, request):
+        medicion = instrumentacion.MedicionConsultas()
+        # El ORM async consulta desde el hilo de sync_to_async, con sus propias
+        # conexiones: la medición se engancha a las de ese hilo
+        await sync_to_async(medicion.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            medicion.__exit__(None, None, None)
+        return self.anotar(request, response, medicion)
+
+    def anotar(self, request, response, medicion):
+        coincidencia = request.resolver_match
+        vista = coincidencia.view_name if coincidencia else request.path
+        instrumentacion.registrar(vista, medicion)
+
+        response['X-Consultas-SQL'] = str(medicion.consultas)
+        response['Server-Timing'] = f'db;desc="{medicion.consultas} consultas";dur={medicion.tiempo_ms:.1f}'
+        logger.debug('%s: %d consultas en %.1f ms', vista, medicion.consultas, medicion.tiempo_ms)
+        return response
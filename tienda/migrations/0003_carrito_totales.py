@@ -0,0 +1,45 @@
+# Generated by Django 4.2.23 on 2026-10-18 07:51
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def calcular_totales(apps, schema_editor):
+    Carrito = apps.get_model('tienda', 'Carrito')
+    ItemCarrito = apps.get_model('tienda', 'ItemCarrito')
+    items = ItemCarrito.objects.filter(carrito=OuterRef('pk')).values('carrito')
+    Carrito.objects.update(
+        total_items=Coalesce(Subquery(items.annotate(suma=Sum('cantidad')).values('suma')), 0),
+        monto_total=Coalesce(
+            Subquery(items.annotate(suma=Sum(
+                F('cantidad') * F('producto__precio'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )).values('suma')),
+            Decimal('0'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0002_alter_pedido_metodo_pago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrito',
+            name='monto_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='carrito',
+            name='total_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
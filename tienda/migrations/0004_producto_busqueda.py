@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from tienda import busqueda
+
+
+def crear_indice(apps, schema_editor):
+    busqueda.crear_indice(schema_editor)
+    Producto = apps.get_model('tienda', 'Producto')
+    busqueda.indexar(Producto.objects.all())
+
+
+def eliminar_indice(apps, schema_editor):
+    busqueda.eliminar_indice(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0003_carrito_totales'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0004_producto_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='imagen_derivadas',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_derivadas',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
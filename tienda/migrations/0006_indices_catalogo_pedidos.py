@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0005_imagen_derivadas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='categoria',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre'], name='categoria_activas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', 'fecha_pedido', 'id'], name='pedido_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True), ('destacado', True)), fields=['fecha_creacion'], name='producto_destacados_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre', 'id'], name='producto_activos_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['precio', 'id'], name='producto_activos_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_creacion', 'id'], name='producto_activos_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'nombre', 'id'], name='producto_cat_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'precio', 'id'], name='producto_cat_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'fecha_creacion', 'id'], name='producto_cat_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0006_indices_catalogo_pedidos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(condition=models.Q(('usuario__isnull', True)), fields=['fecha_actualizacion', 'id'], name='carrito_anonimos_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0007_indice_carritos_anonimos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoRelacionado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('puntaje', models.FloatField()),
+                ('pedidos_en_comun', models.PositiveIntegerField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relacionados', to='tienda.producto')),
+                ('relacionado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tienda.producto')),
+            ],
+            options={
+                'ordering': ['producto', 'posicion'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productorelacionado',
+            constraint=models.UniqueConstraint(fields=('producto', 'posicion'), name='relacionado_posicion_unica'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0009_categoria_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_pedido', 'id'], name='pedido_fecha_idx'),
+        ),
+    ]
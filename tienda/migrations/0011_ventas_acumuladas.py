@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0010_indice_exportacion_pedidos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaCategoriaDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tienda.categoria')),
+            ],
+            options={
+                'verbose_name': 'venta diaria por categoría',
+                'verbose_name_plural': 'ventas',
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaProductoDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tienda.producto')),
+            ],
+            options={
+                'verbose_name': 'venta diaria por producto',
+                'verbose_name_plural': 'ventas diarias por producto',
+                'indexes': [models.Index(fields=['fecha', 'producto', 'unidades', 'ingresos'], name='venta_producto_periodo_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ventaproductodia',
+            constraint=models.UniqueConstraint(fields=('fecha', 'producto'), name='venta_producto_dia_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventacategoriadia',
+            constraint=models.UniqueConstraint(fields=('fecha', 'categoria'), name='venta_categoria_dia_unica'),
+        ),
+    ]
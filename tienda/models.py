@@ -1,22 +1,57 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
+# Segundos que se mantiene en caché el resumen (cantidad/total) de un carrito
+RESUMEN_CARRITO_TIMEOUT = 60 * 5
+
+def clave_resumen_carrito(carrito_id):
+    return f'tienda:carrito:{carrito_id}:resumen'
+
+# Segundos que se mantiene en caché el resumen de pedidos de un usuario
+RESUMEN_PEDIDOS_TIMEOUT = 60 * 60
+
+def clave_resumen_pedidos(usuario_id):
+    return f'tienda:usuario:{usuario_id}:pedidos'
+
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True)
     imagen = models.ImageField(upload_to='categorias/', blank=True, null=True)
+    # Versiones reducidas de la imagen (ver tienda.imagenes)
+    imagen_derivadas = models.JSONField(default=dict, blank=True, editable=False)
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "Categorías"
         ordering = ['nombre']
+        indexes = [
+            models.Index(fields=['nombre'], condition=Q(activo=True), name='categoria_activas_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        if 'nombre' in field_names:
+            instancia._nombre_guardado = instancia.nombre
+        return instancia
+
+    def save(self, *args, **kwargs):
+        # Las señales usan nombre_cambiado para reindexar la búsqueda solo si hace falta
+        self.nombre_cambiado = getattr(self, '_nombre_guardado', None) != self.nombre
+        super().save(*args, **kwargs)
+        self._nombre_guardado = self.nombre
+
 class Producto(models.Model):
     nombre = models.CharField(max_length=200)
     descripcion = models.TextField()
@@ -24,6 +59,7 @@ class Producto(models.Model):
     precio_anterior = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='productos')
     imagen = models.ImageField(upload_to='productos/')
+    imagen_derivadas = models.JSONField(default=dict, blank=True, editable=False)
     stock = models.PositiveIntegerField(default=0)
     activo = models.BooleanField(default=True)
     destacado = models.BooleanField(default=False)
@@ -32,10 +68,44 @@ class Producto(models.Model):
 
     class Meta:
         ordering = ['-fecha_creacion']
+        # Índices parciales sobre los productos activos, uno por cada orden del
+        # listado (con y sin filtro de categoría) más los destacados del inicio.
+        # El id al final sirve de desempate para la paginación por cursor.
+        indexes = [
+            models.Index(fields=['fecha_creacion'], condition=Q(activo=True, destacado=True),
+                         name='producto_destacados_idx'),
+            models.Index(fields=['nombre', 'id'], condition=Q(activo=True), name='producto_activos_nombre_idx'),
+            models.Index(fields=['precio', 'id'], condition=Q(activo=True), name='producto_activos_precio_idx'),
+            models.Index(fields=['fecha_creacion', 'id'], condition=Q(activo=True), name='producto_activos_fecha_idx'),
+            models.Index(fields=['categoria', 'nombre', 'id'], condition=Q(activo=True),
+                         name='producto_cat_nombre_idx'),
+            models.Index(fields=['categoria', 'precio', 'id'], condition=Q(activo=True),
+                         name='producto_cat_precio_idx'),
+            models.Index(fields=['categoria', 'fecha_creacion', 'id'], condition=Q(activo=True),
+                         name='producto_cat_fecha_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        if 'precio' in field_names:
+            instancia._precio_guardado = instancia.precio
+        if 'categoria_id' in field_names:
+            instancia._categoria_guardada = instancia.categoria_id
+        return instancia
+
+    def save(self, *args, **kwargs):
+        precio_guardado = getattr(self, '_precio_guardado', None)
+        super().save(*args, **kwargs)
+        if precio_guardado is not None and precio_guardado != self.precio:
+            # Los totales de los carritos dependen del precio vigente
+            Carrito.recalcular_totales(Carrito.objects.filter(items__producto=self))
+        self._precio_guardado = self.precio
+        self._categoria_guardada = self.categoria_id
+
     @property
     def tiene_descuento(self):
         return self.precio_anterior and self.precio_anterior > self.precio
@@ -66,17 +136,52 @@ class Producto(models.Model):
             return int(((self.precio_anterior - self.precio) / self.precio_anterior) * 100)
         return 0
 
+class ProductoRelacionado(models.Model):
+    """
+    Productos que se compran junto con otro ("frecuentemente comprados
+    juntos"), en orden de `posicion`. Los calcula `calcular_relacionados`
+    a partir de los pedidos (ver tienda/recomendaciones.py).
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='relacionados')
+    relacionado = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='+')
+    posicion = models.PositiveSmallIntegerField()
+    # Similitud coseno entre los conjuntos de pedidos de ambos productos
+    puntaje = models.FloatField()
+    pedidos_en_comun = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['producto', 'posicion']
+        constraints = [
+            # También es el índice con que la página de detalle lee los relacionados
+            models.UniqueConstraint(fields=['producto', 'posicion'], name='relacionado_posicion_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} -> {self.relacionado_id} ({self.puntaje:.3f})"
+
 class Carrito(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
 
+    # Totales desnormalizados: ItemCarrito los actualiza con F() al guardarse o
+    # eliminarse, y `manage.py recalcular_carritos` los reconstruye desde cero.
+    monto_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_items = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Para que limpiar_carritos encuentre los anónimos abandonados sin recorrer la tabla
+            models.Index(fields=['fecha_actualizacion', 'id'], condition=Q(usuario__isnull=True),
+                         name='carrito_anonimos_idx'),
+        ]
+
     def __str__(self):
         return f"Carrito de {self.usuario.username if self.usuario else 'Anónimo'}"
 
     @property
     def total(self):
-        return sum(item.subtotal for item in self.items.all())
+        return self.monto_total
     
     @property
     def total_formateado(self):
@@ -85,7 +190,61 @@ class Carrito(models.Model):
 
     @property
     def cantidad_items(self):
-        return sum(item.cantidad for item in self.items.all())
+        return self.total_items
+
+    @classmethod
+    def resumen(cls, carrito_id):
+        """Retorna la cantidad de items y el total del carrito, usando la caché"""
+        clave = clave_resumen_carrito(carrito_id)
+        resumen = cache.get(clave)
+        if resumen is None:
+            datos = cls.objects.filter(pk=carrito_id).values('total_items', 'monto_total').first()
+            resumen = {
+                'cantidad': datos['total_items'] if datos else 0,
+                'total': datos['monto_total'] if datos else Decimal('0'),
+            }
+            cache.set(clave, resumen, RESUMEN_CARRITO_TIMEOUT)
+        return resumen
+
+    @classmethod
+    def recalcular_totales(cls, carritos=None):
+        """Recalcula los totales desde los items; retorna la cantidad de carritos actualizados"""
+        if carritos is None:
+            carritos = cls.objects.all()
+        ids = list(carritos.values_list('id', flat=True))
+        items = ItemCarrito.objects.filter(carrito=OuterRef('pk')).values('carrito')
+        actualizados = 0
+        # Por lotes para no exceder el límite de parámetros de la base de datos
+        for inicio in range(0, len(ids), 500):
+            lote = ids[inicio:inicio + 500]
+            actualizados += cls.objects.filter(id__in=lote).update(
+                total_items=Coalesce(
+                    Subquery(items.annotate(suma=Sum('cantidad')).values('suma')),
+                    0,
+                ),
+                monto_total=Coalesce(
+                    Subquery(items.annotate(suma=Sum(
+                        F('cantidad') * F('producto__precio'),
+                        output_field=DecimalField(max_digits=12, decimal_places=2),
+                    )).values('suma')),
+                    Decimal('0'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+            )
+            cache.delete_many([clave_resumen_carrito(carrito_id) for carrito_id in lote])
+        return actualizados
+
+    def vaciar(self):
+        """Elimina todos los items del carrito y deja sus totales en cero"""
+        with transaction.atomic():
+            self.items.all().delete()
+            Carrito.objects.filter(pk=self.pk).update(monto_total=0, total_items=0)
+        self.monto_total = Decimal('0')
+        self.total_items = 0
+        self.invalidar_resumen()
+
+    def invalidar_resumen(self):
+        cache.delete(clave_resumen_carrito(self.id))
 
 class ItemCarrito(models.Model):
     carrito = models.ForeignKey(Carrito, on_delete=models.CASCADE, related_name='items')
@@ -99,6 +258,53 @@ class ItemCarrito(models.Model):
     def __str__(self):
         return f"{self.cantidad}x {self.producto.nombre}"
 
+    def _guardado(self):
+        """
+        (carrito_id, producto_id, cantidad) de la fila guardada, bloqueada hasta
+        el fin de la transacción; None si ya no existe. Se lee en el momento y no
+        al cargar el item: otra petición pudo cambiarlo o borrarlo entretanto
+        """
+        return ItemCarrito.objects.select_for_update().filter(pk=self.pk).values_list(
+            'carrito_id', 'producto_id', 'cantidad',
+        ).first()
+
+    def save(self, *args, **kwargs):
+        agregando = self._state.adding
+        # Sin savepoint: dentro de otra transacción (p. ej. views.sumar_al_carrito) se une a ella
+        with transaction.atomic(savepoint=False):
+            guardado = None if agregando else self._guardado()
+            super().save(*args, **kwargs)
+            if not agregando and guardado is None:
+                # La fila ya no existía (se volvió a insertar): recalcular el carrito completo
+                Carrito.recalcular_totales(Carrito.objects.filter(pk=self.carrito_id))
+            elif guardado and guardado[:2] != (self.carrito_id, self.producto_id):
+                # El item cambió de carrito o de producto (p. ej. desde el admin)
+                Carrito.recalcular_totales(Carrito.objects.filter(pk__in=[guardado[0], self.carrito_id]))
+            else:
+                self._sumar_al_carrito(self.cantidad - (guardado[2] if guardado else 0))
+        cache.delete(clave_resumen_carrito(self.carrito_id))
+
+    def delete(self, *args, **kwargs):
+        carrito_id = self.carrito_id
+        with transaction.atomic(savepoint=False):
+            guardado = self._guardado()
+            resultado = super().delete(*args, **kwargs)
+            # Si otra petición ya lo borró (p. ej. un doble clic) no hay nada que descontar
+            if guardado and resultado[1].get(self._meta.label):
+                self._sumar_al_carrito(-guardado[2], guardado[0])
+        cache.delete(clave_resumen_carrito(carrito_id))
+        return resultado
+
+    def _sumar_al_carrito(self, cantidad, carrito_id=None):
+        """Aplica una diferencia de cantidad a los totales del carrito de forma atómica"""
+        if not cantidad:
+            return
+        Carrito.objects.filter(pk=carrito_id or self.carrito_id).update(
+            total_items=F('total_items') + cantidad,
+            monto_total=F('monto_total') + cantidad * self.producto.precio,
+            fecha_actualizacion=timezone.now(),
+        )
+
     @property
     def subtotal(self):
         return self.producto.precio * self.cantidad
@@ -142,15 +348,58 @@ class Pedido(models.Model):
 
     class Meta:
         ordering = ['-fecha_pedido']
+        indexes = [
+            models.Index(fields=['usuario', 'fecha_pedido', 'id'], name='pedido_usuario_fecha_idx'),
+            # Exportación por rango de fechas (tienda.exportacion)
+            models.Index(fields=['fecha_pedido', 'id'], name='pedido_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido #{self.id} - {self.usuario.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        if 'estado' in field_names:
+            instancia._estado_guardado = instancia.estado
+        return instancia
+
+    def save(self, *args, **kwargs):
+        from . import ventas
+
+        estado_guardado = getattr(self, '_estado_guardado', None)
+        # Las ventas acumuladas no cuentan los pedidos cancelados
+        if estado_guardado is None or (estado_guardado == 'cancelado') == (self.estado == 'cancelado'):
+            super().save(*args, **kwargs)
+        else:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                ventas.registrar_pedido(self, signo=-1 if self.estado == 'cancelado' else 1)
+        self._estado_guardado = self.estado
     
     @property
     def total_formateado(self):
         """Retorna el total formateado con puntos de miles"""
         return f"{int(self.total):,}".replace(",", ".")
 
+    @classmethod
+    def resumen_de_usuario(cls, usuario_id):
+        """Cantidad de pedidos y total gastado (sin cancelados) del usuario, usando la caché"""
+        clave = clave_resumen_pedidos(usuario_id)
+        resumen = cache.get(clave)
+        if resumen is None:
+            datos = cls.objects.filter(usuario_id=usuario_id).aggregate(
+                cantidad=Count('id'),
+                total=Sum('total', filter=~Q(estado='cancelado')),
+            )
+            resumen = {'cantidad': datos['cantidad'], 'total': datos['total'] or Decimal('0')}
+            cache.set(clave, resumen, RESUMEN_PEDIDOS_TIMEOUT)
+        return resumen
+
+    @staticmethod
+    def invalidar_resumen_de_usuario(usuario_id):
+        cache.delete(clave_resumen_pedidos(usuario_id))
+
 class ItemPedido(models.Model):
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='items')
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
@@ -174,3 +423,46 @@ class ItemPedido(models.Model):
     def subtotal_formateado(self):
         """Retorna el subtotal formateado con puntos de miles"""
         return f"{int(self.subtotal):,}".replace(",", ".")
+
+class VentaProductoDia(models.Model):
+    """
+    Unidades e ingresos de un producto en un día (en la zona horaria de la
+    tienda), sin los pedidos cancelados. El checkout los incrementa con F()
+    y `manage.py reconstruir_ventas` los recalcula desde los pedidos (ver
+    tienda/ventas.py).
+    """
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='+')
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'venta diaria por producto'
+        verbose_name_plural = 'ventas diarias por producto'
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto'], name='venta_producto_dia_unica'),
+        ]
+        indexes = [
+            # Cubre los productos más vendidos de un período: se agrupa sin leer las filas de la tabla
+            models.Index(fields=['fecha', 'producto', 'unidades', 'ingresos'], name='venta_producto_periodo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.producto_id}: {self.unidades} u."
+
+class VentaCategoriaDia(models.Model):
+    """Unidades e ingresos de una categoría en un día, como VentaProductoDia"""
+    fecha = models.DateField()
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='+')
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'venta diaria por categoría'
+        verbose_name_plural = 'ventas'
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'categoria'], name='venta_categoria_dia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.categoria_id}: {self.unidades} u."
@@ -0,0 +1,201 @@
+"""
+Cambios del carrito en lote.
+
+La página del carrito junta las ediciones de cantidad de un momento y las
+manda juntas a `views.operaciones_carrito` como una lista de operaciones:
+
+    {"accion": "agregar", "producto_id": 7, "cantidad": 1}
+    {"accion": "actualizar", "item_id": 12, "cantidad": 3}
+    {"accion": "eliminar", "item_id": 12}
+
+`aplicar()` las resuelve en orden a la cantidad final de cada producto y
+las aplica todas o ninguna: una consulta para los items del carrito, una
+para el stock y los precios de todos los productos involucrados, y a lo más
+una inserción, una actualización y un borrado en bloque más el recálculo de
+los totales, sin importar cuántas operaciones lleguen. Con los carritos de
+la sesión (el id del item es el del producto) no se escribe en la base de
+datos.
+"""
+from django.db import IntegrityError, transaction
+
+from .carrito_sesion import CarritoSesion
+from .models import Carrito, ItemCarrito, Producto
+from .pedidos import StockInsuficiente
+
+ACCIONES = ('agregar', 'actualizar', 'eliminar')
+
+MAXIMO_OPERACIONES = 100
+
+
+class OperacionInvalida(Exception):
+    """Una operación del lote está mal formada o apunta a algo que no está en el carrito"""
+
+
+class CarritoModificado(Exception):
+    """Otra petición cambió el carrito mientras se aplicaba el lote (p. ej. agregó el mismo producto)"""
+
+
+def _entero(operacion, campo, defecto=None):
+    valor = operacion.get(campo, defecto)
+    # bool es subclase de int: True no es una cantidad
+    if isinstance(valor, bool) or not isinstance(valor, int):
+        raise OperacionInvalida(f'"{campo}" debe ser un número entero')
+    return valor
+
+
+def leer(operaciones):
+    """Valida el lote; retorna [(accion, id, cantidad)] (id de producto al agregar, de item si no)"""
+    if not isinstance(operaciones, list) or not operaciones:
+        raise OperacionInvalida('"operaciones" debe ser una lista no vacía')
+    if len(operaciones) > MAXIMO_OPERACIONES:
+        raise OperacionInvalida(f'Se aceptan hasta {MAXIMO_OPERACIONES} operaciones por lote')
+    leidas = []
+    for operacion in operaciones:
+        accion = operacion.get('accion') if isinstance(operacion, dict) else None
+        if accion not in ACCIONES:
+            raise OperacionInvalida(f'Acción desconocida: {accion}')
+        if accion == 'agregar':
+            cantidad = _entero(operacion, 'cantidad', 1)
+            if cantidad <= 0:
+                raise OperacionInvalida('"cantidad" debe ser mayor que cero')
+            leidas.append((accion, _entero(operacion, 'producto_id'), cantidad))
+        else:
+            cantidad = _entero(operacion, 'cantidad') if accion == 'actualizar' else 0
+            leidas.append((accion, _entero(operacion, 'item_id'), cantidad))
+    return leidas
+
+
+def _cantidades_finales(actuales, producto_de_item, operaciones):
+    """{id de producto: cantidad} después de las operaciones (0 si se quita)"""
+    finales = dict(actuales)
+    for accion, objetivo, cantidad in operaciones:
+        if accion == 'agregar':
+            finales[objetivo] = finales.get(objetivo, 0) + cantidad
+            continue
+        producto_id = producto_de_item(objetivo)
+        if producto_id is None or producto_id not in finales:
+            raise OperacionInvalida('El producto no está en el carrito')
+        finales[producto_id] = max(cantidad, 0)
+    return finales
+
+
+def _validar(actuales, finales, productos):
+    """Los productos nuevos deben estar activos y ninguna cantidad cambiada puede superar el stock"""
+    faltantes = []
+    for producto_id, cantidad in finales.items():
+        if not cantidad:
+            continue
+        producto = productos.get(producto_id)
+        if producto_id not in actuales and (producto is None or not producto.activo):
+            raise OperacionInvalida('Producto no encontrado')
+        if producto is not None and cantidad != actuales.get(producto_id) and cantidad > producto.stock:
+            faltantes.append(producto)
+    if faltantes:
+        raise StockInsuficiente(faltantes)
+
+
+def _productos(ids):
+    return {
+        producto.id: producto
+        for producto in Producto.objects.filter(id__in=ids).only('id', 'nombre', 'precio', 'stock', 'activo')
+    }
+
+
+def _estado(items, productos, total, cantidad):
+    """Lo que retorna la vista: los items que quedan con sus subtotales y los totales del carrito"""
+    return {
+        'carrito_total': total,
+        'carrito_cantidad': cantidad,
+        'items': [
+            {
+                'item_id': item_id,
+                'producto_id': producto_id,
+                'cantidad': cantidad_item,
+                'subtotal': productos[producto_id].precio * cantidad_item,
+            }
+            for item_id, producto_id, cantidad_item in items
+        ],
+    }
+
+
+def aplicar(carrito, operaciones, usuario=None):
+    """
+    Aplica `operaciones` (ya leídas con `leer()`) al carrito: un
+    CarritoSesion, el Carrito del usuario o None si el usuario todavía no
+    tiene uno (se crea solo si queda algún producto). Retorna el estado del
+    carrito; si una operación no es válida lanza OperacionInvalida, si
+    falta stock StockInsuficiente y si otra petición agregó entretanto uno
+    de los productos nuevos CarritoModificado, y en todos los casos no
+    cambia nada.
+    """
+    if isinstance(carrito, CarritoSesion):
+        return _aplicar_en_sesion(carrito, operaciones)
+    try:
+        with transaction.atomic():
+            return _aplicar_en_base(carrito, operaciones, usuario)
+    except IntegrityError as error:
+        # Los items se leen sin bloquear: un agregar_al_carrito simultáneo del
+        # mismo producto hace fallar la inserción por unique_together
+        raise CarritoModificado('El carrito cambió mientras se guardaban los cambios, vuelve a intentarlo') from error
+
+
+def _aplicar_en_sesion(carrito, operaciones):
+    actuales = carrito.cantidades
+    finales = _cantidades_finales(actuales, lambda item_id: item_id, operaciones)
+    productos = _productos(finales)
+    _validar(actuales, finales, productos)
+    # Como CarritoSesion.items: se quitan los productos eliminados o desactivados
+    finales = {
+        producto_id: cantidad for producto_id, cantidad in finales.items()
+        if cantidad > 0 and producto_id in productos and productos[producto_id].activo
+    }
+    carrito.reemplazar(finales, {producto_id: producto.precio for producto_id, producto in productos.items()})
+    items = [(producto_id, producto_id, cantidad) for producto_id, cantidad in finales.items()]
+    return _estado(items, productos, carrito.total, carrito.cantidad_items)
+
+
+def _aplicar_en_base(carrito, operaciones, usuario):
+    # {id de producto: (id del item, cantidad)}
+    items = {}
+    if carrito is not None:
+        filas = carrito.items.order_by('id').values_list('id', 'producto_id', 'cantidad')
+        items = {producto_id: (item_id, cantidad) for item_id, producto_id, cantidad in filas}
+    actuales = {producto_id: cantidad for producto_id, (_, cantidad) in items.items()}
+    producto_de_item = {item_id: producto_id for producto_id, (item_id, _) in items.items()}
+    finales = _cantidades_finales(actuales, producto_de_item.get, operaciones)
+    productos = _productos(finales)
+    _validar(actuales, finales, productos)
+
+    nuevos = [
+        ItemCarrito(producto_id=producto_id, cantidad=cantidad)
+        for producto_id, cantidad in finales.items() if producto_id not in items and cantidad > 0
+    ]
+    cambiados = [
+        ItemCarrito(id=items[producto_id][0], cantidad=cantidad)
+        for producto_id, cantidad in finales.items()
+        if producto_id in items and cantidad > 0 and cantidad != actuales[producto_id]
+    ]
+    eliminados = [
+        items[producto_id][0] for producto_id, cantidad in finales.items() if producto_id in items and not cantidad
+    ]
+
+    if carrito is None and nuevos:
+        carrito = Carrito.objects.get_or_create(usuario=usuario)[0]
+    for item in nuevos:
+        item.carrito = carrito
+    ItemCarrito.objects.bulk_create(nuevos)
+    ItemCarrito.objects.bulk_update(cambiados, ['cantidad'])
+    if eliminados:
+        ItemCarrito.objects.filter(id__in=eliminados).delete()
+    if nuevos or cambiados or eliminados:
+        # bulk_create, bulk_update y el borrado en bloque no pasan por ItemCarrito.save
+        Carrito.recalcular_totales(Carrito.objects.filter(pk=carrito.pk))
+        carrito.refresh_from_db(fields=['monto_total', 'total_items'])
+
+    restantes = [
+        (items[producto_id][0], producto_id, cantidad)
+        for producto_id, cantidad in finales.items() if producto_id in items and cantidad > 0
+    ] + [(item.id, item.producto_id, item.cantidad) for item in nuevos]
+    if carrito is None:
+        return _estado([], productos, 0, 0)
+    return _estado(restantes, productos, carrito.total, carrito.cantidad_items)
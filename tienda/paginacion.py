@@ -0,0 +1,172 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+En lugar de COUNT(*) + LIMIT/OFFSET, cada página se pide a partir de la clave
+de orden de la última fila vista (más el id como desempate), así la página
+5000 cuesta lo mismo que la primera. El cursor es opaco para el cliente: un
+JSON en base64 con la dirección y los valores de la clave.
+"""
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Orden de cada opción de `orden` del listado, siempre con el id como desempate
+ORDENES_PRODUCTOS = {
+    'nombre': ('nombre', 'id'),
+    'precio_asc': ('precio', 'id'),
+    'precio_desc': ('-precio', '-id'),
+    'nuevos': ('-fecha_creacion', '-id'),
+}
+
+# Historial de pedidos: más recientes primero
+ORDEN_PEDIDOS = ('-fecha_pedido', '-id')
+
+# Segundos que se mantiene en caché el total aproximado de un listado
+TOTAL_TIMEOUT = 60 * 5
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+class PaginaCursor:
+    """Página de resultados obtenida con paginar_por_cursor"""
+
+    def __init__(self, object_list, cursor_siguiente, cursor_anterior, total=None):
+        self.object_list = object_list
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def codificar_cursor(direccion, valores):
+    datos = json.dumps([direccion, valores], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, modelo, campos):
+    """Retorna (direccion, valores) con cada valor convertido al tipo de su campo"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        direccion, valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if direccion not in ('siguiente', 'anterior') or len(valores) != len(campos):
+            raise CursorInvalido(cursor)
+        return direccion, [
+            modelo._meta.get_field(campo.lstrip('-')).to_python(valor)
+            for campo, valor in zip(campos, valores)
+        ]
+    except (ValueError, TypeError, ValidationError) as error:
+        raise CursorInvalido(cursor) from error
+
+
+def _invertir(campos):
+    return tuple(campo[1:] if campo.startswith('-') else f'-{campo}' for campo in campos)
+
+
+def _posteriores(campos, valores):
+    """
+    Filas que van después de `valores` en el orden `campos`.
+
+    Se arma como `a >= x AND (a > x OR (a = x AND b > y))` para que el motor
+    pueda usar el índice de la primera columna como rango.
+    """
+    def condicion(i):
+        campo = campos[i].lstrip('-')
+        operador = 'lt' if campos[i].startswith('-') else 'gt'
+        siguiente = Q(**{f'{campo}__{operador}': valores[i]})
+        if i + 1 < len(campos):
+            siguiente |= Q(**{campo: valores[i]}) & condicion(i + 1)
+        return siguiente
+
+    primero = campos[0].lstrip('-')
+    operador = 'lte' if campos[0].startswith('-') else 'gte'
+    return Q(**{f'{primero}__{operador}': valores[0]}) & condicion(0)
+
+
+def _consulta_cursor(queryset, campos, cursor):
+    """(filas, direccion, valores): el queryset de la página, sin evaluar"""
+    direccion, valores = 'siguiente', None
+    if cursor:
+        direccion, valores = decodificar_cursor(cursor, queryset.model, campos)
+
+    orden = campos if direccion == 'siguiente' else _invertir(campos)
+    filas = queryset.order_by(*orden)
+    if valores is not None:
+        filas = filas.filter(_posteriores(orden, valores))
+    return filas, direccion, valores
+
+
+def _pagina_cursor(filas, campos, direccion, valores, por_pagina):
+    """Arma la PaginaCursor con las filas leídas (hasta por_pagina + 1)"""
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if direccion == 'anterior':
+        filas.reverse()
+
+    def clave(fila):
+        return [getattr(fila, campo.lstrip('-')) for campo in campos]
+
+    cursor_siguiente = cursor_anterior = None
+    if filas:
+        if hay_mas or direccion == 'anterior':
+            cursor_siguiente = codificar_cursor('siguiente', clave(filas[-1]))
+        if valores is not None and (hay_mas or direccion == 'siguiente'):
+            cursor_anterior = codificar_cursor('anterior', clave(filas[0]))
+    return PaginaCursor(filas, cursor_siguiente, cursor_anterior)
+
+
+def paginar_por_cursor(queryset, campos, cursor=None, por_pagina=12):
+    """
+    Retorna la PaginaCursor que sigue (o precede) al cursor dado.
+
+    `campos` es el orden completo y único, p. ej. ('-precio', '-id').
+    Lanza CursorInvalido si el cursor no se puede decodificar.
+    """
+    filas, direccion, valores = _consulta_cursor(queryset, campos, cursor)
+    return _pagina_cursor(list(filas[:por_pagina + 1]), campos, direccion, valores, por_pagina)
+
+
+async def apaginar_por_cursor(queryset, campos, cursor=None, por_pagina=12):
+    """paginar_por_cursor() con el ORM async"""
+    filas, direccion, valores = _consulta_cursor(queryset, campos, cursor)
+    filas = [fila async for fila in filas[:por_pagina + 1]]
+    return _pagina_cursor(filas, campos, direccion, valores, por_pagina)
+
+
+def _clave_total(queryset):
+    consulta = str(queryset.order_by().query)
+    return f'tienda:total:{hashlib.md5(consulta.encode()).hexdigest()}'
+
+
+def total_en_cache(queryset, timeout=TOTAL_TIMEOUT):
+    """COUNT(*) del queryset, guardado en caché por consulta (puede estar desactualizado)"""
+    return cache.get_or_set(_clave_total(queryset), queryset.count, timeout)
+
+
+async def atotal_en_cache(queryset, timeout=TOTAL_TIMEOUT):
+    """total_en_cache() con el ORM async"""
+    clave = _clave_total(queryset)
+    total = cache.get(clave)
+    if total is None:
+        total = await queryset.acount()
+        cache.set(clave, total, timeout)
+    return total
@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from . import ventas
+from .cache import invalidar_productos
+from .models import ItemPedido, Producto
+
+
+class StockInsuficiente(Exception):
+    """No hay stock suficiente para uno o más productos del carrito"""
+
+    def __init__(self, productos):
+        self.productos = productos
+        nombres = ', '.join(producto.nombre for producto in productos)
+        super().__init__(f'No hay stock suficiente de: {nombres}')
+
+
+class CarritoVacio(Exception):
+    """El carrito no tiene items para crear un pedido"""
+
+
+class _StockAgotado(Exception):
+    def __init__(self, cantidades):
+        self.cantidades = cantidades
+
+
+def crear_pedido(carrito, pedido):
+    """
+    Convierte el carrito en un pedido en una sola transacción.
+
+    Bloquea y valida el stock de todas las líneas en una consulta, crea los
+    ItemPedido con bulk_create y descuenta el stock con un único UPDATE
+    condicional, de modo que dos checkouts simultáneos no pueden vender más
+    unidades de las que hay, y suma el pedido a las ventas acumuladas
+    (tienda.ventas). La cantidad de consultas no depende de la cantidad de
+    líneas. Lanza StockInsuficiente si falta stock; en ese caso no
+    se guarda nada, y CarritoVacio si el carrito no tiene items.
+    """
+    try:
+        with transaction.atomic():
+            items = list(
+                carrito.items.select_related('producto')
+                .select_for_update(of=('producto',))
+                .order_by('producto_id')
+            )
+            if not items:
+                raise CarritoVacio()
+            faltantes = [item.producto for item in items if item.cantidad > item.producto.stock]
+            if faltantes:
+                raise StockInsuficiente(faltantes)
+
+            pedido.total = sum(item.cantidad * item.producto.precio for item in items)
+            pedido.save()
+
+            lineas = ItemPedido.objects.bulk_create([
+                ItemPedido(
+                    pedido=pedido,
+                    producto=item.producto,
+                    cantidad=item.cantidad,
+                    precio_unitario=item.producto.precio,
+                    subtotal=item.cantidad * item.producto.precio,
+                )
+                for item in items
+            ])
+            ventas.registrar_pedido(pedido, lineas)
+
+            # Descuento condicional: solo se actualizan las filas con stock suficiente
+            condicion = Q()
+            for item in items:
+                condicion |= Q(id=item.producto_id, stock__gte=item.cantidad)
+            actualizados = Producto.objects.filter(condicion).update(
+                stock=Case(*[
+                    When(id=item.producto_id, then=F('stock') - item.cantidad)
+                    for item in items
+                ]),
+                fecha_actualizacion=timezone.now(),
+            )
+            if actualizados != len(items):
+                # Otro checkout se llevó el stock entre la lectura y el UPDATE
+                # (motores sin bloqueo de filas, como SQLite)
+                raise _StockAgotado({item.producto_id: item.cantidad for item in items})
+
+            carrito.vaciar()
+            # El UPDATE de stock no envía señales: la página de detalle muestra el stock
+            producto_ids = [item.producto_id for item in items]
+            transaction.on_commit(lambda: invalidar_productos(producto_ids))
+    except _StockAgotado as agotado:
+        faltantes = [
+            producto for producto in Producto.objects.filter(id__in=agotado.cantidades)
+            if producto.stock < agotado.cantidades[producto.id]
+        ]
+        raise StockInsuficiente(faltantes) from None
+    return pedido
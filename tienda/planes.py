@@ -0,0 +1,152 @@
+"""
+Planes de ejecución de las consultas de cada vista (SQLite).
+
+`verificar()` hace una petición a cada vista, captura sus consultas con
+MedicionConsultas y corre EXPLAIN QUERY PLAN sobre cada SELECT, UPDATE y
+DELETE. Se marcan los recorridos completos de una tabla (SCAN sin índice) y
+los ordenamientos en B-tree temporales: señal de que falta un índice o de que
+la consulta dejó de usarlo. Lo usan el comando `verificar_planes` y los tests.
+"""
+import json
+from collections import namedtuple
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.urls import reverse
+
+from .instrumentacion import MedicionConsultas
+from .models import Carrito, Categoria, ItemCarrito, ItemPedido, Pedido, Producto
+from .paginacion import ORDENES_PRODUCTOS, codificar_cursor
+
+Problema = namedtuple('Problema', 'peticion sql detalle')
+
+# Tablas chicas por diseño, que se pueden recorrer completas
+TABLAS_PERMITIDAS = {'django_content_type', 'auth_permission'}
+
+DATOS_PEDIDO = {
+    'nombre_completo': 'Cliente de Prueba',
+    'email': 'cliente@example.com',
+    'telefono': '123456789',
+    'direccion': 'Calle Falsa 123',
+    'ciudad': 'Santiago',
+    'codigo_postal': '8320000',
+    'metodo_pago': 'transferencia',
+}
+
+
+def preparar_datos():
+    """Usuario (staff, para la exportación) con carrito y pedido, y un catálogo mínimo; retorna el usuario"""
+    usuario = User.objects.create_user('planes', password='clave-segura', is_staff=True)
+    categoria = Categoria.objects.create(nombre='Electrónicos')
+    productos = [
+        Producto.objects.create(
+            nombre=f'Cámara {i}', descripcion='Cámara compacta', precio=Decimal(1000 * (i + 1)),
+            categoria=categoria, imagen='productos/prueba.jpg', stock=100, destacado=i % 2 == 0,
+        )
+        for i in range(4)
+    ]
+    carrito = Carrito.objects.create(usuario=usuario)
+    for producto in productos[:2]:
+        ItemCarrito.objects.create(carrito=carrito, producto=producto, cantidad=1)
+    pedido = Pedido.objects.create(usuario=usuario, total=productos[0].precio, **DATOS_PEDIDO)
+    ItemPedido.objects.create(pedido=pedido, producto=productos[0], cantidad=1, precio_unitario=productos[0].precio)
+    return usuario
+
+
+def peticiones(usuario):
+    """(nombre, método, url, datos) de una visita a cada vista, en un orden que deja el carrito vacío al final"""
+    producto = Producto.objects.filter(activo=True).order_by('id').first()
+    items = list(ItemCarrito.objects.filter(carrito__usuario=usuario).order_by('id'))
+    pedido = Pedido.objects.filter(usuario=usuario).order_by('id').first()
+    lista = reverse('lista_productos')
+
+    resultado = [('home', 'get', reverse('home'), None)]
+    for orden in ORDENES_PRODUCTOS:
+        resultado += [
+            (f'lista_productos orden={orden}', 'get', lista, {'orden': orden}),
+            (f'lista_productos categoria orden={orden}', 'get', lista,
+             {'orden': orden, 'categoria': producto.categoria_id}),
+            (f'lista_productos cursor orden={orden}', 'get', lista, {
+                'orden': orden,
+                'cursor': codificar_cursor('siguiente', [
+                    getattr(producto, campo.lstrip('-')) for campo in ORDENES_PRODUCTOS[orden]
+                ]),
+            }),
+        ]
+    resultado += [
+        ('lista_productos busqueda', 'get', lista, {'q': producto.nombre.split()[0]}),
+        ('detalle_producto', 'get', reverse('detalle_producto', args=[producto.id]), None),
+        ('carrito', 'get', reverse('carrito'), None),
+        ('resumen_carrito', 'get', reverse('resumen_carrito'), None),
+        ('checkout', 'get', reverse('checkout'), None),
+        ('mis_pedidos', 'get', reverse('mis_pedidos'), None),
+        ('detalle_pedido', 'get', reverse('detalle_pedido', args=[pedido.id]), None),
+        ('exportar_pedidos', 'get', reverse('exportar_pedidos'), None),
+        ('exportar_pedidos fechas y estado', 'get', reverse('exportar_pedidos'), {
+            'formato': 'jsonl', 'desde': '2024-01-01', 'hasta': '2024-12-31', 'estado': 'pendiente',
+        }),
+        ('agregar_al_carrito', 'post_json', reverse('agregar_al_carrito'),
+         {'producto_id': producto.id, 'cantidad': 1}),
+        ('actualizar_carrito', 'post_json', reverse('actualizar_carrito'), {'item_id': items[0].id, 'cantidad': 3}),
+        ('eliminar_del_carrito', 'post_json', reverse('eliminar_del_carrito'), {'item_id': items[-1].id}),
+        ('confirmar_checkout', 'post', reverse('checkout'), DATOS_PEDIDO),
+    ]
+    return resultado
+
+
+def plan(sql, params, alias='default'):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [fila[-1] for fila in cursor.fetchall()]
+
+
+def problemas_del_plan(detalles):
+    """Pasos del plan que recorren una tabla completa u ordenan en un B-tree temporal"""
+    # Ordenar por relevancia las coincidencias del índice de búsqueda siempre
+    # requiere un ordenamiento: el puntaje se calcula en la consulta
+    busqueda = any('VIRTUAL TABLE' in detalle for detalle in detalles)
+    for detalle in detalles:
+        if detalle.startswith('SCAN ') and ' USING ' not in detalle and 'VIRTUAL TABLE' not in detalle:
+            if detalle.split()[1] not in TABLAS_PERMITIDAS:
+                yield detalle
+        elif 'TEMP B-TREE' in detalle and not (busqueda and 'ORDER BY' in detalle):
+            yield detalle
+
+
+def _consumir(respuesta):
+    """Genera el contenido de una respuesta en streaming: sus consultas se ejecutan recién ahí"""
+    if not respuesta.is_async:
+        for _ in respuesta.streaming_content:
+            pass
+        return
+
+    async def consumir():
+        async for _ in respuesta.streaming_content:
+            pass
+    async_to_sync(consumir)()
+
+
+def verificar(cliente, peticiones):
+    """Retorna (cantidad de consultas analizadas, lista de Problema)"""
+    analizadas, problemas = 0, []
+    for nombre, metodo, url, datos in peticiones:
+        # Sin caché, para que cada vista ejecute todas sus consultas
+        cache.clear()
+        with MedicionConsultas() as medicion:
+            if metodo == 'post_json':
+                respuesta = cliente.post(url, json.dumps(datos), content_type='application/json')
+            else:
+                respuesta = getattr(cliente, metodo)(url, datos)
+            if respuesta.streaming:
+                _consumir(respuesta)
+        if respuesta.status_code >= 400:
+            problemas.append(Problema(nombre, '', f'respuesta HTTP {respuesta.status_code}'))
+        for alias, sql, params, many in medicion.ejecutadas:
+            if many or not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            analizadas += 1
+            problemas += [Problema(nombre, sql, detalle) for detalle in problemas_del_plan(plan(sql, params, alias))]
+    return analizadas, problemas
@@ -0,0 +1,216 @@
+"""
+"Frecuentemente comprados juntos" a partir de los pedidos.
+
+Con las líneas de pedido se arma la matriz dispersa pedido×producto X (1 si
+el pedido incluye el producto) y C = XᵀX, la matriz producto×producto con la
+cantidad de pedidos en que aparecen juntos (en la diagonal, los pedidos de
+cada producto). El puntaje de un par es la similitud coseno
+C[i, j] / √(C[i, i]·C[j, j]), que no favorece a los productos que están en
+todos los pedidos. Los mejores vecinos de cada producto se guardan en
+ProductoRelacionado y la página de detalle los lee con una consulta.
+
+La matriz acumulada y el último pedido procesado se guardan en un archivo
+.npz: la actualización incremental solo lee los pedidos nuevos, suma su
+matriz y recalcula los productos afectados (los de esos pedidos y sus
+vecinos). Los pedidos cancelados no se cuentan; si se cancela uno ya
+procesado, se descuenta recién al recalcular todo (--completo).
+
+Requiere NumPy y SciPy, que son opcionales: sin ellos la tienda funciona y
+los relacionados salen de la misma categoría.
+"""
+import itertools
+import os
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Max
+
+from . import cache
+from .models import ItemPedido, Pedido, Producto, ProductoRelacionado
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Dependencias opcionales
+    np = sparse = None
+
+RELACIONADOS_POR_PRODUCTO = 8
+
+# Pares con menos pedidos en común son ruido, no una señal
+MINIMO_EN_COMUN = 2
+
+Vecinos = namedtuple('Vecinos', 'producto relacionado posicion puntaje en_comun')
+Estado = namedtuple('Estado', 'matriz ultimo_pedido')
+
+
+def disponible():
+    return np is not None and sparse is not None
+
+
+def coocurrencias(pedidos, productos, dimension):
+    """
+    Matriz producto×producto (dimension×dimension, indexada por id de
+    producto) con la cantidad de pedidos que incluyen cada par. `pedidos` y
+    `productos` son arrays alineados, uno por línea de pedido.
+    """
+    filas = np.unique(pedidos, return_inverse=True)[1]
+    compras = sparse.csr_matrix(
+        (np.ones(len(productos), dtype=np.int32), (filas, productos)),
+        shape=(filas.max() + 1 if len(filas) else 0, dimension),
+    )
+    # Un producto repetido en el mismo pedido cuenta una vez
+    compras.sum_duplicates()
+    compras.data[:] = 1
+    return (compras.T @ compras).tocsr()
+
+
+def vecinos(matriz, productos=None, validos=None, k=RELACIONADOS_POR_PRODUCTO, minimo=MINIMO_EN_COMUN):
+    """
+    Los k mejores vecinos de cada producto de `productos` (por defecto,
+    todos), ordenados por puntaje. `validos` es un array booleano por id de
+    producto; los que no lo sean no se recomiendan ni reciben recomendaciones.
+    """
+    frecuencia = matriz.diagonal().astype(np.float64)
+    if productos is None:
+        productos = np.arange(matriz.shape[0])
+    pares = matriz[productos].tocoo()
+    origen, destino, en_comun = productos[pares.row], pares.col, pares.data
+
+    mascara = (origen != destino) & (en_comun >= minimo)
+    if validos is not None:
+        mascara &= validos[origen] & validos[destino]
+    origen, destino, en_comun = origen[mascara], destino[mascara], en_comun[mascara]
+    puntaje = en_comun / np.sqrt(frecuencia[origen] * frecuencia[destino])
+
+    # Por producto, de mayor a menor puntaje (y por id para desempatar)
+    orden = np.lexsort((destino, -puntaje, origen))
+    origen, destino, en_comun, puntaje = origen[orden], destino[orden], en_comun[orden], puntaje[orden]
+
+    # Posición de cada par dentro de su producto
+    inicios = np.flatnonzero(np.r_[True, origen[1:] != origen[:-1]]) if len(origen) else np.array([], dtype=np.int64)
+    tamanos = np.diff(np.r_[inicios, len(origen)])
+    posicion = np.arange(len(origen)) - np.repeat(inicios, tamanos)
+
+    mejores = posicion < k
+    return Vecinos(origen[mejores], destino[mejores], posicion[mejores], puntaje[mejores], en_comun[mejores])
+
+
+def cargar_estado(ruta):
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta) as datos:
+        matriz = sparse.csr_matrix((datos['data'], datos['indices'], datos['indptr']), shape=tuple(datos['shape']))
+        return Estado(matriz, int(datos['ultimo_pedido']))
+
+
+def guardar_estado(ruta, estado):
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'wb') as archivo:
+        np.savez(
+            archivo, data=estado.matriz.data, indices=estado.matriz.indices, indptr=estado.matriz.indptr,
+            shape=np.array(estado.matriz.shape), ultimo_pedido=np.array(estado.ultimo_pedido),
+        )
+    # Reemplazo atómico: una ejecución interrumpida no deja un estado a medias
+    os.replace(temporal, ruta)
+
+
+def leer_lineas(desde_pedido, hasta_pedido, lote=100_000):
+    """(pedidos, productos) de las líneas de los pedidos no cancelados con id en (desde, hasta]"""
+    filas = (
+        ItemPedido.objects
+        .filter(pedido_id__gt=desde_pedido, pedido_id__lte=hasta_pedido)
+        .exclude(pedido__estado='cancelado')
+        .order_by()
+        .values_list('pedido_id', 'producto_id')
+        .iterator(chunk_size=lote)
+    )
+    partes = []
+    while True:
+        parte = list(itertools.islice(filas, lote))
+        if not parte:
+            break
+        partes.append(np.array(parte, dtype=np.int64))
+    lineas = np.concatenate(partes) if partes else np.empty((0, 2), dtype=np.int64)
+    return lineas[:, 0], lineas[:, 1]
+
+
+def ids_de_productos():
+    """Ids de todos los productos, ordenados"""
+    return np.sort(np.fromiter(
+        Producto.objects.order_by().values_list('id', flat=True).iterator(chunk_size=50_000), dtype=np.int64,
+    ))
+
+
+def guardar_relacionados(resultado, productos, lote=500):
+    """Reemplaza los relacionados de `productos` (ordenados) por los de `resultado`, por lotes"""
+    guardados = 0
+    for inicio in range(0, len(productos), lote):
+        ids = productos[inicio:inicio + lote]
+        # resultado está ordenado por producto: las filas del lote son un tramo
+        desde = np.searchsorted(resultado.producto, ids[0], side='left')
+        hasta = np.searchsorted(resultado.producto, ids[-1], side='right')
+        filas = [
+            ProductoRelacionado(
+                producto_id=int(producto), relacionado_id=int(relacionado), posicion=int(posicion),
+                puntaje=float(puntaje), pedidos_en_comun=int(en_comun),
+            )
+            for producto, relacionado, posicion, puntaje, en_comun in zip(
+                *(columna[desde:hasta] for columna in resultado)
+            )
+        ]
+        with transaction.atomic():
+            ProductoRelacionado.objects.filter(producto_id__in=ids.tolist()).delete()
+            ProductoRelacionado.objects.bulk_create(filas)
+        guardados += len(filas)
+    return guardados
+
+
+def actualizar(ruta_estado, completo=False, k=RELACIONADOS_POR_PRODUCTO, minimo=MINIMO_EN_COMUN):
+    """
+    Procesa los pedidos nuevos (o todos, con completo=True) y actualiza
+    ProductoRelacionado. Retorna un dict con lo que se hizo.
+    """
+    estado = None if completo else cargar_estado(ruta_estado)
+    desde = estado.ultimo_pedido if estado else 0
+    # Tope fijo: los pedidos que se creen durante el cálculo quedan para la próxima vez
+    hasta = Pedido.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+    pedidos, productos = leer_lineas(desde, hasta)
+
+    existentes = ids_de_productos()
+    dimension = int(max(
+        existentes.max() + 1 if len(existentes) else 0,
+        productos.max() + 1 if len(productos) else 0,
+        estado.matriz.shape[0] if estado else 0,
+    ))
+    nuevos = coocurrencias(pedidos, productos, dimension)
+    if estado:
+        matriz = estado.matriz.copy()
+        matriz.resize((dimension, dimension))
+        matriz = (matriz + nuevos).tocsr()
+        # Cambian los productos de los pedidos nuevos y, por el puntaje, los
+        # que los tienen como candidatos (con al menos `minimo` pedidos en común)
+        tocados = np.flatnonzero(np.diff(nuevos.indptr))
+        filas = matriz[tocados]
+        afectados = np.union1d(tocados, filas.indices[filas.data >= minimo])
+    else:
+        matriz = nuevos
+        # Todos, incluidos los que ya no tienen vecinos: así pierden los viejos
+        afectados = existentes
+
+    validos = np.zeros(dimension, dtype=bool)
+    validos[existentes] = True
+    afectados = np.sort(afectados[validos[afectados]])
+    guardados = 0
+    if len(afectados):
+        guardados = guardar_relacionados(vecinos(matriz, afectados, validos, k, minimo), afectados)
+        cache.invalidar('relacionados')
+
+    guardar_estado(ruta_estado, Estado(matriz, hasta))
+    return {
+        'lineas': len(productos),
+        'pedidos': len(np.unique(pedidos)),
+        'pares': matriz.nnz,
+        'afectados': len(afectados),
+        'relacionados': guardados,
+        'ultimo_pedido': hasta,
+    }
@@ -0,0 +1,146 @@
+"""
+Lecturas del catálogo y del historial de pedidos en réplicas de la base de datos.
+
+settings.TIENDA_REPLICAS lista los alias de DATABASES que son copias de
+'default'. `RouterReplicas` envía a una de ellas, al azar, las lecturas de
+los modelos de MODELOS; las escrituras y los demás modelos (sesiones,
+usuarios, carritos) van siempre a 'default'. Las lecturas siguen en
+'default':
+
+- dentro de una transacción de 'default', para leer lo mismo que se escribe;
+- en lo que queda de una petición después de escribir un modelo de MODELOS;
+- durante TIENDA_REPLICAS_RETRASO segundos después, con la cookie COOKIE
+  (el detalle del pedido al que redirige el checkout, el producto recién
+  editado en el admin);
+- fuera de las peticiones (comandos, shell).
+
+Con SQLite, `manage.py sincronizar_replicas` mantiene las copias con la API
+de respaldo de SQLite (ver `sincronizar`).
+"""
+import random
+import sqlite3
+from contextlib import closing
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import cache as cache_paginas
+
+# Modelos (app_label.modelo) que se leen de las réplicas
+MODELOS = {
+    'tienda.producto', 'tienda.categoria', 'tienda.productorelacionado', 'tienda.pedido', 'tienda.itempedido',
+    'tienda.ventaproductodia', 'tienda.ventacategoriadia',
+}
+
+COOKIE = 'tienda_primaria'
+
+# {'primaria': bool, 'escribio': bool} de la petición en curso; None fuera de las peticiones
+_peticion = ContextVar('tienda_replicas_peticion', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'TIENDA_REPLICAS', ()))
+
+
+class RouterReplicas:
+    def db_for_read(self, model, **hints):
+        alias = replicas()
+        if not alias or model._meta.label_lower not in MODELOS:
+            return None
+        peticion = _peticion.get()
+        if peticion is None or peticion['primaria'] or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(alias)
+
+    def db_for_write(self, model, **hints):
+        peticion = _peticion.get()
+        if peticion is not None and model._meta.label_lower in MODELOS:
+            peticion['primaria'] = peticion['escribio'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas tienen los mismos datos que 'default'
+        bases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las tablas llegan con las copias
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicasMiddleware:
+    """
+    Lleva la cuenta de las escrituras de cada petición para RouterReplicas
+    y fija la cookie que la mantiene en 'default' en las siguientes.
+    Sin TIENDA_REPLICAS no se usa.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        peticion = {'primaria': COOKIE in request.COOKIES, 'escribio': False}
+        token = _peticion.set(peticion)
+        try:
+            return self.marcar(self.get_response(request), peticion)
+        finally:
+            _peticion.reset(token)
+
+    async def __acall__(self, request):
+        # Un diccionario: lo que escriban los hilos de sync_to_async se ve aquí
+        peticion = {'primaria': COOKIE in request.COOKIES, 'escribio': False}
+        token = _peticion.set(peticion)
+        try:
+            return self.marcar(await self.get_response(request), peticion)
+        finally:
+            _peticion.reset(token)
+
+    def marcar(self, respuesta, peticion):
+        if peticion['escribio']:
+            respuesta.set_cookie(
+                COOKIE, '1', max_age=getattr(settings, 'TIENDA_REPLICAS_RETRASO', 10), httponly=True, samesite='Lax',
+            )
+        return respuesta
+
+
+def copiar(origen, destino):
+    """
+    Copia la base SQLite `origen` sobre `destino` con la API de respaldo: es
+    una foto consistente aunque se esté escribiendo en el origen, y las
+    conexiones abiertas a la copia (CONN_MAX_AGE) ven los datos nuevos, cosa
+    que no pasa si se reemplaza el archivo
+    """
+    with closing(sqlite3.connect(origen)) as base_origen, closing(sqlite3.connect(destino)) as base_destino:
+        # De una vez: por partes, cada escritura en el origen reinicia la copia
+        base_origen.backup(base_destino)
+
+
+def sincronizar():
+    """
+    Copia 'default' sobre cada réplica y después repite las invalidaciones
+    de caché anotadas hasta antes de copiar (ver tienda.cache): las páginas
+    y objetos que se regeneraron entretanto con datos de una réplica
+    atrasada se vuelven a generar. Retorna los alias copiados.
+    """
+    hasta = cache_paginas.ultima_invalidacion()
+    origen = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    alias = replicas()
+    for replica in alias:
+        copiar(origen, connections[replica].settings_dict['NAME'])
+    cache_paginas.repetir_invalidaciones(hasta)
+    return alias
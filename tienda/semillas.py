@@ -0,0 +1,186 @@
+"""
+Datos sintéticos para benchmarks, pruebas de carga y el catálogo de ejemplo.
+
+Todo se crea con bulk_create en lotes, sin señales: quien llame debe
+indexar la búsqueda (`busqueda.indexar`) si la necesita. Los valores salen
+del módulo `random`, así que `random.seed()` hace reproducible el resultado.
+"""
+import io
+import random
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test.utils import override_settings
+from PIL import Image, ImageDraw, ImageFont
+
+from .models import Categoria, ItemPedido, Pedido, Producto
+
+PALABRAS = [
+    'cámara', 'teléfono', 'señal', 'café', 'zapatilla', 'camiseta', 'lámpara', 'sábana',
+    'almohada', 'bicicleta', 'pelota', 'fútbol', 'auriculares', 'inalámbrico', 'batería',
+    'pantalla', 'cocina', 'jardín', 'montaña', 'acción', 'algodón', 'cuero', 'madera',
+    'acero', 'vidrio', 'eléctrico', 'portátil', 'clásico', 'deportivo', 'compacto',
+    'premium', 'básico', 'niño', 'mujer', 'hombre', 'invierno', 'verano', 'diseño',
+    'música', 'oficina', 'baño', 'mesa', 'silla', 'mochila', 'reloj', 'gafas', 'guantes',
+]
+
+MARCAS = [
+    f'{silaba}{sufijo}'
+    for silaba in ('Ñan', 'Ará', 'Lú', 'Pé', 'Ton', 'Mí', 'Sol', 'Cor')
+    for sufijo in ('tex', 'via', 'max', 'lux', 'ron', 'gen')
+]
+
+# Catálogo de ejemplo: (nombre, descripción)
+CATEGORIAS_EJEMPLO = [
+    ('Electrónicos', 'Productos electrónicos de última generación'),
+    ('Ropa', 'Ropa casual y deportiva'),
+    ('Hogar', 'Productos para el hogar y decoración'),
+    ('Deportes', 'Equipamiento deportivo y fitness'),
+]
+
+# (nombre, descripción, precio, precio anterior, índice de categoría, stock, destacado, texto de la imagen)
+PRODUCTOS_EJEMPLO = [
+    ('Smartphone Galaxy S23', 'Smartphone Samsung Galaxy S23 con 128GB, 8GB RAM, cámara de 50MP', 599990, 699990, 0, 15, True, 'Galaxy S23'),
+    ('Laptop HP Pavilion', 'Laptop HP Pavilion 15.6" Intel Core i5, 8GB RAM, 512GB SSD', 449990, 549990, 0, 8, True, 'HP Pavilion'),
+    ('Auriculares Sony WH-1000XM4', 'Auriculares inalámbricos con cancelación de ruido activa', 249990, 299990, 0, 20, False, 'Sony WH-1000XM4'),
+    ('Smart TV LG 55"', 'Smart TV LG 55" 4K Ultra HD con WebOS', 399990, 499990, 0, 5, True, 'LG Smart TV'),
+    ('Camiseta Básica', 'Camiseta 100% algodón, disponible en varios colores', 15990, 19990, 1, 50, False, 'Camiseta Básica'),
+    ('Jeans Clásicos', 'Jeans de alta calidad, corte clásico, disponible en varios talles', 39990, 49990, 1, 30, False, 'Jeans Clásicos'),
+    ('Chaqueta Deportiva', 'Chaqueta deportiva con tecnología de respiración', 59990, 79990, 1, 25, True, 'Chaqueta Deportiva'),
+    ('Zapatillas Running', 'Zapatillas para running con tecnología de amortiguación', 89990, 109990, 1, 15, True, 'Zapatillas Running'),
+    ('Cafetera Automática', 'Cafetera automática con molinillo integrado', 129990, 159990, 2, 12, False, 'Cafetera Automática'),
+    ('Lámpara de Mesa LED', 'Lámpara de mesa LED con luz ajustable', 29990, 39990, 2, 35, False, 'Lámpara LED'),
+    ('Juego de Sábanas', 'Juego de sábanas 100% algodón egipcio, 300 hilos', 39990, 49990, 2, 40, False, 'Sábanas'),
+    ('Almohadas Memory Foam', 'Almohadas con memory foam para mejor descanso', 19990, 24990, 2, 60, True, 'Almohadas Memory Foam'),
+    ('Bicicleta Estática', 'Bicicleta estática con monitor de ritmo cardíaco', 199990, 249990, 3, 8, True, 'Bicicleta Estática'),
+    ('Pesas Ajustables', 'Set de pesas ajustables de 2.5kg a 25kg', 89990, 109990, 3, 20, False, 'Pesas Ajustables'),
+    ('Pelota de Fútbol', 'Pelota de fútbol oficial, tamaño 5', 15990, 19990, 3, 45, False, 'Pelota Fútbol'),
+    ('Yoga Mat Premium', 'Mat de yoga premium, antideslizante, 6mm de grosor', 12990, 15990, 3, 30, False, 'Yoga Mat'),
+]
+
+LOTE = 2000
+
+
+@contextmanager
+def entorno_aislado():
+    """
+    Reemplaza la base de datos 'default' por una temporal (migrada y vacía) y la
+    caché por una local mientras dure el bloque; al salir se destruye. En SQLite
+    la base es un archivo en disco para que la compartan varios hilos.
+    """
+    directorio = tempfile.TemporaryDirectory(prefix='tienda_')
+    nombre_original = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = str(Path(directorio.name) / 'tienda.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            # Caché propia: no leer ni invalidar páginas de la base real
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'tienda-aislada'}},
+        ):
+            yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+        directorio.cleanup()
+
+
+def crear_imagen_dummy(texto, ancho=300, alto=300):
+    """JPEG gris con el texto centrado (sin Django: se usa desde un pool de procesos)"""
+    imagen = Image.new('RGB', (ancho, alto), color=(240, 240, 240))
+    draw = ImageDraw.Draw(imagen)
+    try:
+        font = ImageFont.truetype('arial.ttf', 20)
+    except OSError:
+        font = ImageFont.load_default()
+
+    bbox = draw.textbbox((0, 0), texto, font=font)
+    x = (ancho - (bbox[2] - bbox[0])) // 2
+    y = (alto - (bbox[3] - bbox[1])) // 2
+    draw.text((x, y), texto, fill=(100, 100, 100), font=font)
+
+    buffer = io.BytesIO()
+    imagen.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def sembrar_categorias(cantidad):
+    return Categoria.objects.bulk_create([
+        Categoria(nombre=f'{random.choice(PALABRAS).capitalize()} {i}', descripcion=' '.join(random.sample(PALABRAS, 5)))
+        for i in range(cantidad)
+    ])
+
+
+def nuevo_producto(categoria_id, imagen='productos/benchmark.jpg'):
+    precio = random.randint(1_000, 500_000)
+    return Producto(
+        nombre=f"{' '.join(random.sample(PALABRAS, 3)).capitalize()} {random.choice(MARCAS)}",
+        descripcion=' '.join(random.choices(PALABRAS, k=20)),
+        precio=Decimal(precio),
+        precio_anterior=Decimal(precio * 12 // 10) if random.random() < 0.2 else None,
+        categoria_id=categoria_id,
+        imagen=imagen,
+        stock=random.randint(0, 500),
+        destacado=random.random() < 0.05,
+    )
+
+
+def sembrar_productos(categorias, cantidad):
+    """Crea `cantidad` productos repartidos entre las categorías, en lotes de LOTE"""
+    ids = [categoria.id for categoria in categorias]
+    Producto.objects.bulk_create(
+        (nuevo_producto(random.choice(ids)) for _ in range(cantidad)),
+        batch_size=LOTE,
+    )
+
+
+def sembrar_usuarios(cantidad, clave, prefijo='cliente'):
+    """Usuarios `<prefijo>0`..`<prefijo>N-1`, todos con la misma clave"""
+    clave = make_password(clave)
+    return User.objects.bulk_create(
+        [User(username=f'{prefijo}{i}', email=f'{prefijo}{i}@example.com', password=clave) for i in range(cantidad)],
+        batch_size=LOTE,
+    )
+
+
+def sembrar_pedidos(usuarios, cantidad, max_lineas=4):
+    """Pedidos históricos de los usuarios, con 1 a max_lineas productos cada uno"""
+    productos = list(Producto.objects.values_list('id', 'precio'))
+    estados = [estado for estado, _ in Pedido.ESTADO_CHOICES]
+    for inicio in range(0, cantidad, LOTE):
+        pedidos, lineas = [], []
+        for _ in range(min(LOTE, cantidad - inicio)):
+            usuario = random.choice(usuarios)
+            elegidos = random.sample(productos, random.randint(1, min(max_lineas, len(productos))))
+            items = [
+                ItemPedido(producto_id=producto_id, cantidad=cantidad_item, precio_unitario=precio,
+                           subtotal=cantidad_item * precio)
+                for producto_id, precio in elegidos
+                for cantidad_item in [random.randint(1, 3)]
+            ]
+            pedidos.append(Pedido(
+                usuario=usuario,
+                estado=random.choice(estados),
+                total=sum(item.subtotal for item in items),
+                nombre_completo=usuario.username,
+                email=usuario.email,
+                telefono='123456789',
+                direccion='Calle Falsa 123',
+                ciudad='Santiago',
+                codigo_postal='8320000',
+                pagado=True,
+            ))
+            lineas.append(items)
+        Pedido.objects.bulk_create(pedidos)
+        for pedido, items in zip(pedidos, lineas):
+            for item in items:
+                item.pedido = pedido
+        ItemPedido.objects.bulk_create([item for items in lineas for item in items], batch_size=LOTE)
@@ -0,0 +1,99 @@
+from functools import partial
+
+from django.db import transaction
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import busqueda, cache, carrito_sesion, catalogo, imagenes, ventas
+from .models import Carrito, Categoria, Pedido, Producto
+
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, raw=False, **kwargs):
+    """Mantiene el índice de búsqueda al día al guardar un producto"""
+    if raw:
+        return
+    busqueda.indexar([(instance.id, instance.nombre, instance.descripcion, instance.categoria.nombre)])
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto(sender, instance, **kwargs):
+    busqueda.desindexar([instance.id])
+
+
+@receiver(pre_delete, sender=Producto)
+def anotar_carritos_del_producto(sender, instance, **kwargs):
+    # Los items del producto se borran en cascada, sin ItemCarrito.delete(): anotar sus carritos
+    instance._carritos_afectados = list(
+        Carrito.objects.filter(items__producto=instance).values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Producto)
+def recalcular_carritos_del_producto(sender, instance, **kwargs):
+    carritos = getattr(instance, '_carritos_afectados', None)
+    if carritos:
+        Carrito.recalcular_totales(Carrito.objects.filter(id__in=carritos))
+
+
+@receiver(post_save, sender=Categoria)
+def reindexar_categoria(sender, instance, created=False, raw=False, **kwargs):
+    """El nombre de la categoría forma parte del índice de cada producto"""
+    if raw or created or not instance.nombre_cambiado:
+        return
+    busqueda.indexar(instance.productos.all())
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_paginas_producto(sender, instance, **kwargs):
+    etiquetas = ['catalogo', f'producto:{instance.id}', f'categoria:{instance.categoria_id}']
+    categoria_anterior = getattr(instance, '_categoria_guardada', None)
+    if categoria_anterior is not None and categoria_anterior != instance.categoria_id:
+        etiquetas.append(f'categoria:{categoria_anterior}')
+        cache.olvidar_categoria_de_producto(instance.id)
+    # Después del commit: si no, otra petición podría leer la fila vieja y
+    # guardarla en la caché de objetos con la versión nueva
+    transaction.on_commit(partial(cache.invalidar, *etiquetas))
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_paginas_categoria(sender, instance, **kwargs):
+    # Cada producto guardado en la caché lleva su categoría
+    transaction.on_commit(partial(
+        cache.invalidar, 'catalogo', f'categoria:{instance.id}', catalogo.ETIQUETA_CATEGORIAS,
+        catalogo.ETIQUETA_PRODUCTOS,
+    ))
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_save, sender=Categoria)
+def generar_derivadas(sender, instance, raw=False, **kwargs):
+    """Genera las versiones reducidas cuando la imagen es nueva"""
+    if raw or not instance.imagen or imagenes.vigentes(instance):
+        return
+    transaction.on_commit(partial(imagenes.encolar, sender, instance.imagen.name))
+
+
+@receiver(pre_delete, sender=Pedido)
+def descontar_ventas_del_pedido(sender, instance, **kwargs):
+    """Saca de las ventas acumuladas el pedido que se borra (los cancelados ya no cuentan)"""
+    # pre_delete corre dentro de la transacción del borrado y antes de borrar sus líneas en cascada
+    if getattr(instance, '_estado_guardado', instance.estado) != 'cancelado':
+        ventas.registrar_pedido(instance, signo=-1)
+
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+def invalidar_resumen_pedidos(sender, instance, raw=False, **kwargs):
+    # Después del commit, para que nadie vuelva a guardar el resumen viejo entretanto
+    transaction.on_commit(partial(Pedido.invalidar_resumen_de_usuario, instance.usuario_id))
+
+
+@receiver(user_logged_in)
+def fusionar_carrito_de_sesion(sender, request, user, **kwargs):
+    # Lo que se agregó antes de iniciar sesión pasa al carrito del usuario
+    if request is not None and hasattr(request, 'session'):
+        carrito_sesion.fusionar(request.session, user)
@@ -0,0 +1,53 @@
+"""
+Perfiles de SQLite para DATABASES (TIENDA_SQLITE_PERFIL en settings.py).
+
+'basico' es la configuración de Django por defecto: journal_mode=DELETE y
+una conexión nueva por petición.
+
+'afinado' usa el motor `tienda.sqlite`, el de Django con dos agregados: al
+conectar aplica los PRAGMA de OPTIONS['pragmas'] (WAL, para que las lecturas
+no esperen a las escrituras, synchronous=NORMAL, mmap, caché de páginas y
+busy_timeout) y empieza las transacciones con BEGIN IMMEDIATE
+(OPTIONS['transaction_mode'], como en Django 5.1). Con un BEGIN a secas, una
+transacción que lee y después escribe (crear_pedido, el carrito) falla de
+inmediato con "database is locked" si otra escribió entre medio, sin esperar
+busy_timeout; con IMMEDIATE toma el bloqueo de escritura al empezar y las
+demás esperan su turno. Las conexiones se reutilizan entre peticiones
+(CONN_MAX_AGE) para no repetir los PRAGMA en cada una.
+
+`manage.py benchmark_sqlite` compara los dos perfiles.
+"""
+import copy
+
+PERFILES = {
+    'basico': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {},
+    },
+    'afinado': {
+        'ENGINE': 'tienda.sqlite',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                # Con WAL, NORMAL no arriesga la integridad: solo las últimas transacciones si se corta la luz
+                'synchronous': 'NORMAL',
+                # Milisegundos que una escritura espera a otra antes de "database is locked"
+                'busy_timeout': 10000,
+                # Negativo: en KiB (64 MiB por conexión)
+                'cache_size': -64000,
+                'mmap_size': 256 * 1024 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        },
+    },
+}
+
+
+def configuracion(nombre, perfil='afinado'):
+    """La entrada de DATABASES para el archivo `nombre` con el perfil dado"""
+    if perfil not in PERFILES:
+        raise ValueError(f"Perfil de SQLite desconocido: {perfil} (opciones: {', '.join(PERFILES)})")
+    return {'NAME': nombre, **copy.deepcopy(PERFILES[perfil])}
@@ -0,0 +1,35 @@
+"""El motor SQLite de Django con PRAGMA al conectar y BEGIN IMMEDIATE (ver tienda.sqlite)"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# Opciones de OPTIONS que no son de sqlite3.connect()
+PROPIAS = ('pragmas', 'transaction_mode')
+
+MODOS_TRANSACCION = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        opciones = self.settings_dict['OPTIONS']
+        self.pragmas = dict(opciones.get('pragmas', {}))
+        self.modo_transaccion = (opciones.get('transaction_mode') or 'DEFERRED').upper()
+        if self.modo_transaccion not in MODOS_TRANSACCION:
+            raise ImproperlyConfigured(
+                f"transaction_mode debe ser uno de {', '.join(MODOS_TRANSACCION)}, no {self.modo_transaccion}"
+            )
+
+    def get_connection_params(self):
+        parametros = super().get_connection_params()
+        for opcion in PROPIAS:
+            parametros.pop(opcion, None)
+        return parametros
+
+    def get_new_connection(self, conn_params):
+        conexion = super().get_new_connection(conn_params)
+        for pragma, valor in self.pragmas.items():
+            conexion.execute(f'PRAGMA {pragma} = {valor}').close()
+        return conexion
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.modo_transaccion}')
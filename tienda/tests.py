@@ -1,3 +1,2006 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import ConnectionHandler, OperationalError, connection, router, transaction
+from django.db.models import Max, Sum
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import (
+    AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from . import (
+    busqueda, cache as cache_paginas, estaticos, imagenes, instrumentacion, operaciones_carrito, planes,
+    recomendaciones, replicas, ventas,
+)
+from .management.commands.poblar_catalogo import Command as PoblarCatalogo
+from .models import (
+    Carrito, Categoria, ItemCarrito, ItemPedido, Pedido, Producto, ProductoRelacionado, VentaCategoriaDia,
+    VentaProductoDia,
+)
+from .middleware import MedicionConsultasMiddleware
+from .paginacion import ORDENES_PRODUCTOS, CursorInvalido, codificar_cursor, paginar_por_cursor
+from .pedidos import StockInsuficiente, crear_pedido
+from .sqlite import configuracion as configuracion_sqlite
+
+
+def crear_producto(categoria, nombre='Producto', precio=1000, stock=10, **kwargs):
+    return Producto.objects.create(
+        nombre=nombre,
+        descripcion=f'Descripción de {nombre}',
+        precio=Decimal(precio),
+        categoria=categoria,
+        imagen=kwargs.pop('imagen', 'productos/prueba.jpg'),
+        stock=stock,
+        **kwargs
+    )
+
+
+def nuevo_pedido(usuario):
+    return Pedido(
+        usuario=usuario,
+        nombre_completo='Cliente de Prueba',
+        email='cliente@example.com',
+        telefono='123456789',
+        direccion='Calle Falsa 123',
+        ciudad='Santiago',
+        codigo_postal='8320000',
+        pagado=True,
+    )
+
+
+def esperar(funcion, *args, **kwargs):
+    """Llama a un método de AsyncClient desde un test síncrono"""
+    async def llamar():
+        return await funcion(*args, **kwargs)
+    return async_to_sync(llamar)()
+
+
+def leer_streaming(respuesta):
+    """Contenido de una StreamingHttpResponse, con iterador síncrono o async"""
+    if not respuesta.is_async:
+        return b''.join(respuesta.streaming_content)
+
+    async def leer():
+        return b''.join([bloque async for bloque in respuesta.streaming_content])
+    return async_to_sync(leer)()
+
+
+def llenar_carrito(usuario, productos, cantidad=1):
+    carrito = Carrito.objects.create(usuario=usuario)
+    for producto in productos:
+        ItemCarrito.objects.create(carrito=carrito, producto=producto, cantidad=cantidad)
+    carrito.refresh_from_db()
+    return carrito
+
+
+class CrearPedidoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.categoria = Categoria.objects.create(nombre='Electrónicos')
+        cls.productos = [
+            crear_producto(cls.categoria, f'Producto {i}', precio=1000 * (i + 1), stock=5)
+            for i in range(5)
+        ]
+
+    def test_crea_items_y_descuenta_stock(self):
+        carrito = llenar_carrito(self.usuario, self.productos[:2], cantidad=2)
+
+        pedido = crear_pedido(carrito, nuevo_pedido(self.usuario))
+
+        self.assertEqual(pedido.total, Decimal('6000'))
+        self.assertEqual(
+            sorted(pedido.items.values_list('producto_id', 'cantidad', 'subtotal')),
+            [(self.productos[0].id, 2, Decimal('2000')), (self.productos[1].id, 2, Decimal('4000'))],
+        )
+        self.assertEqual(
+            list(Producto.objects.filter(id__in=[p.id for p in self.productos[:2]]).values_list('stock', flat=True)),
+            [3, 3],
+        )
+        carrito.refresh_from_db()
+        self.assertEqual(carrito.cantidad_items, 0)
+        self.assertFalse(carrito.items.exists())
+
+    def test_stock_insuficiente_no_guarda_nada(self):
+        carrito = llenar_carrito(self.usuario, self.productos[:2], cantidad=2)
+        Producto.objects.filter(id=self.productos[1].id).update(stock=1)
+
+        with self.assertRaises(StockInsuficiente) as contexto:
+            crear_pedido(carrito, nuevo_pedido(self.usuario))
+
+        self.assertEqual([p.id for p in contexto.exception.productos], [self.productos[1].id])
+        self.assertFalse(Pedido.objects.exists())
+        self.assertEqual(Producto.objects.get(id=self.productos[0].id).stock, 5)
+        self.assertEqual(carrito.items.count(), 2)
+
+    def test_consultas_no_dependen_de_las_lineas(self):
+        conteos = []
+        for cantidad_lineas in (1, 5):
+            carrito = llenar_carrito(
+                User.objects.create_user(f'cliente{cantidad_lineas}'),
+                self.productos[:cantidad_lineas],
+            )
+            with CaptureQueriesContext(connection) as consultas:
+                crear_pedido(carrito, nuevo_pedido(carrito.usuario))
+            conteos.append(len(consultas))
+        self.assertEqual(conteos[0], conteos[1])
+
+
+class CheckoutConcurrenteTests(TransactionTestCase):
+    """Varios checkouts simultáneos sobre el mismo producto no deben sobrevender"""
+
+    hilos = 8
+    stock_inicial = 5
+
+    def test_no_se_vende_mas_que_el_stock(self):
+        categoria = Categoria.objects.create(nombre='Ofertas')
+        producto = crear_producto(categoria, 'Producto Escaso', stock=self.stock_inicial)
+        carritos = [
+            llenar_carrito(User.objects.create_user(f'comprador{i}'), [producto])
+            for i in range(self.hilos)
+        ]
+
+        barrera = threading.Barrier(self.hilos)
+        resultados = []
+
+        def comprar(carrito):
+            try:
+                barrera.wait()
+                for _ in range(100):
+                    try:
+                        crear_pedido(carrito, nuevo_pedido(carrito.usuario))
+                        resultados.append('vendido')
+                        return
+                    except OperationalError:
+                        # SQLite rechaza escrituras concurrentes ("database is locked"): reintentar
+                        time.sleep(0.01)
+                    except StockInsuficiente:
+                        resultados.append('sin stock')
+                        return
+                resultados.append('bloqueado')
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar, args=(carrito,)) for carrito in carritos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        producto.refresh_from_db()
+        vendidas = sum(ItemPedido.objects.filter(producto=producto).values_list('cantidad', flat=True))
+        self.assertEqual(resultados.count('vendido'), self.stock_inicial)
+        self.assertEqual(resultados.count('sin stock'), self.hilos - self.stock_inicial)
+        self.assertEqual(vendidas, self.stock_inicial)
+        self.assertEqual(producto.stock, 0)
+        # Las ventas acumuladas se incrementan con F(): ningún checkout pisa a otro
+        self.assertEqual(
+            VentaProductoDia.objects.get(producto=producto).unidades, self.stock_inicial,
+        )
+
+
+class PerfilSqliteTests(unittest.TestCase):
+    """El motor tienda.sqlite sobre un archivo (los tests usan una base en memoria)"""
+
+    def conexiones(self, **opciones):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = configuracion_sqlite(str(Path(directorio.name) / 'prueba.sqlite3'))
+        configuracion['OPTIONS'].update(opciones)
+        conexiones = ConnectionHandler({'default': configuracion})
+        with conexiones['default'].cursor() as cursor:
+            cursor.execute('CREATE TABLE contador (valor integer)')
+            cursor.execute('INSERT INTO contador VALUES (0)')
+        conexiones.close_all()
+        return conexiones
+
+    def en_hilos(self, conexiones, hilos, funcion):
+        """Ejecuta `funcion(conexión)` en varios hilos a la vez; retorna los errores de la base de datos"""
+        errores = []
+
+        def ejecutar():
+            conexion = conexiones['default']
+            try:
+                funcion(conexion)
+            except OperationalError as error:
+                errores.append(error)
+            finally:
+                conexion.close()
+
+        hilos = [threading.Thread(target=ejecutar) for _ in range(hilos)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return errores
+
+    def leer_y_escribir(self, conexion, antes_de_escribir=lambda: None):
+        conexion.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT valor FROM contador')
+            valor = cursor.fetchone()[0]
+            antes_de_escribir()
+            cursor.execute('UPDATE contador SET valor = %s', [valor + 1])
+        conexion.commit()
+        conexion.set_autocommit(True)
+
+    def valor(self, conexiones):
+        with conexiones['default'].cursor() as cursor:
+            cursor.execute('SELECT valor FROM contador')
+            return cursor.fetchone()[0]
+
+    def test_aplica_los_pragmas_al_conectar(self):
+        conexiones = self.conexiones()
+        with conexiones['default'].cursor() as cursor:
+            for pragma, esperado in [('journal_mode', 'wal'), ('synchronous', 1), ('busy_timeout', 10000)]:
+                cursor.execute(f'PRAGMA {pragma}')
+                self.assertEqual(cursor.fetchone()[0], esperado)
+        conexiones.close_all()
+
+    def test_las_transacciones_que_leen_y_escriben_esperan_su_turno(self):
+        conexiones = self.conexiones()
+        barrera = threading.Barrier(4)
+
+        def incrementar(conexion):
+            barrera.wait()
+            for _ in range(20):
+                self.leer_y_escribir(conexion, lambda: time.sleep(0.001))
+
+        self.assertEqual(self.en_hilos(conexiones, 4, incrementar), [])
+        self.assertEqual(self.valor(conexiones), 80)
+        conexiones.close_all()
+
+    def test_con_begin_diferido_falla_sin_esperar(self):
+        # Las dos leen antes de que alguna escriba: la segunda en escribir ya no puede
+        conexiones = self.conexiones(transaction_mode='DEFERRED')
+        barrera = threading.Barrier(2)
+        errores = self.en_hilos(conexiones, 2, partial(self.leer_y_escribir, antes_de_escribir=barrera.wait))
+        self.assertEqual(len(errores), 1)
+        self.assertIn('locked', str(errores[0]))
+        self.assertEqual(self.valor(conexiones), 1)
+        conexiones.close_all()
+
+
+@override_settings(TIENDA_REPLICAS=['replica1', 'replica2'])
+class ReplicasTests(SimpleTestCase):
+    databases = {'default'}
+
+    def pedir(self, vista, **cookies):
+        """Pasa una petición por ReplicasMiddleware hasta `vista`"""
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return replicas.ReplicasMiddleware(vista)(request)
+
+    def test_lee_el_catalogo_de_las_replicas(self):
+        leidas = []
+
+        def vista(request):
+            leidas.extend(router.db_for_read(modelo) for modelo in (Producto, Categoria, Pedido, User, Carrito))
+            leidas.append(router.db_for_write(Producto))
+            return HttpResponse()
+
+        self.pedir(vista)
+        self.assertIn(leidas[0], ['replica1', 'replica2'])
+        self.assertIn(leidas[2], ['replica1', 'replica2'])
+        self.assertEqual(leidas[3:], ['default', 'default', 'default'])
+        # Fuera de las peticiones, todo en la primaria
+        self.assertEqual(router.db_for_read(Producto), 'default')
+
+    def test_despues_de_escribir_se_queda_en_la_primaria(self):
+        leidas = []
+
+        def vista(request):
+            leidas.append(router.db_for_read(Pedido))
+            # Los carritos no se leen de las réplicas: escribirlos no cambia nada
+            router.db_for_write(ItemCarrito)
+            leidas.append(router.db_for_read(Pedido))
+            router.db_for_write(Pedido)
+            leidas.append(router.db_for_read(Producto))
+            return HttpResponse()
+
+        respuesta = self.pedir(vista)
+        self.assertNotEqual(leidas[0], 'default')
+        self.assertNotEqual(leidas[1], 'default')
+        self.assertEqual(leidas[2], 'default')
+        self.assertEqual(respuesta.cookies[replicas.COOKIE]['max-age'], 10)
+
+        # La petición siguiente, con la cookie, también
+        leidas.clear()
+        self.pedir(lambda request: leidas.append(router.db_for_read(Producto)) or HttpResponse(), tienda_primaria='1')
+        self.assertEqual(leidas, ['default'])
+
+    def test_en_una_transaccion_lee_de_la_primaria(self):
+        def vista(request):
+            with transaction.atomic():
+                return HttpResponse(router.db_for_read(Producto))
+
+        self.assertEqual(self.pedir(vista).content, b'default')
+
+    def test_vistas_async(self):
+        async def vista(request):
+            await sync_to_async(router.db_for_write)(Pedido)
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        respuesta = async_to_sync(replicas.ReplicasMiddleware(vista))(request)
+        self.assertIn(replicas.COOKIE, respuesta.cookies)
+
+    def test_no_migra_las_replicas(self):
+        self.assertIs(router.allow_migrate('replica1', 'tienda'), False)
+        self.assertIs(router.allow_migrate('default', 'tienda'), True)
+
+    def test_copiar_y_repetir_invalidaciones(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        origen, destino = (str(Path(directorio.name) / nombre) for nombre in ('primaria.sqlite3', 'replica.sqlite3'))
+        with closing(sqlite3.connect(origen)) as base:
+            base.execute('CREATE TABLE t (valor integer)')
+            base.execute('INSERT INTO t VALUES (7)')
+            base.commit()
+        replicas.copiar(origen, destino)
+        with closing(sqlite3.connect(destino)) as base:
+            self.assertEqual(base.execute('SELECT valor FROM t').fetchall(), [(7,)])
+
+        cache.clear()
+        cache_paginas.invalidar('producto:1')
+        hasta = cache_paginas.ultima_invalidacion()
+        cache_paginas.invalidar('producto:2')
+        version_1, version_2 = cache_paginas.versiones(['producto:1', 'producto:2'])
+        # Solo las anotadas antes de copiar, y una sola vez
+        cache_paginas.repetir_invalidaciones(hasta)
+        cache_paginas.repetir_invalidaciones(hasta)
+        self.assertEqual(cache_paginas.versiones(['producto:1', 'producto:2']), [version_1 + 1, version_2])
+
+
+# Máximo de consultas SQL por vista, con un usuario autenticado (sesión y
+# usuario incluidos) y con la caché vacía. Cada URL de tienda/urls.py
+# debe tener su presupuesto.
+PRESUPUESTO_CONSULTAS = {
+    # Con la caché vacía, los ids (de la página, de los destacados, de los
+    # relacionados y de la categoría si faltan relacionados) y los objetos de
+    # tienda.catalogo se consultan por separado, más la agregación de
+    # Last-Modified y, en el detalle, la categoría del producto para el ETag
+    # (tienda.condicional)
+    'home': 6,
+    'lista_productos': 7,
+    'detalle_producto': 8,
+    'carrito': 4,
+    'resumen_carrito': 4,
+    # El item se lee bloqueado antes de sumarle (views.sumar_al_carrito)
+    'agregar_al_carrito': 11,
+    # Incluyen la sesión y el usuario: el item se busca en el carrito de quien lo pide
+    'actualizar_carrito': 8,
+    'eliminar_del_carrito': 8,
+    # Con un lote que inserta, actualiza y elimina: no depende de cuántas operaciones traiga
+    'operaciones_carrito': 13,
+    # Incluye las ventas acumuladas: crear las filas que falten y sumarles con F(), por producto y por categoría
+    'checkout': 17,
+    'mis_pedidos': 4,
+    'detalle_pedido': 4,
+    # Los pedidos y, por cada bloque de exportacion.LOTE pedidos, sus líneas
+    'exportar_pedidos': 4,
+}
+
+
+@override_settings(TIENDA_MEDIR_CONSULTAS=True)
+class MedicionConsultasTests(TestCase):
+    """MedicionConsultasMiddleware con vistas síncronas y async"""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_producto(Categoria.objects.create(nombre='Medidas'))
+
+    def setUp(self):
+        instrumentacion.reiniciar()
+        self.addCleanup(instrumentacion.reiniciar)
+
+    def test_vista_sincrona(self):
+        def vista(request):
+            Producto.objects.count()
+            list(Categoria.objects.all())
+            return HttpResponse()
+
+        middleware = MedicionConsultasMiddleware(vista)
+        self.assertFalse(iscoroutinefunction(middleware))
+        respuesta = middleware(RequestFactory().get('/medir/'))
+        self.assertEqual(respuesta['X-Consultas-SQL'], '2')
+        self.assertTrue(respuesta['Server-Timing'].startswith('db;desc="2 consultas";dur='))
+        self.assertEqual(instrumentacion.estadisticas()['/medir/']['consultas'], 2)
+
+    def test_vista_async(self):
+        async def vista(request):
+            await Producto.objects.acount()
+            [categoria async for categoria in Categoria.objects.all()]
+            return HttpResponse()
+
+        middleware = MedicionConsultasMiddleware(vista)
+        # Sin adaptar la cadena a síncrona: el middleware también es async
+        self.assertTrue(iscoroutinefunction(middleware))
+        respuesta = async_to_sync(middleware)(RequestFactory().get('/medir/'))
+        self.assertEqual(respuesta['X-Consultas-SQL'], '2')
+        self.assertEqual(instrumentacion.estadisticas()['/medir/']['max_consultas'], 2)
+
+    def test_en_la_pila_completa(self):
+        respuesta = self.client.get(reverse('lista_productos'))
+        self.assertGreater(int(respuesta['X-Consultas-SQL']), 0)
+        # Sin la página en caché, para que la vista consulte
+        cache.clear()
+        respuesta = esperar(self.async_client.get, reverse('lista_productos'))
+        self.assertGreater(int(respuesta['X-Consultas-SQL']), 0)
+        self.assertEqual(instrumentacion.estadisticas()['lista_productos']['peticiones'], 2)
+
+
+class PresupuestoConsultasTests(TestCase):
+    """
+    Cada vista debe mantenerse dentro de su presupuesto de consultas y ese
+    número no debe crecer con el tamaño del carrito, los pedidos o el catálogo.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('comprador', password='clave-segura')
+        self.client.force_login(self.usuario)
+        self.categorias = [Categoria.objects.create(nombre=f'Categoría {i}') for i in range(2)]
+        self.productos = []
+        self.agregar_productos(3)
+        self.carrito = Carrito.objects.create(usuario=self.usuario)
+        self.agregar_al_carrito(2)
+        self.pedido = self.crear_pedido(2)
+
+    def agregar_productos(self, cantidad):
+        inicio = len(self.productos)
+        for i in range(inicio, inicio + cantidad):
+            self.productos.append(crear_producto(
+                self.categorias[i % 2], f'Producto {i}', precio=1000 + i, stock=100, destacado=True,
+            ))
+
+    def agregar_al_carrito(self, cantidad):
+        en_carrito = set(self.carrito.items.values_list('producto_id', flat=True))
+        nuevos = [p for p in self.productos if p.id not in en_carrito][:cantidad]
+        if len(nuevos) < cantidad:
+            self.agregar_productos(cantidad - len(nuevos))
+            nuevos = [p for p in self.productos if p.id not in en_carrito][:cantidad]
+        for producto in nuevos:
+            ItemCarrito.objects.create(carrito=self.carrito, producto=producto, cantidad=1)
+
+    def crear_pedido(self, lineas):
+        pedido = nuevo_pedido(self.usuario)
+        pedido.total = 0
+        pedido.save()
+        for producto in self.productos[:lineas]:
+            ItemPedido.objects.create(pedido=pedido, producto=producto, cantidad=1, precio_unitario=producto.precio)
+        return pedido
+
+    def contar(self, metodo, url, datos=None):
+        # Se mide en frío: sin totales ni resúmenes guardados de la petición anterior
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            if metodo == 'post_json':
+                respuesta = self.client.post(url, json.dumps(datos), content_type='application/json')
+            elif metodo == 'post':
+                respuesta = self.client.post(url, datos)
+            else:
+                respuesta = self.client.get(url, datos)
+            if respuesta.streaming:
+                leer_streaming(respuesta)
+        self.assertLess(respuesta.status_code, 400, url)
+        return len(consultas)
+
+    def assertConsultasConstantes(self, nombre, peticion, crecer):
+        """La petición cabe en el presupuesto y cuesta lo mismo después de crecer()"""
+        antes = peticion()
+        self.assertLessEqual(antes, PRESUPUESTO_CONSULTAS[nombre], f'{nombre}: {antes} consultas')
+        crecer()
+        despues = peticion()
+        self.assertEqual(antes, despues, f'{nombre}: {antes} consultas antes de crecer, {despues} después')
+
+    def test_todas_las_urls_tienen_presupuesto(self):
+        from .urls import urlpatterns
+        self.assertEqual({patron.name for patron in urlpatterns}, set(PRESUPUESTO_CONSULTAS))
+
+    def test_catalogo(self):
+        crecer = lambda: self.agregar_productos(20)
+        self.assertConsultasConstantes('home', lambda: self.contar('get', reverse('home')), crecer)
+        self.assertConsultasConstantes(
+            'lista_productos', lambda: self.contar('get', reverse('lista_productos'), {'q': 'producto'}), crecer,
+        )
+        self.assertConsultasConstantes(
+            'lista_productos', lambda: self.contar('get', reverse('lista_productos'), {'paginacion': 'cursor'}), crecer,
+        )
+        self.assertConsultasConstantes(
+            'detalle_producto',
+            lambda: self.contar('get', reverse('detalle_producto', args=[self.productos[0].id])),
+            crecer,
+        )
+
+    def test_catalogo_desde_la_cache_de_objetos(self):
+        producto = self.productos[0]
+        url = reverse('detalle_producto', args=[producto.id])
+        for nombre in ('home', 'detalle_producto'):
+            with self.subTest(nombre):
+                self.client.get(url if nombre == 'detalle_producto' else reverse(nombre))
+                with CaptureQueriesContext(connection) as consultas:
+                    self.client.get(url if nombre == 'detalle_producto' else reverse(nombre))
+                # Solo la sesión y el usuario
+                self.assertEqual(len(consultas), 2, [consulta['sql'] for consulta in consultas])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.nombre = 'Nombre nuevo'
+            producto.save()
+        self.assertEqual(self.client.get(url).context['producto'].nombre, 'Nombre nuevo')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Categoria.objects.filter(id=producto.categoria_id).update(nombre='Renombrada')
+            Categoria.objects.get(id=producto.categoria_id).save()
+        self.assertEqual(self.client.get(url).context['producto'].categoria.nombre, 'Renombrada')
+
+    def test_carrito(self):
+        crecer = lambda: self.agregar_al_carrito(10)
+        self.assertConsultasConstantes('carrito', lambda: self.contar('get', reverse('carrito')), crecer)
+        self.assertConsultasConstantes('resumen_carrito', lambda: self.contar('get', reverse('resumen_carrito')), crecer)
+        self.assertConsultasConstantes(
+            'checkout', lambda: self.contar('get', reverse('checkout')), crecer,
+        )
+
+    def test_mutaciones_del_carrito(self):
+        producto = self.productos[0]
+        crecer = lambda: self.agregar_al_carrito(10)
+        self.assertConsultasConstantes(
+            'agregar_al_carrito',
+            lambda: self.contar('post_json', reverse('agregar_al_carrito'), {'producto_id': producto.id, 'cantidad': 1}),
+            crecer,
+        )
+        item = self.carrito.items.get(producto=producto)
+        cantidades = iter(range(2, 10))
+        self.assertConsultasConstantes(
+            'actualizar_carrito',
+            lambda: self.contar(
+                'post_json', reverse('actualizar_carrito'), {'item_id': item.id, 'cantidad': next(cantidades)},
+            ),
+            crecer,
+        )
+
+        def eliminar():
+            item = self.carrito.items.first()
+            return self.contar('post_json', reverse('eliminar_del_carrito'), {'item_id': item.id})
+        self.assertConsultasConstantes('eliminar_del_carrito', eliminar, crecer)
+
+    def test_operaciones_del_carrito(self):
+        cantidades = iter(range(2, 10))
+
+        def lote():
+            # Quita el primer item, cambia la cantidad de los demás y agrega un producto nuevo
+            self.agregar_productos(1)
+            primero, *resto = self.carrito.items.order_by('id').values_list('id', flat=True)
+            cantidad = next(cantidades)
+            operaciones = [
+                {'accion': 'eliminar', 'item_id': primero},
+                *({'accion': 'actualizar', 'item_id': item_id, 'cantidad': cantidad} for item_id in resto),
+                {'accion': 'agregar', 'producto_id': self.productos[-1].id},
+            ]
+            return self.contar('post_json', reverse('operaciones_carrito'), {'operaciones': operaciones})
+        self.assertConsultasConstantes('operaciones_carrito', lote, lambda: self.agregar_al_carrito(10))
+
+    def test_confirmar_checkout(self):
+        datos = {
+            'nombre_completo': 'Cliente de Prueba', 'email': 'cliente@example.com', 'telefono': '123',
+            'direccion': 'Calle Falsa 123', 'ciudad': 'Santiago', 'codigo_postal': '8320000',
+            'metodo_pago': 'transferencia',
+        }
+
+        def confirmar():
+            conteo = self.contar('post', reverse('checkout'), datos)
+            self.agregar_al_carrito(2)
+            return conteo
+        self.assertConsultasConstantes('checkout', confirmar, lambda: self.agregar_al_carrito(10))
+
+    def test_pedidos(self):
+        def crecer():
+            self.agregar_productos(10)
+            for _ in range(5):
+                self.crear_pedido(10)
+            ItemPedido.objects.create(
+                pedido=self.pedido, producto=self.productos[-1], cantidad=1, precio_unitario=1,
+            )
+        self.assertConsultasConstantes('mis_pedidos', lambda: self.contar('get', reverse('mis_pedidos')), crecer)
+        self.assertConsultasConstantes(
+            'detalle_pedido',
+            lambda: self.contar('get', reverse('detalle_pedido', args=[self.pedido.id])),
+            crecer,
+        )
+        User.objects.filter(id=self.usuario.id).update(is_staff=True)
+        for formato in ('csv', 'jsonl'):
+            self.assertConsultasConstantes(
+                'exportar_pedidos',
+                lambda: self.contar('get', reverse('exportar_pedidos'), {'formato': formato}),
+                crecer,
+            )
+
+    def test_pagina_anonima_cacheada_no_consulta(self):
+        self.client.logout()
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('home'))
+        self.assertEqual(len(consultas), 0)
+
+
+class CachePaginasTests(TestCase):
+    """Caché de páginas para anónimos: invalidación por etiquetas, sin datos de un visitante y estadísticas"""
+
+    def setUp(self):
+        cache.clear()
+        self.jardin = Categoria.objects.create(nombre='Jardín')
+        self.cocina = Categoria.objects.create(nombre='Cocina')
+        self.maceta = crear_producto(self.jardin, 'Maceta', destacado=True)
+        self.sarten = crear_producto(self.cocina, 'Sartén', destacado=True)
+        self.paginas = [
+            reverse('home'), reverse('lista_productos'), reverse('detalle_producto', args=[self.maceta.id]),
+        ]
+
+    def contenido(self, url, cliente=None):
+        respuesta = (cliente or self.client).get(url)
+        self.assertEqual(respuesta.status_code, 200, url)
+        return respuesta.content.decode()
+
+    def test_guardar_una_categoria_regenera_las_paginas(self):
+        for url in self.paginas:
+            self.assertIn('Jardín', self.contenido(url))
+
+        # Sin pasar por save() no hay invalidación: se sirve la página guardada
+        Categoria.objects.filter(id=self.jardin.id).update(nombre='Huerto')
+        for url in self.paginas:
+            self.assertNotIn('Huerto', self.contenido(url))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jardin.nombre = 'Huerto'
+            self.jardin.save()
+        for url in self.paginas:
+            contenido = self.contenido(url)
+            self.assertIn('Huerto', contenido, url)
+            self.assertNotIn('Jardín', contenido, url)
+
+    def test_eliminar_una_categoria_regenera_las_paginas(self):
+        detalle = reverse('detalle_producto', args=[self.sarten.id])
+        for url in self.paginas:
+            self.contenido(url)
+        for url in (reverse('home'), reverse('lista_productos'), detalle):
+            self.assertIn('Sartén', self.contenido(url))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cocina.delete()
+        for url in self.paginas:
+            contenido = self.contenido(url)
+            self.assertNotIn('Sartén', contenido, url)
+            self.assertNotIn('Cocina', contenido, url)
+        self.assertEqual(self.client.get(detalle).status_code, 404)
+
+    def test_edicion_en_el_listado_del_admin(self):
+        anonimo = Client()
+        self.assertIn('Maceta', self.contenido(reverse('lista_productos'), anonimo))
+        self.assertIn('Maceta', self.contenido(reverse('home'), anonimo))
+
+        self.client.force_login(User.objects.create_superuser('admin', password='clave-segura'))
+        datos = {
+            'form-TOTAL_FORMS': '2', 'form-INITIAL_FORMS': '2', 'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000', '_save': 'Guardar',
+        }
+        for i, producto in enumerate([self.maceta, self.sarten]):
+            datos.update({
+                f'form-{i}-id': producto.id, f'form-{i}-precio': '1000', f'form-{i}-stock': '10',
+                f'form-{i}-destacado': 'on',
+            })
+            # La maceta se desactiva: sin "activo" en el formulario
+            if producto != self.maceta:
+                datos[f'form-{i}-activo'] = 'on'
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(reverse('admin:tienda_producto_changelist'), datos)
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertFalse(Producto.objects.get(id=self.maceta.id).activo)
+
+        self.assertNotIn('Maceta', self.contenido(reverse('lista_productos'), anonimo))
+        self.assertNotIn('Maceta', self.contenido(reverse('home'), anonimo))
+        self.assertIn('Sartén', self.contenido(reverse('lista_productos'), anonimo))
+
+    def test_las_paginas_guardadas_no_llevan_el_carrito_de_otro_visitante(self):
+        comprador, otro = Client(), Client()
+        comprador.post(
+            reverse('agregar_al_carrito'), json.dumps({'producto_id': self.maceta.id, 'cantidad': 3}),
+            content_type='application/json',
+        )
+        cache_paginas.reiniciar_estadisticas()
+        pagina_comprador = self.contenido(reverse('home'), comprador)
+        pagina_otro = self.contenido(reverse('home'), otro)
+        self.assertEqual(cache_paginas.estadisticas()['aciertos'], 1)
+
+        # El contador del navbar sale en cero en la página y cada uno lo pide aparte
+        self.assertEqual(pagina_comprador, pagina_otro)
+        self.assertIn('id="carrito-count" data-url="{}">0</span>'.format(reverse('resumen_carrito')), pagina_otro)
+        self.assertEqual(comprador.get(reverse('resumen_carrito')).json()['carrito_cantidad'], 3)
+        self.assertEqual(otro.get(reverse('resumen_carrito')).json()['carrito_cantidad'], 0)
+
+        # Un usuario con sesión iniciada no usa ni llena la caché
+        self.client.force_login(User.objects.create_user('cliente', password='clave-segura'))
+        self.client.get(reverse('home'))
+        self.assertEqual(cache_paginas.estadisticas()['aciertos'], 1)
+
+    def test_agregar_al_carrito_con_csrf_en_la_primera_visita(self):
+        visitante = Client(enforce_csrf_checks=True)
+        detalle = reverse('detalle_producto', args=[self.maceta.id])
+        datos = json.dumps({'producto_id': self.maceta.id, 'cantidad': 2})
+        # La página del producto sale de la caché: no fija la cookie del token
+        self.contenido(detalle, visitante)
+        self.assertNotIn('csrftoken', visitante.cookies)
+        respuesta = visitante.post(reverse('agregar_al_carrito'), datos, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 403)
+
+        # El resumen del carrito, que la página pide al cargar, entrega el token
+        resumen = visitante.get(reverse('resumen_carrito'))
+        self.assertIn('csrftoken', resumen.cookies)
+        respuesta = visitante.post(
+            reverse('agregar_al_carrito'), datos, content_type='application/json',
+            HTTP_X_CSRFTOKEN=resumen.json()['csrf_token'],
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['carrito_cantidad'], 2)
+
+        # La página sigue guardándose y sirviéndose de la caché
+        cache_paginas.reiniciar_estadisticas()
+        self.contenido(detalle, visitante)
+        self.assertEqual(cache_paginas.estadisticas()['aciertos'], 1)
+
+    def test_tasa_de_aciertos(self):
+        cache_paginas.reiniciar_estadisticas()
+        self.assertEqual(cache_paginas.estadisticas(), {'aciertos': 0, 'fallos': 0, 'tasa_aciertos': 0.0})
+        for url in [reverse('home')] * 3 + [reverse('lista_productos')]:
+            self.client.get(url)
+        self.assertEqual(cache_paginas.estadisticas(), {'aciertos': 2, 'fallos': 2, 'tasa_aciertos': 0.5})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.maceta.save()
+        self.client.get(reverse('home'))
+        self.assertEqual(cache_paginas.estadisticas(), {'aciertos': 2, 'fallos': 3, 'tasa_aciertos': 0.4})
+
+
+class PaginacionCursorTests(TestCase):
+    """Paginación por cursor: recorrer el listado en los dos sentidos sin saltos ni repeticiones"""
+
+    POR_PAGINA = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Muebles')
+        nombres = ['Mesa', 'Silla', 'Sofá']
+        precios = [1000, 2500]
+        # Valores repetidos en cada columna de orden: el id desempata
+        for i in range(19):
+            crear_producto(categoria, nombres[i % len(nombres)], precio=precios[i % len(precios)])
+        inicio = timezone.now() - timedelta(days=3)
+        for i, producto_id in enumerate(Producto.objects.order_by('id').values_list('id', flat=True)):
+            Producto.objects.filter(id=producto_id).update(fecha_creacion=inicio + timedelta(days=i % 3))
+
+    def paginas(self, campos):
+        """(ids de cada página hacia adelante, ids de cada página volviendo hacia atrás desde la última)"""
+        productos = Producto.objects.filter(activo=True)
+        adelante = [paginar_por_cursor(productos, campos, None, self.POR_PAGINA)]
+        while adelante[-1].has_next():
+            adelante.append(paginar_por_cursor(productos, campos, adelante[-1].cursor_siguiente, self.POR_PAGINA))
+        atras = [adelante[-1]]
+        while atras[-1].has_previous():
+            atras.append(paginar_por_cursor(productos, campos, atras[-1].cursor_anterior, self.POR_PAGINA))
+        ids = lambda pagina: [producto.id for producto in pagina]
+        return [ids(pagina) for pagina in adelante], [ids(pagina) for pagina in reversed(atras)]
+
+    def test_recorre_cada_orden_sin_saltos_ni_repeticiones(self):
+        for orden, campos in ORDENES_PRODUCTOS.items():
+            with self.subTest(orden=orden):
+                esperados = list(Producto.objects.order_by(*campos).values_list('id', flat=True))
+                adelante, atras = self.paginas(campos)
+                self.assertEqual(sum(adelante, []), esperados)
+                self.assertEqual([len(pagina) for pagina in adelante], [4, 4, 4, 4, 3])
+                # Volver desde la última página da las mismas páginas, hasta la primera
+                self.assertEqual(atras, adelante)
+
+    def test_primera_pagina_sin_anterior_y_ultima_sin_siguiente(self):
+        productos = Producto.objects.filter(activo=True)
+        campos = ORDENES_PRODUCTOS['precio_desc']
+        primera = paginar_por_cursor(productos, campos, None, self.POR_PAGINA)
+        self.assertFalse(primera.has_previous())
+        segunda = paginar_por_cursor(productos, campos, primera.cursor_siguiente, self.POR_PAGINA)
+        de_vuelta = paginar_por_cursor(productos, campos, segunda.cursor_anterior, self.POR_PAGINA)
+        self.assertEqual([p.id for p in de_vuelta], [p.id for p in primera])
+        self.assertFalse(paginar_por_cursor(productos, campos, None, 100).has_other_pages())
+
+    def test_cursor_invalido(self):
+        campos = ORDENES_PRODUCTOS['nuevos']
+        validos = codificar_cursor('siguiente', ['2024-01-01T00:00:00+00:00', 1])
+        for cursor in ('basura', '!!', codificar_cursor('atras', ['2024-01-01', 1]),
+                       codificar_cursor('siguiente', [1]), codificar_cursor('siguiente', ['no es fecha', 1]),
+                       codificar_cursor('siguiente', ['2024-01-01', 'uno']), 'MQ'):
+            with self.subTest(cursor=cursor), self.assertRaises(CursorInvalido):
+                paginar_por_cursor(Producto.objects.all(), campos, cursor)
+        paginar_por_cursor(Producto.objects.all(), campos, validos)
+
+        # La vista vuelve a la primera página
+        cache.clear()
+        primera = self.client.get(reverse('lista_productos'), {'paginacion': 'cursor', 'orden': 'nuevos'})
+        invalido = self.client.get(reverse('lista_productos'), {'cursor': 'basura', 'orden': 'nuevos'})
+        self.assertEqual(invalido.status_code, 200)
+        self.assertTrue(invalido.context['paginacion_cursor'])
+        self.assertFalse(invalido.context['page_obj'].has_previous())
+        self.assertEqual(
+            [p.id for p in invalido.context['page_obj']], [p.id for p in primera.context['page_obj']],
+        )
+        alterado = codificar_cursor('siguiente', ['no es fecha', 1])
+        self.assertEqual(self.client.get(reverse('lista_productos'), {'cursor': alterado}).status_code, 200)
+
+
+class MisPedidosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('comprador', password='clave-segura')
+        self.client.force_login(self.usuario)
+        categoria = Categoria.objects.create(nombre='Hogar')
+        self.producto = crear_producto(categoria)
+
+    def crear_pedidos(self, cantidad, total=1000):
+        for _ in range(cantidad):
+            pedido = nuevo_pedido(self.usuario)
+            pedido.total = Decimal(total)
+            pedido.save()
+            ItemPedido.objects.create(pedido=pedido, producto=self.producto, cantidad=3, precio_unitario=total)
+
+    def test_pagina_por_cursor_sin_repetir_pedidos(self):
+        self.crear_pedidos(15)
+        primera = self.client.get(reverse('mis_pedidos')).context['page_obj']
+        self.assertEqual(len(primera), 10)
+        self.assertTrue(primera.has_next())
+        self.assertEqual(primera.object_list[0].cantidad_productos, 1)
+        self.assertEqual(primera.object_list[0].unidades, 3)
+
+        segunda = self.client.get(reverse('mis_pedidos'), {'cursor': primera.cursor_siguiente}).context['page_obj']
+        self.assertEqual(len(segunda), 5)
+        self.assertFalse(segunda.has_next())
+        ids = [p.id for p in primera] + [p.id for p in segunda]
+        self.assertEqual(ids, list(Pedido.objects.order_by('-fecha_pedido', '-id').values_list('id', flat=True)))
+
+    def test_resumen_se_invalida_con_nuevos_pedidos(self):
+        self.crear_pedidos(2)
+        resumen = self.client.get(reverse('mis_pedidos')).context['resumen']
+        self.assertEqual(resumen, {'cantidad': 2, 'total': Decimal(2000)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_pedidos(1)
+        resumen = self.client.get(reverse('mis_pedidos')).context['resumen']
+        self.assertEqual(resumen, {'cantidad': 3, 'total': Decimal(3000)})
+
+
+class ExportacionPedidosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('contabilidad', password='clave-segura', is_staff=True)
+        cls.usuario = User.objects.create_user('comprador', password='clave-segura')
+        categoria = Categoria.objects.create(nombre='Oficina')
+        productos = [crear_producto(categoria, f'Cuaderno {i}', precio=1000 + i) for i in range(2)]
+        # (fecha, estado, productos de las líneas)
+        cls.pedidos = []
+        for dia, estado, lineas in [((2024, 4, 2), 'pendiente', productos[:1]), ((2024, 3, 1), 'pendiente', productos),
+                                    ((2024, 3, 15), 'enviado', [])]:
+            pedido = nuevo_pedido(cls.usuario)
+            pedido.estado = estado
+            pedido.total = sum(producto.precio for producto in lineas)
+            pedido.save()
+            Pedido.objects.filter(id=pedido.id).update(fecha_pedido=timezone.make_aware(datetime(*dia, 12)))
+            for producto in lineas:
+                ItemPedido.objects.create(pedido=pedido, producto=producto, cantidad=2, precio_unitario=producto.precio)
+            cls.pedidos.append(pedido)
+
+    def exportar(self, datos=None):
+        self.client.force_login(self.staff)
+        respuesta = self.client.get(reverse('exportar_pedidos'), datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, leer_streaming(respuesta).decode()
+
+    def test_csv_una_fila_por_linea_en_orden_de_fecha(self):
+        respuesta, contenido = self.exportar()
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="pedidos-', respuesta['Content-Disposition'])
+        filas = list(csv.DictReader(StringIO(contenido)))
+        abril, marzo, enviado = self.pedidos
+        self.assertEqual(
+            [(int(fila['pedido_id']), fila['producto']) for fila in filas],
+            [(marzo.id, 'Cuaderno 0'), (marzo.id, 'Cuaderno 1'), (enviado.id, ''), (abril.id, 'Cuaderno 0')],
+        )
+        self.assertEqual(filas[1]['subtotal'], '2002.00')
+        self.assertEqual(filas[1]['total'], '2001.00')
+        self.assertEqual(filas[0]['usuario'], 'comprador')
+
+    def test_filtros_de_fecha_y_estado(self):
+        abril, marzo, enviado = self.pedidos
+        casos = [
+            ({'desde': '2024-03-02', 'hasta': '2024-03-31'}, [enviado.id]),
+            ({'hasta': '2024-03-15'}, [marzo.id, enviado.id]),
+            ({'desde': '2024-04-02'}, [abril.id]),
+            ({'estado': 'pendiente'}, [marzo.id, abril.id]),
+            ({'estado': ['enviado', 'cancelado']}, [enviado.id]),
+        ]
+        for datos, esperados in casos:
+            _, contenido = self.exportar({'formato': 'jsonl', **datos})
+            ids = [json.loads(linea)['pedido_id'] for linea in contenido.splitlines()]
+            self.assertEqual(ids, esperados, datos)
+
+    def test_comando_jsonl_lee_por_lotes(self):
+        salida = StringIO()
+        # Una consulta de pedidos y una de líneas por cada lote de dos pedidos
+        with self.assertNumQueries(3):
+            call_command('exportar_pedidos', '--formato', 'jsonl', '--lote', '2', stdout=salida)
+        pedidos = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        self.assertEqual([len(pedido['items']) for pedido in pedidos], [2, 0, 1])
+        self.assertEqual(pedidos[0]['items'][1]['producto'], 'Cuaderno 1')
+
+        with self.assertRaises(CommandError):
+            call_command('exportar_pedidos', '--desde', '2024-05-01', '--hasta', '2024-04-01', stdout=StringIO())
+
+    def test_comando_salida(self):
+        # Con --salida - la exportación va a stdout, no a un archivo llamado "-"
+        estandar = StringIO()
+        call_command('exportar_pedidos', '--salida', '-', stdout=estandar, stderr=StringIO())
+        self.assertEqual(len(list(csv.reader(StringIO(estandar.getvalue())))), 5)
+        self.assertFalse(os.path.exists('-'))
+
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'pedidos.csv')
+            vacia, errores = StringIO(), StringIO()
+            call_command('exportar_pedidos', '--salida', ruta, stdout=vacia, stderr=errores)
+            with open(ruta, encoding='utf-8', newline='') as archivo:
+                self.assertEqual(archivo.read(), estandar.getvalue())
+        self.assertEqual(vacia.getvalue(), '')
+        self.assertIn(ruta, errores.getvalue())
+
+    def test_solo_staff_y_parametros_invalidos(self):
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(reverse('exportar_pedidos'))
+        self.assertRedirects(respuesta, f"{reverse('admin:login')}?next={reverse('exportar_pedidos')}")
+
+        self.client.force_login(self.staff)
+        for datos in ({'formato': 'xlsx'}, {'desde': 'ayer'}, {'estado': 'perdido'}):
+            self.assertEqual(self.client.get(reverse('exportar_pedidos'), datos).status_code, 400, datos)
+
+    # Sin réplicas: fuera de la transacción del test, la vista async leería de una
+    @override_settings(ROOT_URLCONF='ecommerce.urls_async', TIENDA_REPLICAS=[])
+    def test_vista_async_igual_que_la_sincrona(self):
+        with override_settings(ROOT_URLCONF='ecommerce.urls'):
+            _, esperado = self.exportar({'formato': 'jsonl'})
+
+        self.async_client.force_login(self.usuario)
+        self.assertEqual(esperar(self.async_client.get, reverse('exportar_pedidos')).status_code, 302)
+        self.async_client.force_login(self.staff)
+        respuesta = esperar(self.async_client.get, reverse('exportar_pedidos'), {'formato': 'jsonl'})
+        self.assertTrue(respuesta.is_async)
+        self.assertEqual(leer_streaming(respuesta).decode(), esperado)
+
+
+class VentasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.categorias = [Categoria.objects.create(nombre=nombre) for nombre in ('Libros', 'Juegos')]
+        cls.productos = [
+            crear_producto(cls.categorias[i % 2], f'Producto {i}', precio=1000 * (i + 1), stock=50) for i in range(3)
+        ]
+
+    def comprar(self, productos, cantidad=1):
+        return crear_pedido(llenar_carrito(self.usuario, productos, cantidad), nuevo_pedido(self.usuario))
+
+    def acumuladas(self):
+        return {
+            'productos': sorted(VentaProductoDia.objects.values_list('fecha', 'producto_id', 'unidades', 'ingresos')),
+            'categorias': sorted(VentaCategoriaDia.objects.values_list('fecha', 'categoria_id', 'unidades', 'ingresos')),
+        }
+
+    def test_checkout_suma_a_las_ventas_del_dia(self):
+        uno, dos, tres = self.productos
+        self.comprar([uno, dos], cantidad=2)
+        self.comprar([uno, tres])
+        hoy = timezone.localdate()
+        libros, juegos = self.categorias
+        self.assertEqual(self.acumuladas(), {
+            'productos': sorted([
+                (hoy, uno.id, 3, Decimal('3000')), (hoy, dos.id, 2, Decimal('4000')), (hoy, tres.id, 1, Decimal('3000')),
+            ]),
+            'categorias': sorted([(hoy, libros.id, 4, Decimal('6000')), (hoy, juegos.id, 2, Decimal('4000'))]),
+        })
+
+        # La reconstrucción desde los pedidos llega a lo mismo
+        esperadas = self.acumuladas()
+        call_command('reconstruir_ventas', stdout=StringIO())
+        self.assertEqual(self.acumuladas(), esperadas)
+
+    def test_cancelar_descuenta_y_reabrir_vuelve_a_sumar(self):
+        pedido = self.comprar(self.productos[:2])
+        antes = self.acumuladas()
+
+        pedido = Pedido.objects.get(id=pedido.id)
+        pedido.estado = 'cancelado'
+        pedido.save()
+        self.assertEqual(VentaProductoDia.objects.filter(unidades__gt=0).count(), 0)
+        self.assertEqual(VentaCategoriaDia.objects.aggregate(total=Sum('ingresos'))['total'], 0)
+
+        pedido.estado = 'enviado'
+        pedido.save()
+        self.assertEqual(self.acumuladas(), antes)
+        # Otros cambios de estado no tocan las ventas
+        pedido.estado = 'entregado'
+        pedido.save()
+        self.assertEqual(self.acumuladas(), antes)
+
+    def test_reconstruir_desde_el_historial(self):
+        uno, dos, _ = self.productos
+        pedidos = [self.comprar([uno]), self.comprar([dos], cantidad=3), self.comprar([uno, dos])]
+        dias = [timezone.make_aware(datetime(2024, 5, dia, 23, 30)) for dia in (1, 2, 2)]
+        for pedido, fecha in zip(pedidos, dias):
+            Pedido.objects.filter(id=pedido.id).update(fecha_pedido=fecha)
+        Pedido.objects.filter(id=pedidos[2].id).update(estado='cancelado')
+
+        call_command('reconstruir_ventas', stdout=StringIO())
+        primero, segundo = date(2024, 5, 1), date(2024, 5, 2)
+        self.assertEqual(self.acumuladas()['productos'], [
+            (primero, uno.id, 1, Decimal('1000')), (segundo, dos.id, 3, Decimal('6000')),
+        ])
+
+        # Con --desde se conserva lo anterior
+        VentaProductoDia.objects.filter(fecha=primero).update(unidades=99)
+        Pedido.objects.filter(id=pedidos[2].id).update(estado='pendiente')
+        call_command('reconstruir_ventas', '--desde', '2024-05-02', stdout=StringIO())
+        self.assertEqual(self.acumuladas()['productos'], [
+            (primero, uno.id, 99, Decimal('1000')), (segundo, uno.id, 1, Decimal('1000')),
+            (segundo, dos.id, 4, Decimal('8000')),
+        ])
+
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_ventas', '--desde', 'ayer', stdout=StringIO())
+
+    def test_borrar_pedidos_descuenta_las_ventas(self):
+        uno, dos, tres = self.productos
+        queda = self.comprar([uno, dos])
+        esperadas = self.acumuladas()
+        borrado = self.comprar([uno, tres], cantidad=2)
+        cancelado = self.comprar([dos])
+        cancelado = Pedido.objects.get(id=cancelado.id)
+        cancelado.estado = 'cancelado'
+        cancelado.save()
+
+        # El cancelado ya estaba descontado: borrarlo no descuenta de nuevo
+        Pedido.objects.get(id=borrado.id).delete()
+        cancelado.delete()
+        # Quedan filas en cero, como al cancelar
+        self.assertEqual(
+            [fila for fila in self.acumuladas()['productos'] if fila[2]], esperadas['productos'],
+        )
+        self.assertEqual(ventas.tablero(7)['ingresos'], queda.total)
+        self.assertEqual(ventas.tablero(7)['unidades'], 2)
+
+        # Con la acción de borrar del admin
+        self.client.force_login(User.objects.create_superuser('admin', password='clave-segura'))
+        respuesta = self.client.post(reverse('admin:tienda_pedido_changelist'), {
+            'action': 'delete_selected', '_selected_action': [queda.id], 'post': 'yes',
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertFalse(Pedido.objects.exists())
+        tablero = self.client.get(reverse('admin:tienda_ventacategoriadia_changelist'), {'dias': 7}).context
+        self.assertEqual((tablero['ingresos'], tablero['unidades']), (Decimal('0'), 0))
+        call_command('reconstruir_ventas', stdout=StringIO())
+        self.assertEqual(ventas.tablero(7)['ingresos'], Decimal('0'))
+
+    def test_lineas_de_pedido_de_solo_lectura_en_el_admin(self):
+        uno, dos, _ = self.productos
+        pedido = self.comprar([uno, dos], cantidad=2)
+        linea = pedido.items.get(producto=uno)
+        self.client.force_login(User.objects.create_superuser('admin', password='clave-segura'))
+        url = reverse('admin:tienda_itempedido_change', args=[linea.id])
+        self.assertEqual(self.client.post(url, {'cantidad': 50}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:tienda_itempedido_add')).status_code, 403)
+
+        respuesta = self.client.post(reverse('admin:tienda_itempedido_delete', args=[linea.id]), {'post': 'yes'})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(ventas.tablero(7)['unidades'], 2)
+        self.assertEqual(VentaProductoDia.objects.get(producto=uno).unidades, 0)
+
+    def test_limpiar_el_catalogo_con_ventas(self):
+        self.comprar(self.productos[:2])
+        with tempfile.TemporaryDirectory() as directorio:
+            with override_settings(TIENDA_RELACIONADOS_ESTADO=os.path.join(directorio, 'estado.npz')):
+                PoblarCatalogo(stdout=StringIO()).limpiar()
+        # Las claves foráneas de SQLite se verifican al confirmar: forzar la verificación aquí
+        connection.check_constraints()
+        self.assertFalse(Producto.objects.exists())
+        self.assertFalse(VentaProductoDia.objects.exists() or VentaCategoriaDia.objects.exists())
+
+    def test_tablero_del_admin(self):
+        url = reverse('admin:tienda_ventacategoriadia_changelist')
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='clave-segura'))
+        self.comprar(self.productos[:2])
+
+        def contar():
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = self.client.get(url, {'dias': 7})
+            self.assertEqual(respuesta.status_code, 200)
+            return respuesta, len(consultas)
+
+        respuesta, antes = contar()
+        self.assertEqual(respuesta.context['ingresos'], Decimal('3000'))
+        self.assertEqual(len(respuesta.context['por_dia']), 7)
+        self.assertEqual(respuesta.context['por_dia'][-1]['porcentaje'], 100)
+        self.assertEqual([fila['nombre'] for fila in respuesta.context['productos']], ['Producto 1', 'Producto 0'])
+        self.assertContains(respuesta, 'width: 50.0%')
+
+        # Las consultas salen de las tablas acumuladas: no crecen con los pedidos
+        for _ in range(5):
+            self.comprar(self.productos)
+        self.assertEqual(contar()[1], antes)
+        self.assertEqual(self.client.get(url, {'dias': 'muchos'}).context['dias'], 30)
+
+
+@unittest.skipUnless(busqueda.disponible(), 'El índice de búsqueda necesita SQLite o PostgreSQL')
+class BusquedaTests(TestCase):
+    """Índice de texto completo de productos: normalización, prefijos, ranking y sincronía"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bebidas = Categoria.objects.create(nombre='Bebidas')
+        cls.electronica = Categoria.objects.create(nombre='Electrónica')
+        cls.cafe = crear_producto(cls.bebidas, 'Café de Grano')
+        cls.antena = crear_producto(cls.electronica, 'Antena de Señal')
+        cls.telefono = crear_producto(cls.electronica, 'Smartphone Básico')
+
+    def buscar(self, texto):
+        return list(
+            busqueda.buscar(Producto.objects.all(), texto).order_by('relevancia', 'id').values_list('nombre', flat=True)
+        )
+
+    def test_ignora_tildes_y_mayusculas(self):
+        self.assertEqual(busqueda.terminos('  Señal CAFÉ-Ámbar '), ['senal', 'cafe', 'ambar'])
+        self.assertEqual(self.buscar('cafe'), ['Café de Grano'])
+        self.assertEqual(self.buscar('CAFÉ'), ['Café de Grano'])
+        self.assertEqual(self.buscar('senal'), ['Antena de Señal'])
+        self.assertEqual(self.buscar('electronica basico'), ['Smartphone Básico'])
+
+    def test_prefijos(self):
+        self.assertEqual(self.buscar('smart'), ['Smartphone Básico'])
+        self.assertEqual(self.buscar('ante sen'), ['Antena de Señal'])
+        self.assertEqual(self.buscar('smarts'), [])
+        self.assertEqual(self.buscar('¿?'), [])
+
+    def test_relevancia(self):
+        # El nombre pesa más que la categoría y la categoría más que la descripción
+        taza = crear_producto(self.bebidas, 'Taza')
+        taza.descripcion = 'Taza para té verde'
+        taza.save()
+        crear_producto(Categoria.objects.create(nombre='Té e infusiones'), 'Manzanilla')
+        crear_producto(self.bebidas, 'Té Verde')
+        self.assertEqual(self.buscar('te'), ['Té Verde', 'Manzanilla', 'Taza'])
+        self.assertEqual(self.buscar('TÉ'), ['Té Verde', 'Manzanilla', 'Taza'])
+
+    def test_indice_al_dia_al_guardar_y_eliminar_productos(self):
+        nuevo = crear_producto(self.bebidas, 'Jugo de Naranja')
+        self.assertEqual(self.buscar('naranja'), ['Jugo de Naranja'])
+
+        nuevo.nombre = nuevo.descripcion = 'Jugo de Piña'
+        nuevo.save()
+        self.assertEqual(self.buscar('naranja'), [])
+        self.assertEqual(self.buscar('pina'), ['Jugo de Piña'])
+
+        nuevo.delete()
+        self.assertEqual(self.buscar('pina'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {busqueda.TABLA}')
+            self.assertEqual(cursor.fetchone()[0], Producto.objects.count())
+
+    def test_indice_al_dia_al_renombrar_una_categoria(self):
+        self.assertEqual(self.buscar('bebidas'), ['Café de Grano'])
+        self.bebidas.nombre = 'Cafetería'
+        self.bebidas.save()
+        self.assertEqual(self.buscar('bebidas'), [])
+        self.assertEqual(self.buscar('cafeteria'), ['Café de Grano'])
+
+    def test_reconstruir(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {busqueda.TABLA}')
+        self.assertEqual(self.buscar('cafe'), [])
+        self.assertEqual(busqueda.reconstruir(), 3)
+        self.assertEqual(self.buscar('cafe'), ['Café de Grano'])
+
+
+class GetCondicionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Deportes')
+        cls.productos = [crear_producto(cls.categoria, f'Pelota {i}', destacado=True) for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_304_sin_ejecutar_la_vista(self):
+        url = reverse('detalle_producto', args=[self.productos[0].id])
+        primera = self.client.get(url)
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(set(primera['Cache-Control'].split(', ')), {'public', 'max-age=0', 'must-revalidate'})
+        ultima = Producto.objects.aggregate(ultima=Max('fecha_actualizacion'))['ultima']
+        self.assertEqual(primera['Last-Modified'], http_date(ultima.timestamp()))
+
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get(url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda['ETag'], primera['ETag'])
+        self.assertFalse(segunda.templates)
+        self.assertEqual(len(consultas), 0)
+
+        tercera = self.client.get(url, HTTP_IF_MODIFIED_SINCE=primera['Last-Modified'])
+        self.assertEqual(tercera.status_code, 304)
+
+    def test_cambios_del_catalogo_invalidan_los_validadores(self):
+        url = reverse('lista_productos')
+        primera = self.client.get(url, {'categoria': self.categoria.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.productos[1].precio = Decimal(2000)
+            self.productos[1].save()
+        segunda = self.client.get(url, {'categoria': self.categoria.id}, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(segunda.status_code, 200)
+        self.assertNotEqual(segunda['ETag'], primera['ETag'])
+
+        # Eliminar no cambia ninguna fecha, pero Last-Modified no puede quedarse igual
+        with self.captureOnCommitCallbacks(execute=True):
+            self.productos[2].delete()
+        tercera = self.client.get(url, {'categoria': self.categoria.id},
+                                  HTTP_IF_MODIFIED_SINCE=segunda['Last-Modified'])
+        self.assertEqual(tercera.status_code, 200)
+        self.assertEqual(len(tercera.context['page_obj']), 2)
+
+    def test_usuarios_con_validadores_privados(self):
+        anonima = self.client.get(reverse('home'))
+        self.client.force_login(User.objects.create_user('deportista'))
+        respuesta = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=anonima['ETag'])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+
+    def test_vistas_async(self):
+        url = reverse('detalle_producto', args=[self.productos[0].id])
+        with override_settings(ROOT_URLCONF='ecommerce.urls_async'):
+            primera = esperar(self.async_client.get, url)
+            segunda = esperar(self.async_client.get, url, headers={'If-None-Match': primera['ETag']})
+        self.assertEqual(primera['ETag'], self.client.get(url)['ETag'])
+        self.assertEqual(segunda.status_code, 304)
+
+
+@override_settings(
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'tienda.estaticos.ManifestComprimido'},
+    },
+    STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+)
+class EstaticosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = self.settings(STATIC_ROOT=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.raiz = Path(directorio.name)
+
+    def test_collectstatic_guarda_versiones_comprimidas(self):
+        css = json.loads((self.raiz / 'staticfiles.json').read_text())['paths']['css/tienda.css']
+        original = (self.raiz / css).read_bytes()
+        self.assertEqual(gzip.decompress((self.raiz / f'{css}.gz').read_bytes()), original)
+        if estaticos.brotli is not None:
+            self.assertEqual(estaticos.brotli.decompress((self.raiz / f'{css}.br').read_bytes()), original)
+        self.assertIn(f'/static/{css}', self.client.get(reverse('home')).content.decode())
+
+    def test_sirve_la_mejor_version_con_cache_inmutable(self):
+        js = json.loads((self.raiz / 'staticfiles.json').read_text())['paths']['js/tienda.js']
+        url = f'/static/{js}'
+        original = (self.raiz / js).read_bytes()
+
+        respuesta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(respuesta['Cache-Control'], estaticos.CACHE_INMUTABLE)
+        self.assertEqual(respuesta['Vary'], 'Accept-Encoding')
+        self.assertTrue(respuesta['Content-Type'].startswith('text/javascript'))
+        contenido = b''.join(respuesta.streaming_content)
+        if estaticos.brotli is not None:
+            self.assertEqual(respuesta['Content-Encoding'], 'br')
+            self.assertEqual(estaticos.brotli.decompress(contenido), original)
+        else:
+            self.assertEqual(gzip.decompress(contenido), original)
+
+        respuesta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(int(respuesta['Content-Length']), (self.raiz / f'{js}.gz').stat().st_size)
+
+        sin_comprimir = self.client.get(url)
+        self.assertFalse(sin_comprimir.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(sin_comprimir.streaming_content), original)
+        repetida = self.client.get(url, HTTP_IF_NONE_MATCH=sin_comprimir['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+        # El nombre sin hash también se sirve, pero se revalida
+        self.assertEqual(self.client.get('/static/js/tienda.js')['Cache-Control'], estaticos.CACHE_SIN_HASH)
+        self.assertEqual(self.client.get('/static/js/no-existe.js').status_code, 404)
+
+
+@override_settings(DEBUG=False, TIENDA_MEDIOS_SENDFILE=None)
+class MediosTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = self.settings(MEDIA_ROOT=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        (Path(directorio.name) / 'productos').mkdir()
+        self.contenido = bytes(range(256)) * 40
+        (Path(directorio.name) / 'productos' / 'foto.jpg').write_bytes(self.contenido)
+        (Path(directorio.name) / 'secreto.txt').write_text('no se sirve')
+        self.url = '/media/productos/foto.jpg'
+
+    def test_sirve_el_archivo_con_validadores_y_cache(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/jpeg')
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=2592000')
+        self.assertEqual(int(respuesta['Content-Length']), len(self.contenido))
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        no_modificada = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(no_modificada['ETag'], respuesta['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"otro"').status_code, 200)
+
+        cabecera = self.client.head(self.url)
+        self.assertEqual(int(cabecera['Content-Length']), len(self.contenido))
+        self.assertEqual(cabecera.content, b'')
+
+    def test_rangos(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes 100-199/{len(self.contenido)}')
+        self.assertEqual(respuesta['Content-Length'], '100')
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido[100:200])
+
+        sufijo = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(sufijo.streaming_content), self.contenido[-10:])
+        abierto = self.client.get(self.url, HTTP_RANGE='bytes=10200-')
+        self.assertEqual(b''.join(abierto.streaming_content), self.contenido[10200:])
+
+        insatisfacible = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.contenido)}-')
+        self.assertEqual(insatisfacible.status_code, 416)
+        self.assertEqual(insatisfacible['Content-Range'], f'bytes */{len(self.contenido)}')
+
+        # Varios rangos, otra unidad o un If-Range que ya no vale: el archivo entero
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='items=0-1').status_code, 200)
+        etag = respuesta['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"viejo"').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag).status_code, 206)
+
+    def test_solo_las_carpetas_de_imagenes(self):
+        self.assertEqual(self.client.get('/media/secreto.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/productos/../secreto.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/productos/%2E%2E/secreto.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/productos/').status_code, 404)
+        self.assertEqual(self.client.get('/media/productos/no-existe.jpg').status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    @override_settings(TIENDA_MEDIOS_SENDFILE='X-Accel-Redirect')
+    def test_delega_el_envio_al_servidor_web(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta['X-Accel-Redirect'], '/media-interno/productos/foto.jpg')
+        self.assertEqual(respuesta.content, b'')
+        self.assertTrue(respuesta.has_header('ETag'))
+
+
+class ImagenesTests(TestCase):
+    """Versiones reducidas de las imágenes y el tag imagen_responsiva"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = self.settings(MEDIA_ROOT=directorio.name, TIENDA_IMAGENES_HILOS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.media = Path(directorio.name)
+        (self.media / 'productos').mkdir()
+        self.nombre = 'productos/foto.png'
+        self.escribir_imagen((200, 40, 40, 128))
+        self.categoria = Categoria.objects.create(nombre='Fotos')
+
+    def escribir_imagen(self, color):
+        # 500x250 con transparencia: el JPEG tiene que salir sin canal alfa
+        Image.new('RGBA', (500, 250), color).save(self.media / self.nombre)
+
+    def derivada(self, derivadas, ancho, extension):
+        return self.media / imagenes.ruta_derivada(self.nombre, derivadas['version'], ancho, extension)
+
+    def test_generar_no_amplia_y_crea_jpeg_y_webp(self):
+        derivadas = imagenes.generar(self.nombre)
+        self.assertEqual(derivadas['origen'], self.nombre)
+        # 1024 es más ancho que la original: se reemplaza por su ancho
+        self.assertEqual(derivadas['anchos'], [120, 320, 500])
+        for ancho in derivadas['anchos']:
+            for extension, formato in (('jpg', 'JPEG'), ('webp', 'WEBP')):
+                with Image.open(self.derivada(derivadas, ancho, extension)) as imagen:
+                    self.assertEqual(imagen.format, formato)
+                    self.assertEqual(imagen.size, (ancho, ancho // 2))
+                    if formato == 'JPEG':
+                        self.assertEqual(imagen.mode, 'RGB')
+        self.assertEqual(len(list((self.media / 'derivadas' / 'productos').iterdir())), 6)
+
+    def test_otra_imagen_con_el_mismo_nombre_cambia_las_rutas(self):
+        primera = imagenes.generar(self.nombre)
+        self.assertEqual(imagenes.generar(self.nombre), primera)
+
+        # Las URLs viejas pueden estar en caché por un mes: las nuevas no las repiten
+        self.escribir_imagen((40, 40, 200, 255))
+        segunda = imagenes.generar(self.nombre)
+        self.assertNotEqual(segunda['version'], primera['version'])
+        self.assertNotEqual(self.derivada(segunda, 120, 'jpg'), self.derivada(primera, 120, 'jpg'))
+        self.assertTrue(self.derivada(segunda, 120, 'jpg').exists())
+
+    def test_guardar_actualiza_las_filas_con_esa_imagen(self):
+        con_imagen = [crear_producto(self.categoria, f'Foto {i}', imagen=self.nombre) for i in range(2)]
+        otro = crear_producto(self.categoria, 'Otra')
+        Producto.objects.update(fecha_actualizacion=timezone.now() - timedelta(days=1))
+        etiquetas = ['catalogo', f'categoria:{self.categoria.id}']
+        antes = cache_paginas.versiones(etiquetas)
+
+        derivadas = imagenes.generar(self.nombre)
+        imagenes.guardar(Producto, derivadas)
+
+        for producto in con_imagen:
+            producto.refresh_from_db()
+            self.assertEqual(producto.imagen_derivadas, derivadas)
+            self.assertEqual(imagenes.vigentes(producto), [120, 320, 500])
+            self.assertGreater(producto.fecha_actualizacion, timezone.now() - timedelta(minutes=1))
+        otro.refresh_from_db()
+        self.assertEqual(otro.imagen_derivadas, {})
+        self.assertEqual(imagenes.vigentes(otro), [])
+        self.assertTrue(all(despues > previa for despues, previa in zip(cache_paginas.versiones(etiquetas), antes)))
+
+    def test_tag_imagen_responsiva(self):
+        plantilla = Template('{% load imagenes_responsivas %}{% imagen_responsiva producto 150 alt=producto.nombre %}')
+        producto = crear_producto(self.categoria, 'Foto', imagen=self.nombre)
+
+        # Sin derivadas, o con las de otra imagen o sin versión: la original
+        for derivadas in ({}, {'origen': 'productos/otra.png', 'version': 'abc', 'anchos': [120]},
+                          {'origen': self.nombre, 'anchos': [120]}):
+            producto.imagen_derivadas = derivadas
+            html = plantilla.render(Context({'producto': producto}))
+            self.assertHTMLEqual(html, '<img src="/media/productos/foto.png" alt="Foto" loading="lazy" decoding="async">')
+
+        producto.imagen_derivadas = derivadas = imagenes.generar(self.nombre)
+        html = plantilla.render(Context({'producto': producto}))
+        version = derivadas['version']
+
+        def srcset(extension):
+            return ', '.join(f'/media/derivadas/productos/foto-{version}-{a}.{extension} {a}w' for a in (120, 320, 500))
+        self.assertHTMLEqual(html, (
+            f'<picture><source type="image/webp" srcset="{srcset("webp")}" sizes="150px">'
+            # Respaldo: el menor ancho que cubre 150px con densidad 2
+            f'<img src="/media/derivadas/productos/foto-{version}-320.jpg" srcset="{srcset("jpg")}" sizes="150px" '
+            'alt="Foto" loading="lazy" decoding="async"></picture>'
+        ))
+
+
+class TotalesCarritoTests(TestCase):
+    """monto_total y total_items del carrito se mantienen con cada cambio de sus items"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Panadería')
+        cls.productos = [crear_producto(categoria, f'Pan {i}', precio=500 * (i + 1), stock=20) for i in range(3)]
+        cls.usuario = User.objects.create_user('comprador', password='clave-segura')
+
+    def setUp(self):
+        cache.clear()
+        self.carrito = Carrito.objects.create(usuario=self.usuario)
+
+    def totales(self, carrito=None):
+        carrito = carrito or self.carrito
+        carrito.refresh_from_db()
+        return carrito.total_items, carrito.monto_total
+
+    def test_agregar_actualizar_y_eliminar_items(self):
+        uno, dos, _ = self.productos
+        item = ItemCarrito.objects.create(carrito=self.carrito, producto=uno, cantidad=2)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=dos)
+        self.assertEqual(self.totales(), (3, Decimal('2000')))
+        self.assertEqual(Carrito.resumen(self.carrito.id), {'cantidad': 3, 'total': Decimal('2000')})
+
+        item = ItemCarrito.objects.get(id=item.id)
+        item.cantidad = 5
+        item.save()
+        self.assertEqual(self.totales(), (6, Decimal('3500')))
+        # La caché del resumen se invalida con cada cambio
+        self.assertEqual(Carrito.resumen(self.carrito.id), {'cantidad': 6, 'total': Decimal('3500')})
+
+        item.delete()
+        self.assertEqual(self.totales(), (1, Decimal('1000')))
+
+    def test_cambio_de_precio_recalcula_los_carritos(self):
+        producto = Producto.objects.get(id=self.productos[0].id)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=producto, cantidad=3)
+        producto.precio = Decimal('700')
+        producto.save()
+        self.assertEqual(self.totales(), (3, Decimal('2100')))
+
+    def test_eliminar_un_producto_recalcula_los_carritos(self):
+        uno, dos, _ = self.productos
+        otro = Carrito.objects.create(usuario=User.objects.create_user('otro'))
+        ItemCarrito.objects.create(carrito=self.carrito, producto=uno, cantidad=2)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=dos)
+        ItemCarrito.objects.create(carrito=otro, producto=uno)
+        self.assertEqual(self.totales(), (3, Decimal('2000')))
+        Carrito.resumen(self.carrito.id)
+
+        Producto.objects.get(id=uno.id).delete()
+        self.assertEqual(self.totales(), (1, Decimal('1000')))
+        self.assertEqual(self.totales(otro), (0, Decimal('0')))
+        self.assertEqual(Carrito.resumen(self.carrito.id), {'cantidad': 1, 'total': Decimal('1000')})
+
+    def coinciden_con_los_items(self):
+        """Los totales del carrito son la suma de sus filas"""
+        items = self.carrito.items.select_related('producto')
+        return self.totales() == (
+            sum(item.cantidad for item in items), sum((item.subtotal for item in items), Decimal('0')),
+        )
+
+    def test_borrar_dos_veces_el_mismo_item(self):
+        uno, dos, _ = self.productos
+        item = ItemCarrito.objects.create(carrito=self.carrito, producto=uno, cantidad=2)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=dos, cantidad=3)
+        # Un doble clic en "eliminar": dos peticiones con su propia copia del item
+        primera, segunda = ItemCarrito.objects.get(id=item.id), ItemCarrito.objects.get(id=item.id)
+        primera.delete()
+        self.assertEqual(segunda.delete()[0], 0)
+        self.assertEqual(self.totales(), (3, Decimal('3000')))
+        self.assertTrue(self.coinciden_con_los_items())
+
+        # Con un solo item, descontarlo dos veces dejaría los totales en negativo
+        unico = ItemCarrito.objects.get(carrito=self.carrito)
+        copia = ItemCarrito.objects.get(id=unico.id)
+        unico.delete()
+        copia.delete()
+        self.assertEqual(self.totales(), (0, Decimal('0')))
+
+    def test_guardar_con_la_cantidad_desactualizada(self):
+        item = ItemCarrito.objects.create(carrito=self.carrito, producto=self.productos[0])
+        primera, segunda = ItemCarrito.objects.get(id=item.id), ItemCarrito.objects.get(id=item.id)
+        for copia in (primera, segunda):
+            copia.cantidad += 1
+            copia.save()
+        # La diferencia se calcula con lo guardado, no con lo que se leyó al cargar la copia
+        self.assertEqual(self.totales(), (2, Decimal('1000')))
+        self.assertTrue(self.coinciden_con_los_items())
+
+        # Guardar una copia de un item que otra petición ya borró lo vuelve a insertar
+        primera.delete()
+        segunda.cantidad = 4
+        segunda.save()
+        self.assertEqual(self.totales(), (4, Decimal('2000')))
+
+    def test_comando_recalcular_carritos(self):
+        otro = Carrito.objects.create(usuario=User.objects.create_user('otro'))
+        for carrito in (self.carrito, otro):
+            ItemCarrito.objects.create(carrito=carrito, producto=self.productos[2], cantidad=2)
+        Carrito.objects.update(total_items=99, monto_total=1)
+
+        call_command('recalcular_carritos', str(self.carrito.id), stdout=StringIO())
+        self.assertEqual(self.totales(), (2, Decimal('3000')))
+        self.assertEqual(self.totales(otro), (99, Decimal('1')))
+
+        call_command('recalcular_carritos', stdout=StringIO())
+        self.assertEqual(self.totales(otro), (2, Decimal('3000')))
+
+
+class OperacionesCarritoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Juguetes')
+        cls.productos = [crear_producto(categoria, f'Juguete {i}', precio=1000 * (i + 1), stock=5) for i in range(4)]
+        cls.usuario = User.objects.create_user('comprador', password='clave-segura')
+
+    def setUp(self):
+        cache.clear()
+
+    def enviar(self, *operaciones):
+        return self.client.post(
+            reverse('operaciones_carrito'), json.dumps({'operaciones': list(operaciones)}),
+            content_type='application/json',
+        )
+
+    def test_aplica_el_lote_y_retorna_el_carrito(self):
+        self.client.force_login(self.usuario)
+        uno, dos, tres, cuatro = self.productos
+        carrito = llenar_carrito(self.usuario, [uno, dos, tres])
+        items = dict(carrito.items.values_list('producto_id', 'id'))
+
+        respuesta = self.enviar(
+            {'accion': 'actualizar', 'item_id': items[uno.id], 'cantidad': 2},
+            {'accion': 'actualizar', 'item_id': items[uno.id], 'cantidad': 4},
+            {'accion': 'eliminar', 'item_id': items[dos.id]},
+            {'accion': 'agregar', 'producto_id': cuatro.id, 'cantidad': 2},
+            {'accion': 'actualizar', 'item_id': items[tres.id], 'cantidad': 0},
+        ).json()
+
+        self.assertTrue(respuesta['success'])
+        self.assertEqual(
+            [(item['producto_id'], item['cantidad'], item['subtotal']) for item in respuesta['items']],
+            [(uno.id, 4, '4000.00'), (cuatro.id, 2, '8000.00')],
+        )
+        self.assertEqual((respuesta['carrito_cantidad'], respuesta['carrito_total']), (6, '12000.00'))
+        carrito.refresh_from_db()
+        self.assertEqual(dict(carrito.items.values_list('producto_id', 'cantidad')), {uno.id: 4, cuatro.id: 2})
+        self.assertEqual((carrito.cantidad_items, carrito.total), (6, Decimal('12000')))
+        self.assertEqual(Carrito.resumen(carrito.id), {'cantidad': 6, 'total': Decimal('12000')})
+
+    def test_sin_stock_no_cambia_nada(self):
+        self.client.force_login(self.usuario)
+        uno, dos = self.productos[:2]
+        carrito = llenar_carrito(self.usuario, [uno])
+        item = carrito.items.get()
+
+        respuesta = self.enviar(
+            {'accion': 'actualizar', 'item_id': item.id, 'cantidad': 3},
+            {'accion': 'agregar', 'producto_id': dos.id, 'cantidad': 6},
+        ).json()
+
+        self.assertFalse(respuesta['success'])
+        self.assertEqual(respuesta['disponibles'], {str(dos.id): 5})
+        self.assertEqual(dict(carrito.items.values_list('producto_id', 'cantidad')), {uno.id: 1})
+        carrito.refresh_from_db()
+        self.assertEqual(carrito.cantidad_items, 1)
+
+    def test_operaciones_invalidas(self):
+        self.client.force_login(self.usuario)
+        otro = User.objects.create_user('otro')
+        ajeno = llenar_carrito(otro, [self.productos[0]]).items.get()
+        Producto.objects.filter(id=self.productos[1].id).update(activo=False)
+        for operacion in (
+            {'accion': 'vaciar'},
+            {'accion': 'actualizar', 'item_id': ajeno.id, 'cantidad': 2},
+            {'accion': 'agregar', 'producto_id': self.productos[1].id},
+            {'accion': 'agregar', 'producto_id': self.productos[2].id, 'cantidad': '2'},
+        ):
+            with self.subTest(operacion):
+                self.assertEqual(self.enviar(operacion).status_code, 400)
+        self.assertFalse(Carrito.objects.filter(usuario=self.usuario).exists())
+        self.assertEqual(ajeno.carrito.items.get().cantidad, 1)
+
+    def test_carrito_anonimo(self):
+        uno, dos = self.productos[:2]
+        with CaptureQueriesContext(connection) as consultas:
+            self.enviar({'accion': 'agregar', 'producto_id': uno.id}, {'accion': 'agregar', 'producto_id': dos.id})
+            respuesta = self.enviar(
+                {'accion': 'actualizar', 'item_id': uno.id, 'cantidad': 3}, {'accion': 'eliminar', 'item_id': dos.id},
+            ).json()
+        self.assertEqual(respuesta['items'], [{'item_id': uno.id, 'producto_id': uno.id, 'cantidad': 3,
+                                              'subtotal': '3000.00'}])
+        self.assertEqual((respuesta['carrito_cantidad'], respuesta['carrito_total']), (3, '3000.00'))
+        self.assertFalse([c for c in consultas if c['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+                          and 'tienda_' in c['sql']])
+        self.assertFalse(Carrito.objects.exists())
+        resumen = self.client.get(reverse('resumen_carrito')).json()
+        self.assertEqual((resumen['carrito_cantidad'], resumen['carrito_total']), (3, '3000.00'))
+
+    def test_vista_async(self):
+        producto = self.productos[0]
+        with override_settings(ROOT_URLCONF='ecommerce.urls_async'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(reverse('operaciones_carrito')).func))
+            self.async_client.force_login(self.usuario)
+            respuesta = esperar(
+                self.async_client.post, reverse('operaciones_carrito'),
+                json.dumps({'operaciones': [{'accion': 'agregar', 'producto_id': producto.id, 'cantidad': 2}]}),
+                content_type='application/json',
+            ).json()
+        self.assertEqual((respuesta['carrito_cantidad'], respuesta['carrito_total']), (2, '2000.00'))
+        self.assertEqual(Carrito.objects.get(usuario=self.usuario).items.get().cantidad, 2)
+
+    def test_agregado_simultaneo_del_mismo_producto(self):
+        self.client.force_login(self.usuario)
+        uno, dos, _, _ = self.productos
+        carrito = llenar_carrito(self.usuario, [uno])
+        items = dict(carrito.items.values_list('producto_id', 'id'))
+        leer_productos = operaciones_carrito._productos
+
+        def con_agregado_simultaneo(ids):
+            # Otra petición agrega el mismo producto después de que el lote leyó los items
+            ItemCarrito.objects.create(carrito=carrito, producto=dos, cantidad=1)
+            return leer_productos(ids)
+
+        with mock.patch.object(operaciones_carrito, '_productos', con_agregado_simultaneo):
+            respuesta = self.enviar(
+                {'accion': 'actualizar', 'item_id': items[uno.id], 'cantidad': 3},
+                {'accion': 'agregar', 'producto_id': dos.id, 'cantidad': 2},
+            )
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertFalse(respuesta.json()['success'])
+        # Nada del lote queda aplicado (la inserción simulada corre en su transacción y se deshace con ella)
+        carrito.refresh_from_db()
+        self.assertEqual(dict(carrito.items.values_list('producto_id', 'cantidad')), {uno.id: 1})
+        self.assertEqual((carrito.total_items, carrito.monto_total), (1, Decimal('1000')))
+
+
+class CarritoAnonimoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = crear_producto(Categoria.objects.create(nombre='Libros'))
+
+    def post_json(self, nombre, datos):
+        return self.client.post(reverse(nombre), json.dumps(datos), content_type='application/json').json()
+
+    def test_carrito_anonimo_no_escribe_en_la_tienda(self):
+        otro = crear_producto(self.producto.categoria, 'Otro', precio=500)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('carrito'))
+            self.post_json('agregar_al_carrito', {'producto_id': self.producto.id, 'cantidad': 2})
+            self.post_json('agregar_al_carrito', {'producto_id': otro.id, 'cantidad': 1})
+            respuesta = self.post_json('actualizar_carrito', {'item_id': self.producto.id, 'cantidad': 3})
+            self.assertEqual(respuesta['carrito_total'], '3500.00')
+            respuesta = self.post_json('eliminar_del_carrito', {'item_id': otro.id})
+            self.assertEqual(respuesta['carrito_cantidad'], 3)
+            resumen = self.client.get(reverse('resumen_carrito')).json()
+        escrituras = [
+            consulta['sql'] for consulta in consultas
+            if consulta['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'tienda_' in consulta['sql']
+        ]
+        self.assertEqual(escrituras, [])
+        self.assertFalse(Carrito.objects.exists())
+        self.assertEqual((resumen['carrito_cantidad'], resumen['carrito_total']), (3, '3000.00'))
+
+        respuesta = self.client.get(reverse('carrito'))
+        self.assertEqual([(item.producto, item.cantidad) for item in respuesta.context['items']], [(self.producto, 3)])
+
+    def test_iniciar_sesion_fusiona_el_carrito(self):
+        usuario = User.objects.create_user('comprador', password='clave-segura')
+        llenar_carrito(usuario, [self.producto], cantidad=4)
+        otro = crear_producto(self.producto.categoria, 'Otro', precio=500)
+        self.post_json('agregar_al_carrito', {'producto_id': self.producto.id, 'cantidad': 8})
+        self.post_json('agregar_al_carrito', {'producto_id': otro.id, 'cantidad': 2})
+
+        self.client.login(username='comprador', password='clave-segura')
+
+        carrito = Carrito.objects.get(usuario=usuario)
+        # Se suman las cantidades, sin pasar del stock (10)
+        self.assertEqual(
+            dict(carrito.items.values_list('producto_id', 'cantidad')), {self.producto.id: 10, otro.id: 2},
+        )
+        self.assertEqual((carrito.cantidad_items, carrito.total), (12, Decimal('11000')))
+        self.assertNotIn('carrito', self.client.session)
+
+    def crear_carrito(self, dias, usuario=None, items=0):
+        carrito = Carrito.objects.create(usuario=usuario)
+        for _ in range(items):
+            ItemCarrito.objects.create(carrito=carrito, producto=self.producto)
+        Carrito.objects.filter(id=carrito.id).update(fecha_actualizacion=timezone.now() - timedelta(days=dias))
+        return carrito
+
+    def test_limpiar_carritos_elimina_anonimos_abandonados(self):
+        vacio_viejo = self.crear_carrito(2)
+        lleno_viejo = self.crear_carrito(40, items=1)
+        conservados = [
+            self.crear_carrito(0),
+            self.crear_carrito(10, items=1),
+            self.crear_carrito(40, usuario=User.objects.create_user('registrado'), items=1),
+        ]
+
+        salida = StringIO()
+        call_command('limpiar_carritos', '--dry-run', stdout=salida)
+        self.assertIn('Carritos a eliminar:  2 (1 vacíos)', salida.getvalue())
+        self.assertEqual(Carrito.objects.count(), 5)
+
+        call_command('limpiar_carritos', '--lote', '1', '--pausa', '0', stdout=StringIO())
+        self.assertCountEqual(Carrito.objects.values_list('id', flat=True), [c.id for c in conservados])
+        self.assertFalse(ItemCarrito.objects.filter(carrito_id__in=[vacio_viejo.id, lleno_viejo.id]).exists())
+
+
+@override_settings(ROOT_URLCONF='ecommerce.urls_async')
+class VistasAsyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Música')
+        cls.productos = [
+            crear_producto(categoria, f'Disco {i:02}', precio=1000 + i, destacado=i < 3) for i in range(15)
+        ]
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.otro_usuario = User.objects.create_user('otro', password='clave-segura')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, ruta, datos=None):
+        """(síncrona, async): la misma petición a las dos versiones de la vista"""
+        with override_settings(ROOT_URLCONF='ecommerce.urls'):
+            sincrona = self.client.get(ruta, datos)
+        return sincrona, esperar(self.async_client.get, ruta, datos)
+
+    def test_rutas_async(self):
+        for nombre in ('home', 'lista_productos', 'agregar_al_carrito', 'actualizar_carrito', 'eliminar_del_carrito'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(reverse(nombre)).func), nombre)
+        self.assertFalse(asyncio.iscoroutinefunction(resolve(reverse('checkout')).func))
+
+    def test_catalogo_igual_que_las_vistas_sincronas(self):
+        # Con sesión, para que las páginas no salgan de la caché
+        self.client.force_login(self.usuario)
+        self.async_client.force_login(self.usuario)
+
+        sincrona, asincrona = self.get(reverse('home'))
+        self.assertEqual(asincrona.status_code, 200)
+        for clave in ('productos_destacados', 'categorias'):
+            self.assertEqual(list(asincrona.context[clave]), list(sincrona.context[clave]))
+
+        for datos in ({}, {'page': 2, 'orden': 'precio_desc'}, {'paginacion': 'cursor', 'orden': 'precio_asc'},
+                      {'q': 'disco'}, {'cursor': 'no-es-un-cursor'}):
+            sincrona, asincrona = self.get(reverse('lista_productos'), datos)
+            self.assertEqual(asincrona.status_code, 200, datos)
+            self.assertEqual(list(asincrona.context['page_obj']), list(sincrona.context['page_obj']), datos)
+            self.assertEqual(asincrona.context['page_obj'].has_next(), sincrona.context['page_obj'].has_next())
+
+        sincrona, asincrona = self.get(reverse('detalle_producto', args=[self.productos[0].id]))
+        self.assertEqual(asincrona.status_code, 200)
+        self.assertEqual(asincrona.context['producto'], sincrona.context['producto'])
+        self.assertEqual(asincrona.context['productos_relacionados'], sincrona.context['productos_relacionados'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.productos[1].activo = False
+            self.productos[1].save()
+        _, asincrona = self.get(reverse('detalle_producto', args=[self.productos[1].id]))
+        self.assertEqual(asincrona.status_code, 404)
+
+    def test_cache_de_paginas_anonimas(self):
+        cache_paginas.reiniciar_estadisticas()
+        primera = esperar(self.async_client.get, reverse('home'))
+        segunda = esperar(self.async_client.get, reverse('home'))
+        self.assertEqual(segunda.content, primera.content)
+        self.assertEqual(cache_paginas.estadisticas()['aciertos'], 1)
+
+    def recorrer_carrito(self, cliente, usuario=None):
+        """Agrega, actualiza y elimina; retorna las respuestas JSON"""
+        post = partial(esperar, cliente.post) if isinstance(cliente, AsyncClient) else cliente.post
+
+        def item_id(producto):
+            if usuario is None:
+                return producto.id
+            return ItemCarrito.objects.get(carrito__usuario=usuario, producto=producto).id
+
+        def enviar(nombre, datos):
+            return post(reverse(nombre), json.dumps(datos), content_type='application/json').json()
+
+        uno, dos = self.productos[3], self.productos[4]
+        return [
+            enviar('agregar_al_carrito', {'producto_id': uno.id, 'cantidad': 2}),
+            enviar('agregar_al_carrito', {'producto_id': dos.id}),
+            enviar('agregar_al_carrito', {'producto_id': uno.id, 'cantidad': 1}),
+            enviar('agregar_al_carrito', {'producto_id': dos.id, 'cantidad': 99}),
+            enviar('actualizar_carrito', {'item_id': item_id(uno), 'cantidad': 5}),
+            enviar('actualizar_carrito', {'item_id': item_id(dos), 'cantidad': 50}),
+            enviar('eliminar_del_carrito', {'item_id': item_id(dos)}),
+        ]
+
+    def test_carrito_anonimo_igual_que_las_vistas_sincronas(self):
+        with override_settings(ROOT_URLCONF='ecommerce.urls'):
+            esperadas = self.recorrer_carrito(self.client)
+        self.assertEqual(self.recorrer_carrito(self.async_client), esperadas)
+        self.assertEqual(esperadas[-1]['carrito_cantidad'], 5)
+        self.assertFalse(Carrito.objects.exists())
+
+    def test_carrito_de_usuario_igual_que_las_vistas_sincronas(self):
+        self.client.force_login(self.usuario)
+        self.async_client.force_login(self.otro_usuario)
+        with override_settings(ROOT_URLCONF='ecommerce.urls'):
+            esperadas = self.recorrer_carrito(self.client, self.usuario)
+        self.assertEqual(self.recorrer_carrito(self.async_client, self.otro_usuario), esperadas)
+
+        carritos = [Carrito.objects.get(usuario=usuario) for usuario in (self.usuario, self.otro_usuario)]
+        self.assertEqual([(c.total_items, c.monto_total) for c in carritos], [(5, Decimal('5015.00'))] * 2)
+
+    def test_agregar_producto_inactivo(self):
+        Producto.objects.filter(id=self.productos[5].id).update(activo=False)
+        respuesta = esperar(
+            self.async_client.post, reverse('agregar_al_carrito'), json.dumps({'producto_id': self.productos[5].id}),
+            content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 404)
+
+
+@unittest.skipUnless(recomendaciones.disponible(), 'Se necesitan NumPy y SciPy')
+class RelacionadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        categoria = Categoria.objects.create(nombre='Cocina')
+        cls.a, cls.b, cls.c, cls.d = [crear_producto(categoria, nombre) for nombre in 'ABCD']
+
+    def setUp(self):
+        cache.clear()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.estado = os.path.join(directorio.name, 'relacionados.npz')
+
+    def comprar(self, productos, veces=1, estado='pendiente'):
+        for _ in range(veces):
+            pedido = nuevo_pedido(self.usuario)
+            pedido.estado = estado
+            pedido.total = 0
+            pedido.save()
+            for producto in productos:
+                ItemPedido.objects.create(pedido=pedido, producto=producto, cantidad=1, precio_unitario=1)
+
+    def relacionados(self, producto):
+        return list(ProductoRelacionado.objects.filter(producto=producto).values_list('relacionado__nombre', flat=True))
+
+    def test_calculo_completo_e_incremental(self):
+        self.comprar([self.a, self.b], 3)
+        self.comprar([self.a, self.c], 2)
+        self.comprar([self.b, self.d])
+        self.comprar([self.a, self.d], 5, estado='cancelado')
+
+        recomendaciones.actualizar(self.estado, completo=True)
+        # B: 3 pedidos en común, coseno 3/√(5·4); C: 2/√(5·2). D queda bajo el mínimo
+        self.assertEqual(self.relacionados(self.a), ['B', 'C'])
+        self.assertEqual(self.relacionados(self.d), [])
+
+        self.comprar([self.c, self.d], 2)
+        resultado = recomendaciones.actualizar(self.estado)
+        self.assertEqual(resultado['lineas'], 4)
+        self.assertEqual(self.relacionados(self.d), ['C'])
+        self.assertEqual(self.relacionados(self.c), ['D', 'A'])
+        self.assertEqual(self.relacionados(self.a), ['B', 'C'])
+
+        respuesta = self.client.get(reverse('detalle_producto', args=[self.d.id]))
+        self.assertEqual([producto.nombre for producto in respuesta.context['productos_relacionados']][:1], ['C'])
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es de SQLite')
+class PlanesConsultasTests(TestCase):
+    """Ninguna consulta de las vistas debe recorrer una tabla completa ni ordenar sin índice"""
+
+    def test_consultas_usan_indices(self):
+        usuario = planes.preparar_datos()
+        self.client.force_login(usuario)
+        analizadas, problemas = planes.verificar(self.client, planes.peticiones(usuario))
+        self.assertGreater(analizadas, 0)
+        self.assertEqual(
+            problemas, [], '\n'.join(f'{p.peticion}: {p.detalle}\n    {p.sql}' for p in problemas),
+        )
@@ -1,20 +1,33 @@
 from django.urls import path
 from . import views
 
-urlpatterns = [
-    # Páginas principales
-    path('', views.home, name='home'),
-    path('productos/', views.lista_productos, name='lista_productos'),
-    path('producto/<int:producto_id>/', views.detalle_producto, name='detalle_producto'),
-    
-    # Carrito
-    path('carrito/', views.carrito, name='carrito'),
-    path('agregar-al-carrito/', views.agregar_al_carrito, name='agregar_al_carrito'),
-    path('actualizar-carrito/', views.actualizar_carrito, name='actualizar_carrito'),
-    path('eliminar-del-carrito/', views.eliminar_del_carrito, name='eliminar_del_carrito'),
-    
-    # Pedidos
-    path('checkout/', views.checkout, name='checkout'),
-    path('mis-pedidos/', views.mis_pedidos, name='mis_pedidos'),
-    path('pedido/<int:pedido_id>/', views.detalle_pedido, name='detalle_pedido'),
-] 
\ No newline at end of file
+
+def patrones(vistas=views):
+    """
+    Rutas de la tienda. `vistas` da el catálogo, los endpoints JSON del
+    carrito y la exportación de pedidos: `views` o `views_async` (ver
+    ecommerce.urls_async).
+    """
+    return [
+        # Páginas principales
+        path('', vistas.home, name='home'),
+        path('productos/', vistas.lista_productos, name='lista_productos'),
+        path('producto/<int:producto_id>/', vistas.detalle_producto, name='detalle_producto'),
+
+        # Carrito
+        path('carrito/', views.carrito, name='carrito'),
+        path('carrito/resumen/', views.resumen_carrito, name='resumen_carrito'),
+        path('agregar-al-carrito/', vistas.agregar_al_carrito, name='agregar_al_carrito'),
+        path('actualizar-carrito/', vistas.actualizar_carrito, name='actualizar_carrito'),
+        path('eliminar-del-carrito/', vistas.eliminar_del_carrito, name='eliminar_del_carrito'),
+        path('carrito/operaciones/', vistas.operaciones_carrito, name='operaciones_carrito'),
+
+        # Pedidos
+        path('checkout/', views.checkout, name='checkout'),
+        path('mis-pedidos/', views.mis_pedidos, name='mis_pedidos'),
+        path('pedido/<int:pedido_id>/', views.detalle_pedido, name='detalle_pedido'),
+        path('pedidos/exportar/', vistas.exportar_pedidos, name='exportar_pedidos'),
+    ]
+
+
+urlpatterns = patrones()
@@ -0,0 +1,192 @@
+"""
+Ventas acumuladas por producto, categoría y día para los reportes.
+
+VentaProductoDia y VentaCategoriaDia guardan unidades e ingresos por día
+(en la zona horaria de la tienda), sin los pedidos cancelados, para que los
+reportes no recorran ItemPedido. Se mantienen con incrementos F():
+
+- `crear_pedido` llama a `registrar_pedido` en la misma transacción del
+  checkout;
+- Pedido.save descuenta el pedido al cancelarlo y lo vuelve a sumar si deja
+  de estar cancelado;
+- borrar un pedido no cancelado lo descuenta (señal pre_delete de
+  `tienda.signals`), igual que borrar líneas sueltas desde el admin, donde
+  las líneas son de solo lectura.
+
+Lo que no pasa por ahí (UPDATE o DELETE directos, cargas a mano) se corrige con `manage.py reconstruir_ventas`, que
+recalcula las tablas desde los pedidos. La reconstrucción usa la categoría
+actual de cada producto; los incrementos, la que tenía al venderse.
+
+El total por día se suma de VentaCategoriaDia: son pocas filas por día.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Categoria, ItemPedido, Producto, VentaCategoriaDia, VentaProductoDia
+
+LOTE = 1000
+
+# Períodos que ofrece el tablero del admin, en días
+PERIODOS = [7, 30, 90, 365]
+
+PRODUCTOS_EN_TABLERO = 10
+
+
+def registrar(fecha, lineas, signo=1):
+    """
+    Suma (o resta, con signo=-1) a las ventas del día `fecha` las líneas
+    (producto_id, categoria_id, cantidad, subtotal). Son cuatro consultas
+    sin importar cuántas líneas haya; llamar dentro de una transacción.
+    """
+    por_producto = defaultdict(lambda: [0, Decimal('0')])
+    por_categoria = defaultdict(lambda: [0, Decimal('0')])
+    for producto_id, categoria_id, cantidad, subtotal in lineas:
+        for totales, clave in ((por_producto, producto_id), (por_categoria, categoria_id)):
+            totales[clave][0] += signo * cantidad
+            totales[clave][1] += signo * subtotal
+    _incrementar(VentaProductoDia, 'producto_id', fecha, por_producto)
+    _incrementar(VentaCategoriaDia, 'categoria_id', fecha, por_categoria)
+
+
+def _incrementar(modelo, campo, fecha, totales):
+    if not totales:
+        return
+    # Las filas que falten se crean en cero; el UPDATE con F() suma sin leerlas,
+    # así dos checkouts del mismo día no se pisan
+    modelo.objects.bulk_create([modelo(fecha=fecha, **{campo: clave}) for clave in totales], ignore_conflicts=True)
+    modelo.objects.filter(fecha=fecha, **{f'{campo}__in': list(totales)}).update(
+        unidades=F('unidades') + Case(
+            *[When(**{campo: clave}, then=Value(unidades)) for clave, (unidades, _) in totales.items()],
+            output_field=IntegerField(),
+        ),
+        ingresos=F('ingresos') + Case(
+            *[When(**{campo: clave}, then=Value(ingresos)) for clave, (_, ingresos) in totales.items()],
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+
+
+def registrar_pedido(pedido, items=None, signo=1):
+    """Registra las líneas del pedido (`items`, con su producto cargado, o las guardadas) en el día del pedido"""
+    if items is None:
+        items = pedido.items.select_related('producto').only(
+            'producto__id', 'producto__categoria_id', 'cantidad', 'subtotal',
+        )
+    registrar(timezone.localdate(pedido.fecha_pedido), [
+        (item.producto_id, item.producto.categoria_id, item.cantidad, item.subtotal) for item in items
+    ], signo)
+
+
+def registrar_items(items, signo=1):
+    """
+    Registra (o descuenta) líneas sueltas de pedidos, cada una en el día de
+    su pedido; las de pedidos cancelados no cuentan. `items` debe traer el
+    pedido y el producto cargados (select_related).
+    """
+    por_dia = defaultdict(list)
+    for item in items:
+        if item.pedido.estado != 'cancelado':
+            por_dia[timezone.localdate(item.pedido.fecha_pedido)].append(
+                (item.producto_id, item.producto.categoria_id, item.cantidad, item.subtotal)
+            )
+    for fecha, lineas in por_dia.items():
+        registrar(fecha, lineas, signo)
+
+
+def reconstruir(desde=None, lote=LOTE):
+    """
+    Recalcula las ventas desde los pedidos: todas, o desde la fecha `desde`.
+    Es una sola transacción: los reportes ven las tablas viejas o las nuevas.
+    Retorna {'productos': filas, 'categorias': filas}.
+    """
+    items = ItemPedido.objects.exclude(pedido__estado='cancelado')
+    if desde is not None:
+        items = items.filter(pedido__fecha_pedido__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+    items = items.annotate(dia=TruncDate('pedido__fecha_pedido', tzinfo=timezone.get_current_timezone()))
+
+    filas = {}
+    with transaction.atomic():
+        for nombre, modelo, campo, agrupar in (
+            ('productos', VentaProductoDia, 'producto_id', 'producto'),
+            ('categorias', VentaCategoriaDia, 'categoria_id', 'producto__categoria'),
+        ):
+            anteriores = modelo.objects.all() if desde is None else modelo.objects.filter(fecha__gte=desde)
+            anteriores.delete()
+            totales = items.values('dia', agrupar).annotate(unidades=Sum('cantidad'), ingresos=Sum('subtotal'))
+            nuevas = []
+            filas[nombre] = 0
+            for fila in totales.order_by().iterator(chunk_size=lote):
+                nuevas.append(modelo(**{
+                    'fecha': fila['dia'], campo: fila[agrupar], 'unidades': fila['unidades'],
+                    'ingresos': fila['ingresos'],
+                }))
+                if len(nuevas) >= lote:
+                    filas[nombre] += len(modelo.objects.bulk_create(nuevas))
+                    nuevas = []
+            filas[nombre] += len(modelo.objects.bulk_create(nuevas))
+    return filas
+
+
+def _porcentajes(filas, campo='ingresos'):
+    """Agrega a cada fila `porcentaje`: su `campo` respecto del máximo, para el largo de las barras"""
+    maximo = max((fila[campo] for fila in filas), default=0)
+    for fila in filas:
+        fila['porcentaje'] = round(fila[campo] * 100 / maximo, 1) if maximo > 0 else 0
+    return filas
+
+
+def _con_nombres(filas, modelo, campo):
+    """
+    Las filas agrupadas por `campo`, con el nombre de cada una. Los nombres
+    se buscan después de agrupar, solo para las filas que se muestran: unir
+    cada fila acumulada con su producto antes de agrupar es lo que más cuesta
+    """
+    filas = list(filas)
+    nombres = dict(modelo.objects.filter(id__in=[fila[campo] for fila in filas]).values_list('id', 'nombre'))
+    for fila in filas:
+        fila['nombre'] = nombres.get(fila[campo], '')
+    return filas
+
+
+def tablero(dias=30):
+    """Ventas de los últimos `dias` días: totales, por día, por categoría y productos más vendidos"""
+    hasta = timezone.localdate()
+    desde = hasta - timedelta(days=dias - 1)
+    categorias = VentaCategoriaDia.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+
+    guardados = {
+        fila['fecha']: fila
+        for fila in categorias.values('fecha').annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos'))
+    }
+    cero = {'unidades': 0, 'ingresos': Decimal('0')}
+    por_dia = [
+        {'fecha': fecha, **{clave: guardados.get(fecha, cero)[clave] for clave in cero}}
+        for fecha in (desde + timedelta(days=i) for i in range(dias))
+    ]
+    por_categoria = _con_nombres(
+        categorias.values('categoria_id').annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos'))
+        .order_by('-ingresos', 'categoria_id'),
+        Categoria, 'categoria_id',
+    )
+    productos = _con_nombres(
+        VentaProductoDia.objects.filter(fecha__gte=desde, fecha__lte=hasta).values('producto_id')
+        .annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos'))
+        .order_by('-ingresos', 'producto_id')[:PRODUCTOS_EN_TABLERO],
+        Producto, 'producto_id',
+    )
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'dias': dias,
+        'unidades': sum(fila['unidades'] for fila in por_dia),
+        'ingresos': sum((fila['ingresos'] for fila in por_dia), Decimal('0')),
+        'por_dia': _porcentajes(por_dia),
+        'por_categoria': _porcentajes(por_categoria),
+        'productos': _porcentajes(productos),
+    }
@@ -1,72 +1,130 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
+from django.db import router, transaction
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.http import require_GET
 from django.core.paginator import Paginator
-from .models import Producto, Categoria, Carrito, ItemCarrito, Pedido, ItemPedido
+from django.utils import timezone
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import Producto, Carrito, ItemCarrito, ItemPedido, Pedido
+from . import catalogo, exportacion
+from .busqueda import buscar
+from .carrito_sesion import CarritoSesion
+from . import operaciones_carrito as operaciones
+from .cache import cache_pagina_anonima, categoria_de_producto
+from .condicional import get_condicional, ultima_fecha
+from .paginacion import ORDEN_PEDIDOS, ORDENES_PRODUCTOS, CursorInvalido, paginar_por_cursor, total_en_cache
+from .pedidos import CarritoVacio, StockInsuficiente, crear_pedido
 from .forms import PedidoForm
 import json
 
+def _etiquetas_catalogo(request):
+    return ['catalogo']
+
+def _etiquetas_detalle(request, producto_id):
+    # Los productos relacionados son los comprados junto con este o, si no hay, los de su categoría
+    return [f'producto:{producto_id}', f'categoria:{categoria_de_producto(producto_id)}', 'relacionados']
+
+def _modificacion_home(request):
+    return ultima_fecha(Producto.objects.filter(destacado=True, activo=True))
+
+def _modificacion_listado(request):
+    return ultima_fecha(_listado(request)[0])
+
+def _modificacion_detalle(request, producto_id):
+    # El producto, sus relacionados y los de su categoría, con que se completan los relacionados
+    return ultima_fecha(Producto.objects.filter(
+        Q(id__in=[producto_id, *catalogo.ids_relacionados(producto_id)])
+        | Q(categoria_id=categoria_de_producto(producto_id), activo=True)
+    ))
+
+@get_condicional(_etiquetas_catalogo, _modificacion_home)
+@cache_pagina_anonima(_etiquetas_catalogo)
 def home(request):
     """Vista principal con productos destacados"""
-    productos_destacados = Producto.objects.filter(destacado=True, activo=True)[:6]
-    categorias = Categoria.objects.filter(activo=True)
+    productos_destacados = catalogo.productos(catalogo.ids_destacados())
+    categorias = catalogo.categorias_activas()
     context = {
         'productos_destacados': productos_destacados,
         'categorias': categorias,
     }
     return render(request, 'tienda/home.html', context)
 
-def lista_productos(request):
-    """Lista de todos los productos con filtros"""
+def _listado(request):
+    """
+    (productos, campos_orden, parametros) del listado: el queryset sin
+    paginar, su orden y los parámetros de la página para el contexto
+    """
     productos = Producto.objects.filter(activo=True)
     categoria_id = request.GET.get('categoria')
     busqueda = request.GET.get('q')
-    orden = request.GET.get('orden', 'nombre')
+    # Con búsqueda, por defecto se ordena por relevancia
+    orden = request.GET.get('orden') or ('relevancia' if busqueda else 'nombre')
 
     if categoria_id:
         productos = productos.filter(categoria_id=categoria_id)
     
     if busqueda:
-        productos = productos.filter(
-            Q(nombre__icontains=busqueda) | 
-            Q(descripcion__icontains=busqueda) |
-            Q(categoria__nombre__icontains=busqueda)
-        )
+        productos = buscar(productos, busqueda)
 
-    if orden == 'precio_asc':
-        productos = productos.order_by('precio')
-    elif orden == 'precio_desc':
-        productos = productos.order_by('-precio')
-    elif orden == 'nuevos':
-        productos = productos.order_by('-fecha_creacion')
+    if orden == 'relevancia' and busqueda:
+        campos_orden = ('relevancia', 'id')
     else:
-        productos = productos.order_by('nombre')
+        campos_orden = ORDENES_PRODUCTOS.get(orden, ORDENES_PRODUCTOS['nombre'])
+    # Solo las columnas del orden (las cubre su índice): el resto sale de la caché
+    productos = productos.only('id', *[campo.lstrip('-') for campo in campos_orden if campo != 'relevancia'])
+    productos = productos.order_by(*campos_orden)
 
-    # Paginación
-    paginator = Paginator(productos, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación: por cursor si se pide (?paginacion=cursor), salvo al ordenar
+    # por relevancia, que no es una columna sobre la que se pueda avanzar
+    cursor = request.GET.get('cursor')
+    paginacion_cursor = bool(cursor or request.GET.get('paginacion') == 'cursor') and campos_orden[0] != 'relevancia'
+    parametros = {
+        'categoria_actual': categoria_id,
+        'busqueda': busqueda,
+        'orden': orden,
+        'paginacion_cursor': paginacion_cursor,
+    }
+    return productos, campos_orden, parametros
 
-    categorias = Categoria.objects.filter(activo=True)
+@get_condicional(_etiquetas_catalogo, _modificacion_listado)
+@cache_pagina_anonima(_etiquetas_catalogo)
+def lista_productos(request):
+    """Lista de todos los productos con filtros"""
+    productos, campos_orden, parametros = _listado(request)
+    if parametros['paginacion_cursor']:
+        try:
+            page_obj = paginar_por_cursor(productos, campos_orden, request.GET.get('cursor'), 12)
+        except CursorInvalido:
+            page_obj = paginar_por_cursor(productos, campos_orden, None, 12)
+        page_obj.total = total_en_cache(productos)
+    else:
+        paginator = Paginator(productos, 12)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+    page_obj.object_list = catalogo.productos([producto.id for producto in page_obj.object_list])
+
+    categorias = catalogo.categorias_activas()
     
     context = {
         'page_obj': page_obj,
         'categorias': categorias,
-        'categoria_actual': categoria_id,
-        'busqueda': busqueda,
-        'orden': orden,
+        **parametros,
     }
     return render(request, 'tienda/lista_productos.html', context)
 
+@get_condicional(_etiquetas_detalle, _modificacion_detalle)
+@cache_pagina_anonima(_etiquetas_detalle)
 def detalle_producto(request, producto_id):
     """Vista detallada de un producto"""
-    producto = get_object_or_404(Producto, id=producto_id, activo=True)
-    productos_relacionados = Producto.objects.filter(
-        categoria=producto.categoria, 
-        activo=True
-    ).exclude(id=producto.id)[:4]
+    producto = catalogo.producto(producto_id)
+    if producto is None or not producto.activo:
+        raise Http404('Producto no encontrado')
+    productos_relacionados = catalogo.relacionados(producto)
     
     context = {
         'producto': producto,
@@ -74,28 +132,91 @@ def detalle_producto(request, producto_id):
     }
     return render(request, 'tienda/detalle_producto.html', context)
 
-def obtener_carrito(request):
-    """Obtiene o crea el carrito del usuario"""
+def obtener_carrito(request, crear=True):
+    """
+    Obtiene el carrito del usuario. Con crear=False retorna None si todavía
+    no tiene uno, para no guardar carritos vacíos; se crea recién al agregar
+    el primer producto. Los anónimos usan un CarritoSesion, que no escribe
+    en la base de datos y se fusiona con el del usuario al iniciar sesión.
+    """
+    if not request.user.is_authenticated:
+        return CarritoSesion(request.session)
+    if crear:
+        return Carrito.objects.get_or_create(usuario=request.user)[0]
+    return Carrito.objects.filter(usuario=request.user).first()
+
+def obtener_item(request, item_id):
+    """
+    (carrito, item) del carrito del usuario o del de la sesión (item por id de
+    producto). Para los usuarios el carrito es None: se lee de item.carrito
+    después de modificar el item, con los totales ya actualizados.
+    """
     if request.user.is_authenticated:
-        carrito, created = Carrito.objects.get_or_create(usuario=request.user)
-    else:
-        # Para usuarios anónimos, usar sesión
-        carrito_id = request.session.get('carrito_id')
-        if carrito_id:
-            carrito = Carrito.objects.filter(id=carrito_id).first()
-        else:
-            carrito = Carrito.objects.create()
-            request.session['carrito_id'] = carrito.id
-    return carrito
+        item = get_object_or_404(
+            ItemCarrito.objects.select_related('producto'), id=item_id, carrito__usuario=request.user,
+        )
+        return None, item
+    carrito = CarritoSesion(request.session)
+    item = carrito.item(int(item_id))
+    if item is None:
+        raise Http404('El producto no está en el carrito')
+    return carrito, item
+
+def sumar_al_carrito(carrito, producto, cantidad):
+    """
+    Agrega `cantidad` del producto al carrito guardado. El item se lee
+    bloqueado: dos agregados simultáneos del mismo producto suman los dos
+    """
+    with transaction.atomic():
+        item, created = ItemCarrito.objects.select_for_update().get_or_create(
+            carrito=carrito,
+            producto=producto,
+            defaults={'cantidad': cantidad}
+        )
+        if not created:
+            item.producto = producto
+            item.cantidad += cantidad
+            item.save()
+    return item
 
 def carrito(request):
     """Vista del carrito de compras"""
-    carrito = obtener_carrito(request)
+    # Sin carrito guardado se muestra uno vacío, sin crearlo
+    carrito = obtener_carrito(request, crear=False) or Carrito()
+    if isinstance(carrito, CarritoSesion):
+        items = carrito.items
+    elif carrito.pk:
+        items = carrito.items.select_related('producto__categoria')
+    else:
+        items = ItemCarrito.objects.none()
     context = {
         'carrito': carrito,
+        'items': items,
     }
     return render(request, 'tienda/carrito.html', context)
 
+@require_GET
+def resumen_carrito(request):
+    """
+    Cantidad de items y total del carrito en JSON, para el contador del navbar.
+    También entrega el token CSRF (y fija su cookie) para agregar al carrito
+    desde las páginas del catálogo, que salen de la caché y no lo traen
+    """
+    if request.user.is_authenticated:
+        # Solo el id: los totales salen de Carrito.resumen, que usa la caché
+        carrito_id = Carrito.objects.filter(usuario=request.user).values_list('id', flat=True).first()
+        resumen = Carrito.resumen(carrito_id) if carrito_id else {'cantidad': 0, 'total': 0}
+    else:
+        carrito = CarritoSesion(request.session)
+        resumen = {'cantidad': carrito.cantidad_items, 'total': carrito.total}
+
+    return JsonResponse({
+        'success': True,
+        'carrito_cantidad': resumen['cantidad'],
+        'carrito_total': resumen['total'],
+        'csrf_token': get_token(request),
+    })
+
 def agregar_al_carrito(request):
     """Agregar producto al carrito via AJAX"""
     if request.method == 'POST':
@@ -103,8 +224,7 @@ def agregar_al_carrito(request):
         producto_id = data.get('producto_id')
         cantidad = data.get('cantidad', 1)
         
-        producto = get_object_or_404(Producto, id=producto_id, activo=True)
-        carrito = obtener_carrito(request)
+        producto = get_object_or_404(Producto.objects.select_related('categoria'), id=producto_id, activo=True)
         
         # Verificar stock
         if producto.stock < cantidad:
@@ -113,17 +233,14 @@ def agregar_al_carrito(request):
                 'message': f'Solo hay {producto.stock} unidades disponibles'
             })
         
-        # Agregar o actualizar item en carrito
-        item, created = ItemCarrito.objects.get_or_create(
-            carrito=carrito,
-            producto=producto,
-            defaults={'cantidad': cantidad}
-        )
-        
-        if not created:
-            item.cantidad += cantidad
-            item.save()
-        
+        carrito = obtener_carrito(request)
+
+        if isinstance(carrito, CarritoSesion):
+            carrito.agregar(producto, cantidad)
+        else:
+            sumar_al_carrito(carrito, producto, cantidad)
+            carrito.refresh_from_db(fields=['monto_total', 'total_items'])
+
         return JsonResponse({
             'success': True,
             'message': f'{producto.nombre} agregado al carrito',
@@ -140,20 +257,24 @@ def actualizar_carrito(request):
         item_id = data.get('item_id')
         cantidad = data.get('cantidad')
         
-        item = get_object_or_404(ItemCarrito, id=item_id)
+        carrito, item = obtener_item(request, item_id)
         
-        if cantidad <= 0:
-            item.delete()
+        if cantidad > 0 and item.producto.stock < cantidad:
+            return JsonResponse({
+                'success': False,
+                'message': f'Solo hay {item.producto.stock} unidades disponibles'
+            })
+
+        if isinstance(carrito, CarritoSesion):
+            carrito.actualizar(item, cantidad)
         else:
-            if item.producto.stock < cantidad:
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Solo hay {item.producto.stock} unidades disponibles'
-                })
-            item.cantidad = cantidad
-            item.save()
-        
-        carrito = item.carrito
+            if cantidad <= 0:
+                item.delete()
+            else:
+                item.cantidad = cantidad
+                item.save()
+            carrito = item.carrito
+
         return JsonResponse({
             'success': True,
             'carrito_total': carrito.total,
@@ -169,9 +290,12 @@ def eliminar_del_carrito(request):
         data = json.loads(request.body)
         item_id = data.get('item_id')
         
-        item = get_object_or_404(ItemCarrito, id=item_id)
-        carrito = item.carrito
-        item.delete()
+        carrito, item = obtener_item(request, item_id)
+        if isinstance(carrito, CarritoSesion):
+            carrito.actualizar(item, 0)
+        else:
+            item.delete()
+            carrito = item.carrito
         
         return JsonResponse({
             'success': True,
@@ -181,12 +305,39 @@ def eliminar_del_carrito(request):
     
     return JsonResponse({'success': False, 'message': 'Método no permitido'})
 
+def aplicar_operaciones(carrito, data, usuario):
+    """
+    JsonResponse de operaciones_carrito: el estado del carrito o, si el lote
+    no se puede aplicar, el motivo (y no se cambia nada)
+    """
+    try:
+        estado = operaciones.aplicar(carrito, operaciones.leer(data.get('operaciones')), usuario)
+    except operaciones.OperacionInvalida as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=400)
+    except operaciones.CarritoModificado as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=409)
+    except StockInsuficiente as error:
+        return JsonResponse({
+            'success': False,
+            'message': str(error),
+            'disponibles': {producto.id: producto.stock for producto in error.productos},
+        })
+    return JsonResponse({'success': True, **estado})
+
+def operaciones_carrito(request):
+    """Agregar, actualizar y eliminar varios items en una sola petición AJAX (ver tienda.operaciones_carrito)"""
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        return aplicar_operaciones(obtener_carrito(request, crear=False), data, request.user)
+
+    return JsonResponse({'success': False, 'message': 'Método no permitido'})
+
 @login_required
 def checkout(request):
     """Proceso de checkout"""
-    carrito = obtener_carrito(request)
+    carrito = obtener_carrito(request, crear=False)
     
-    if carrito.cantidad_items == 0:
+    if carrito is None or carrito.cantidad_items == 0:
         messages.warning(request, 'Tu carrito está vacío')
         return redirect('carrito')
     
@@ -195,29 +346,16 @@ def checkout(request):
         if form.is_valid():
             pedido = form.save(commit=False)
             pedido.usuario = request.user
-            pedido.total = carrito.total
             pedido.pagado = True
-            pedido.save()
-            
-            # Crear items del pedido
-            for item in carrito.items.all():
-                ItemPedido.objects.create(
-                    pedido=pedido,
-                    producto=item.producto,
-                    cantidad=item.cantidad,
-                    precio_unitario=item.producto.precio,
-                    subtotal=item.subtotal
-                )
-                
-                # Actualizar stock
-                item.producto.stock -= item.cantidad
-                item.producto.save()
-            
-            # Limpiar carrito
-            carrito.items.all().delete()
-            if 'carrito_id' in request.session:
-                del request.session['carrito_id']
-            
+            try:
+                crear_pedido(carrito, pedido)
+            except CarritoVacio:
+                messages.warning(request, 'Tu carrito está vacío')
+                return redirect('carrito')
+            except StockInsuficiente as error:
+                messages.error(request, str(error))
+                return redirect('carrito')
+
             messages.success(request, f'Pedido #{pedido.id} creado exitosamente')
             return redirect('detalle_pedido', pedido_id=pedido.id)
     else:
@@ -226,15 +364,29 @@ def checkout(request):
     context = {
         'form': form,
         'carrito': carrito,
+        'items': carrito.items.select_related('producto'),
     }
     return render(request, 'tienda/checkout.html', context)
 
 @login_required
 def mis_pedidos(request):
-    """Lista de pedidos del usuario"""
-    pedidos = Pedido.objects.filter(usuario=request.user)
+    """Historial de pedidos del usuario, paginado por cursor"""
+    # Subconsultas por pedido en vez de JOIN + GROUP BY, para que el orden lo
+    # resuelva el índice (usuario, fecha_pedido, id) sin ordenar en memoria
+    items = ItemPedido.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido')
+    pedidos = Pedido.objects.filter(usuario=request.user).annotate(
+        cantidad_productos=Coalesce(Subquery(items.annotate(n=Count('id')).values('n'), output_field=IntegerField()), 0),
+        unidades=Coalesce(Subquery(items.annotate(n=Sum('cantidad')).values('n'), output_field=IntegerField()), 0),
+    )
+    try:
+        page_obj = paginar_por_cursor(pedidos, ORDEN_PEDIDOS, request.GET.get('cursor'), 10)
+    except CursorInvalido:
+        page_obj = paginar_por_cursor(pedidos, ORDEN_PEDIDOS, None, 10)
+
     context = {
-        'pedidos': pedidos,
+        'pedidos': page_obj,
+        'page_obj': page_obj,
+        'resumen': Pedido.resumen_de_usuario(request.user.id),
     }
     return render(request, 'tienda/mis_pedidos.html', context)
 
@@ -244,5 +396,31 @@ def detalle_pedido(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
     context = {
         'pedido': pedido,
+        'items': pedido.items.select_related('producto__categoria'),
     }
     return render(request, 'tienda/detalle_pedido.html', context)
+
+def _parametros_exportacion(request):
+    """(formato, desde, hasta, estados) de la query string; ValueError si algo no es válido"""
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        raise ValueError(f'Formato desconocido: {formato}')
+    return (formato, *exportacion.filtros(
+        request.GET.get('desde'), request.GET.get('hasta'), request.GET.getlist('estado'),
+    ))
+
+def _respuesta_exportacion(contenido, formato):
+    respuesta = StreamingHttpResponse(contenido, content_type=f'{exportacion.FORMATOS[formato]}; charset=utf-8')
+    respuesta['Content-Disposition'] = f'attachment; filename="pedidos-{timezone.localdate():%Y%m%d}.{formato}"'
+    return respuesta
+
+@staff_member_required
+def exportar_pedidos(request):
+    """Pedidos con sus líneas en CSV o JSONL, generados a medida que se envían (ver tienda.exportacion)"""
+    try:
+        formato, desde, hasta, estados = _parametros_exportacion(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    # La base se elige ahora: el contenido se genera después de que termina la petición
+    pedidos = exportacion.pedidos(desde, hasta, estados, using=router.db_for_read(Pedido))
+    return _respuesta_exportacion(exportacion.exportar(pedidos, formato), formato)
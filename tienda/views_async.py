@@ -0,0 +1,271 @@
+"""
+Vistas async del catálogo y del carrito JSON.
+
+Hacen lo mismo que sus pares de `tienda.views` (mismas plantillas, mismas
+respuestas), pero con el ORM async de Django, y lanzan a la vez con
+asyncio.gather las lecturas que no dependen entre sí. Las usa
+`ecommerce.urls_async`, que se activa con TIENDA_VISTAS_ASYNC=1 (lo fija
+`ecommerce/asgi.py`); con WSGI se siguen usando las síncronas.
+
+La exportación de pedidos también tiene su versión aquí: con ASGI, Django
+4.2 junta en memoria todo lo que genera un iterador síncrono antes de
+enviarlo, y la exportación debe salir de a bloques.
+
+En Django 4.2 la sesión y `request.user` solo se pueden cargar de forma
+síncrona, así que se cargan con sync_to_async antes de usarlos, y el ORM
+async todavía ejecuta cada consulta en un hilo: `manage.py benchmark_async`
+mide lo que cuesta frente a WSGI.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
+from django.contrib.auth.views import redirect_to_login
+from django.db import router
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import render
+from django.urls import reverse
+
+from . import catalogo, exportacion
+from .cache import acategoria_de_producto, cache_pagina_anonima
+from .carrito_sesion import CarritoSesion
+from .models import Carrito, ItemCarrito, Pedido, Producto
+from .paginacion import CursorInvalido, apaginar_por_cursor, atotal_en_cache
+from .condicional import get_condicional
+from .views import (
+    _etiquetas_catalogo, _etiquetas_detalle as _etiquetas_detalle_sincronas, _listado, _modificacion_detalle,
+    _modificacion_home, _modificacion_listado, _parametros_exportacion, _respuesta_exportacion, aplicar_operaciones,
+    sumar_al_carrito,
+)
+
+
+async def _etiquetas_detalle(request, producto_id):
+    return [f'producto:{producto_id}', f'categoria:{await acategoria_de_producto(producto_id)}', 'relacionados']
+
+
+async def _usuario(request):
+    """request.user ya cargado (al cargarlo también se lee la sesión)"""
+    # AuthenticationMiddleware lo guarda en _cached_user: si ya se cargó, no hace falta otro hilo
+    if not hasattr(request, '_cached_user'):
+        await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def _obtener_o_404(queryset, **filtros):
+    try:
+        return await queryset.aget(**filtros)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No existe {queryset.model._meta.object_name} que cumpla la consulta')
+
+
+async def _render(request, plantilla, context):
+    # La plantilla base muestra request.user: debe estar cargado antes de renderizar
+    await _usuario(request)
+    return render(request, plantilla, context)
+
+
+@get_condicional(_etiquetas_catalogo, _modificacion_home)
+@cache_pagina_anonima(_etiquetas_catalogo)
+async def home(request):
+    """Vista principal con productos destacados"""
+    ids, categorias = await asyncio.gather(catalogo.aids_destacados(), catalogo.acategorias_activas())
+    context = {
+        'productos_destacados': await catalogo.aproductos(ids),
+        'categorias': categorias,
+    }
+    return await _render(request, 'tienda/home.html', context)
+
+
+@get_condicional(_etiquetas_catalogo, _modificacion_listado)
+@cache_pagina_anonima(_etiquetas_catalogo)
+async def lista_productos(request):
+    """Lista de todos los productos con filtros"""
+    productos, campos_orden, parametros = _listado(request)
+    if parametros['paginacion_cursor']:
+        try:
+            page_obj = await apaginar_por_cursor(productos, campos_orden, request.GET.get('cursor'), 12)
+        except CursorInvalido:
+            page_obj = await apaginar_por_cursor(productos, campos_orden, None, 12)
+        page_obj.total, categorias = await asyncio.gather(
+            atotal_en_cache(productos), catalogo.acategorias_activas(),
+        )
+    else:
+        paginator = Paginator(productos, 12)
+        # Paginator cuenta con una consulta síncrona: se le da el total ya contado
+        paginator.count, categorias = await asyncio.gather(productos.acount(), catalogo.acategorias_activas())
+        page_obj = paginator.get_page(request.GET.get('page'))
+        page_obj.object_list = [producto async for producto in page_obj.object_list]
+    page_obj.object_list = await catalogo.aproductos([producto.id for producto in page_obj.object_list])
+
+    context = {
+        'page_obj': page_obj,
+        'categorias': categorias,
+        **parametros,
+    }
+    return await _render(request, 'tienda/lista_productos.html', context)
+
+
+@get_condicional(_etiquetas_detalle_sincronas, _modificacion_detalle)
+@cache_pagina_anonima(_etiquetas_detalle)
+async def detalle_producto(request, producto_id):
+    """Vista detallada de un producto"""
+    producto = await catalogo.aproducto(producto_id)
+    if producto is None or not producto.activo:
+        raise Http404('Producto no encontrado')
+
+    context = {
+        'producto': producto,
+        'productos_relacionados': await catalogo.arelacionados(producto),
+    }
+    return await _render(request, 'tienda/detalle_producto.html', context)
+
+
+async def _carrito(request):
+    """
+    El carrito del usuario (None si todavía no tiene) o el de la sesión,
+    como views.obtener_carrito(request, crear=False)
+    """
+    usuario = await _usuario(request)
+    if not usuario.is_authenticated:
+        return CarritoSesion(request.session)
+    return await Carrito.objects.filter(usuario=usuario).afirst()
+
+
+async def _item(request, item_id):
+    """views.obtener_item con el ORM async"""
+    usuario = await _usuario(request)
+    if usuario.is_authenticated:
+        item = await _obtener_o_404(
+            ItemCarrito.objects.select_related('producto'), id=item_id, carrito__usuario=usuario,
+        )
+        return None, item
+    carrito = CarritoSesion(request.session)
+    await carrito.acargar()
+    item = carrito.item(int(item_id))
+    if item is None:
+        raise Http404('El producto no está en el carrito')
+    return carrito, item
+
+
+async def agregar_al_carrito(request):
+    """Agregar producto al carrito via AJAX"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'})
+
+    data = json.loads(request.body)
+    producto_id = data.get('producto_id')
+    cantidad = data.get('cantidad', 1)
+
+    # El producto y el carrito no dependen uno del otro
+    producto, carrito = await asyncio.gather(
+        _obtener_o_404(Producto.objects.select_related('categoria'), id=producto_id, activo=True),
+        _carrito(request),
+    )
+
+    if producto.stock < cantidad:
+        return JsonResponse({
+            'success': False,
+            'message': f'Solo hay {producto.stock} unidades disponibles'
+        })
+
+    if isinstance(carrito, CarritoSesion):
+        carrito.agregar(producto, cantidad)
+    else:
+        if carrito is None:
+            carrito = (await Carrito.objects.aget_or_create(usuario=request.user))[0]
+        # Con bloqueo y en una transacción: no hay equivalente async de atomic()
+        await sync_to_async(sumar_al_carrito)(carrito, producto, cantidad)
+        await carrito.arefresh_from_db(fields=['monto_total', 'total_items'])
+
+    return JsonResponse({
+        'success': True,
+        'message': f'{producto.nombre} agregado al carrito',
+        'carrito_total': carrito.total,
+        'carrito_cantidad': carrito.cantidad_items
+    })
+
+
+async def actualizar_carrito(request):
+    """Actualizar cantidad en carrito via AJAX"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'})
+
+    data = json.loads(request.body)
+    cantidad = data.get('cantidad')
+    carrito, item = await _item(request, data.get('item_id'))
+
+    if cantidad > 0 and item.producto.stock < cantidad:
+        return JsonResponse({
+            'success': False,
+            'message': f'Solo hay {item.producto.stock} unidades disponibles'
+        })
+
+    if isinstance(carrito, CarritoSesion):
+        carrito.actualizar(item, cantidad)
+    else:
+        if cantidad <= 0:
+            await item.adelete()
+        else:
+            item.cantidad = cantidad
+            await item.asave()
+        carrito = await Carrito.objects.aget(pk=item.carrito_id)
+
+    return JsonResponse({
+        'success': True,
+        'carrito_total': carrito.total,
+        'carrito_cantidad': carrito.cantidad_items,
+        'item_subtotal': item.subtotal if cantidad > 0 else 0
+    })
+
+
+async def eliminar_del_carrito(request):
+    """Eliminar item del carrito via AJAX"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'})
+
+    data = json.loads(request.body)
+    carrito, item = await _item(request, data.get('item_id'))
+    if isinstance(carrito, CarritoSesion):
+        carrito.actualizar(item, 0)
+    else:
+        await item.adelete()
+        carrito = await Carrito.objects.aget(pk=item.carrito_id)
+
+    return JsonResponse({
+        'success': True,
+        'carrito_total': carrito.total,
+        'carrito_cantidad': carrito.cantidad_items
+    })
+
+
+async def operaciones_carrito(request):
+    """Agregar, actualizar y eliminar varios items en una sola petición AJAX"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'})
+
+    data = json.loads(request.body)
+    carrito = await _carrito(request)
+    # El ORM async de Django 4.2 no tiene transacciones: el lote se aplica en un hilo
+    return await sync_to_async(aplicar_operaciones)(carrito, data, request.user)
+
+
+async def _en_bloques(bloques):
+    """Los bloques de un generador síncrono que usa la base de datos, uno por hilo"""
+    siguiente = sync_to_async(lambda: next(bloques, None))
+    while (bloque := await siguiente()) is not None:
+        yield bloque
+
+
+async def exportar_pedidos(request):
+    """Pedidos con sus líneas en CSV o JSONL, generados a medida que se envían (ver tienda.exportacion)"""
+    usuario = await _usuario(request)
+    # staff_member_required de Django 4.2 no acepta vistas async
+    if not (usuario.is_active and usuario.is_staff):
+        return redirect_to_login(request.get_full_path(), reverse('admin:login'))
+    try:
+        formato, desde, hasta, estados = _parametros_exportacion(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    pedidos = exportacion.pedidos(desde, hasta, estados, using=router.db_for_read(Pedido))
+    return _respuesta_exportacion(_en_bloques(exportacion.exportar(pedidos, formato)), formato)